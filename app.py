@@ -1,21 +1,35 @@
 import pandas as pd
 import streamlit_shadcn_ui as ui
 import streamlit as st
-from streamlit_pdf_viewer import pdf_viewer
 
 import numpy as np
+import os
 
 from main import (
-    load_and_preprocess_dashboard,
+    dashboard_job,
+    open_dashboard,
     filter_due_patients,
     plot_columns,
     plot_histograms,
     download_sms_csv,
+    download_recall_waves,
+    paged_dataframe,
+    DUE_MONTHS,
+    DUE_WINDOW_OPTIONS,
     load_notion_df,
     load_google_sheet_df,
     date_cols,
 )
-from predict import predict
+from lazydata import LazyDataGraph
+import jobrunner
+from patientindex import clean_nhs_numbers
+from pagedtable import default_columns
+from patientrank import DEFAULT_TOP_K, PAGE_SIZE, RankedRows, prediction_priority, top_k
+from timing import span, start_run, get_spans
+from cacheregistry import registry, stats_dataframe, tracked_cache
+from assets import asset_url
+from workerpool import warm_up
+from smsexport import cohort_fingerprint
 
 # Initialize session states if they haven't been set already
 if "notion_token" not in st.session_state:
@@ -55,20 +69,32 @@ def disconnect_google_sheet():
 # Set page configuration
 st.set_page_config(layout="wide", page_title="A1Sense - Diabetes Dashboard")
 
+# Start collecting stage timings for this rerun
+start_run()
+
+# Apply cache invalidations queued from the command line
+registry.apply_invalidation_requests()
+
+# Start the worker process for dashboard preprocessing in the background (first run only)
+warm_up()
+
+# Number of threads the datasets a tab needs are loaded with
+LOADER_THREADS = 4
+
 # Display images
-st.image("images/a1sense.png")
+st.image(asset_url("images/a1sense.png"))
 
 
 if st.session_state['notion_connected'] == 'connected' and st.session_state['sheet_url'] == "":
-    st.sidebar.image("images/notion_connected.png")
+    st.sidebar.image(asset_url("images/notion_connected.png"))
 elif st.session_state['notion_connected'] == 'offline' and st.session_state['sheet_url'] == "":
-    st.sidebar.image("images/notion_offline.png")
+    st.sidebar.image(asset_url("images/notion_offline.png"))
 elif st.session_state['sheet_url'] != '' and st.session_state['notion_connected'] == "offline":
-    st.sidebar.image("images/google_online.png")
+    st.sidebar.image(asset_url("images/google_online.png"))
 elif st.session_state['sheet_url'] == '' and st.session_state['notion_connected'] == "offline":
-    st.sidebar.image("images/google_offline.png")
+    st.sidebar.image(asset_url("images/google_offline.png"))
 else:
-    st.sidebar.image("notion_offline.png")
+    st.sidebar.image(asset_url("images/notion_offline.png"))
 
 
 
@@ -127,45 +153,95 @@ elif option == "Google Sheets":
 
 
 
-# Load dataframes if files are uploaded
-if sms_file is not None:
-    sms_df = pd.read_csv(sms_file)
-
-if dashboard_file is not None:
-    df = load_and_preprocess_dashboard(dashboard_file, date_cols)
-    nhs_df = df[["nhs_number", "hba1c_value"]]
-    prediction = predict(df, nhs_df)
-
-if st.session_state["notion_connected"] == 'connected':
-    actioned_df = load_notion_df(st.session_state["notion_token"], st.session_state["notion_database"])
-elif st.session_state["notion_connected"] == 'offline' and st.session_state["sheet_url"] != "":
-    actioned_df = load_google_sheet_df(st.session_state["sheet_url"], 0)
-else:
-    actioned_df = pd.DataFrame({
+# Background jobs (preprocessing, prediction) still running in this script run, by dataset
+pending_jobs = {}
+
+# Register the datasets lazily - each one is only computed when a tab asks for it
+def load_sms_df():
+    if sms_file is not None:
+        with span("sms_csv_read"):
+            sms_df = pd.read_csv(sms_file)
+        if "nhs_number" in sms_df.columns:
+            sms_df = clean_nhs_numbers(sms_df, source="the SMS register")
+        return sms_df
+    return None
+
+def load_dashboard_df():
+    if dashboard_file is not None:
+        with span("load_dashboard"):
+            path, job = dashboard_job(dashboard_file, date_cols)
+            if job is not None and not job.done():
+                pending_jobs["dashboard"] = job
+                # Keep working with the previous upload while the new one is processed
+                path = st.session_state.get("dashboard_register")
+                if path is None or not os.path.exists(path):
+                    return None
+                return open_dashboard(path)
+            if job is not None:
+                job.result()  # Raises the job's error, if it failed
+            st.session_state["dashboard_register"] = path
+            # The dashboard job has also kept a snapshot of the upload for the Trends tab
+            return open_dashboard(path)
+    return None
+
+def load_prediction(df):
+    # Imported here so the model dependencies only load when predictions are needed
+    from predict import PREDICTION_JOB_STAGES, predict_register
+
+    # Runs as a background job on the published register; only patients whose model inputs
+    # changed since the last upload are re-scored
+    register_path = df.attrs["register_path"]
+    job = jobrunner.submit(
+        f"prediction-{os.path.basename(register_path)}", predict_register, register_path,
+        label="Predicting HbA1c", stages=PREDICTION_JOB_STAGES,
+    )
+    if not job.done():
+        pending_jobs["prediction"] = job
+        return None
+    with span("prediction"):
+        return job.result().copy(deep=False)
+
+def load_actioned_df():
+    if st.session_state["notion_connected"] == 'connected':
+        with span("load_actioned", source="notion"):
+            return load_notion_df(st.session_state["notion_token"], st.session_state["notion_database"])
+    elif st.session_state["notion_connected"] == 'offline' and st.session_state["sheet_url"] != "":
+        with span("load_actioned", source="google_sheets"):
+            return load_google_sheet_df(st.session_state["sheet_url"], 0)
+    return pd.DataFrame({
                             "NHS number": [np.nan],
                             "Name": ["Empty"]
                             })
 
-tab_selector = ui.tabs(
-    options=[
-        "Quick Start",
-        "Online Pre-assessment",
-        "HCA Self-book",
-        "Rewind",
-        "Filter Dataframe",
-        "Predicted Hba1c",
-        "Guidelines",
-        "Integrations",
-    ],
-    default_value="Quick Start",
-    key="tab3",
-)
-
-if tab_selector == "Online Pre-assessment":
-
-    if "sms_df" not in globals() or "df" not in globals():
-        st.warning("Please upload both CSV files to proceed.")
+data_graph = LazyDataGraph()
+data_graph.register("sms", load_sms_df)
+data_graph.register("dashboard", load_dashboard_df)
+data_graph.register("prediction", load_prediction, depends_on=["dashboard"])
+data_graph.register("actioned", load_actioned_df)
+
+# Datasets each tab needs - tabs not listed here do no data work
+tab_datasets = {
+    "Online Pre-assessment": ["dashboard", "sms", "actioned"],
+    "HCA Self-book": ["dashboard", "sms", "actioned"],
+    "Rewind": ["dashboard", "sms", "actioned"],
+    "Filter Dataframe": ["dashboard", "sms", "actioned"],
+    "Cohort Query": ["dashboard", "sms", "actioned"],
+    "Predicted Hba1c": ["dashboard", "prediction"],
+    "Trends": [],
+    "Integrations": ["actioned"],
+}
+
+def due_window_control(key):
+    # Due status is worked out from the days since each test, so changing the window needs no reload
+    return st.select_slider(
+        "Due when last done more than (**months**) ago:",
+        options=DUE_WINDOW_OPTIONS, value=DUE_MONTHS, key=key,
+    )
 
+# Interactive cohort panels - each is a fragment that owns its widgets, plot, table and
+# download button, so changing a slider or multiselect only reruns that panel
+@st.fragment
+def online_preassessment_panel(df, sms_df, actioned_df):
     c1, c2 = st.columns([2,1], gap="large")
     with c1:
         selected_tests = st.multiselect(
@@ -180,42 +256,64 @@ if tab_selector == "Online Pre-assessment":
             options=['AND','OR',],
             default=["AND"], max_selections=1,
         )
+        due_months = due_window_control("due_months_preassessment")
     # Call the filter_due_patients function with the DataFrame and selected tests
-    try:
-        due_patients = filter_due_patients(df, selected_tests)
-
-    except NameError as e:
-        st.warning(f"Upload csv data to use this tool. Error: {e}")
-
-    try:
-        if not due_patients.empty:
-            ui.badges(badge_list=[("Patient Count: ", "outline"), (due_patients.shape[0], "default")], class_name="flex gap-2", key="badges1")
-            plot_histograms(due_patients, plot_columns)
-            import streamlit_shadcn_ui as ui
-
-            ui.badges(badge_list=[("Patient Count: ", "outline"), (due_patients.shape[0], "default")], class_name="flex gap-2", key="badges2")
-
-            st.dataframe(due_patients, height=300)
-            download_sms_csv(due_patients, sms_df, actioned_df, filename="online_preassessment_sms.csv")
-
-        else:
-            st.warning(
-                "Please upload the necessary CSV file to display the dataframe. Select at least one criterion to filter by."
-            )
-    except NameError as e:
-        st.warning(f"Upload csv data to use this tool. Error: {e}")
-
+    if df is None or sms_df is None:
+        st.warning("Upload csv data to use this tool.")
+        return
 
+    due_patients = filter_due_patients(df, selected_tests, due_months)
 
+    if not due_patients.empty:
+        ui.badges(badge_list=[("Patient Count: ", "outline"), (due_patients.shape[0], "default")], class_name="flex gap-2", key="badges1")
+        plot_histograms(due_patients, plot_columns)
 
+        ui.badges(badge_list=[("Patient Count: ", "outline"), (due_patients.shape[0], "default")], class_name="flex gap-2", key="badges2")
 
+        paged_dataframe(due_patients, "preassessment_table", columns=default_columns(due_patients, selected_tests), height=300)
+        download_sms_csv(due_patients, sms_df, actioned_df, filename="online_preassessment_sms.csv")
+        download_recall_waves(
+            due_patients, sms_df, actioned_df, selected_tests, "online_preassessment_sms.csv",
+            load_predictions=lambda: data_graph.get("prediction"), due_months=due_months,
+        )
 
+    else:
+        st.warning(
+            "Please upload the necessary CSV file to display the dataframe. Select at least one criterion to filter by."
+        )
 
-elif tab_selector == "HCA Self-book":
+@tracked_cache("resource", max_entries=4)
+def prediction_scores(fingerprint, _prediction, _dashboard):
+    # Scored once per prediction table, not on every rerun of the panel
+    return prediction_priority(_prediction, _dashboard)
 
-    if "sms_df" not in globals() or "df" not in globals():
-        st.warning("Please upload both CSV files to proceed.")
+@st.fragment
+def prediction_panel(prediction, dashboard):
+    # Imported here so the model dependencies only load when predictions are needed
+    from predict import highlight_subtraction_result
 
+    scores = prediction_scores(cohort_fingerprint(prediction), prediction, dashboard)
+    k = st.number_input(
+        "Patients to **prioritise** (largest predicted rise, highest HbA1c, most overdue first):",
+        min_value=10, max_value=max(10, len(prediction)), value=min(DEFAULT_TOP_K, max(10, len(prediction))), step=10,
+    )
+    with span("prediction_top_k", rows=len(prediction), k=k):
+        shown = prediction.iloc[top_k(scores, k)]
+    st.dataframe(highlight_subtraction_result(shown), height=400)
+
+    if len(prediction) > k:
+        rest = RankedRows(scores, PAGE_SIZE, skip=k)
+        with st.expander(f"Remaining **{len(prediction) - k}** patients, in priority order"):
+            page = st.number_input("Page", min_value=1, max_value=rest.n_pages(), value=1)
+            # Only the rows on the page are sorted and styled
+            st.dataframe(highlight_subtraction_result(prediction.iloc[rest.page(page - 1)]))
+            st.caption(f"Page {page} of {rest.n_pages()}")
+
+# Dashboard date column of each HCA test
+HCA_TESTS = {"HbA1c": "hba1c", "Lipids": "cholesterol", "eGFR": "egfr", "Urine ACR": "urine_acr", "Foot Check": "foot_risk"}
+
+@st.fragment
+def hca_selfbook_panel(df, sms_df, actioned_df):
     c1, c2 = st.columns(2)
     with c1:
         selected_tests = st.multiselect(
@@ -224,103 +322,294 @@ elif tab_selector == "HCA Self-book":
             default=["HbA1c"],
         )
     with c2:
-        st.write()
+        due_months = due_window_control("due_months_hca")
     # Call the filter_due_patients function with the DataFrame and selected tests
-    try:
-        due_patients = filter_due_patients(df, selected_tests)
-    except NameError as e:
-        st.warning(f"Upload csv data to use this tool. Error: {e}")
+    if df is None or sms_df is None:
+        st.warning("Upload csv data to use this tool.")
+        return
 
-    try:
-        if not due_patients.empty:
-            ui.badges(badge_list=[("Patient Count: ", "outline"), (due_patients.shape[0], "default")], class_name="flex gap-2", key="badges2")
-            plot_histograms(due_patients, plot_columns)
+    tests = [HCA_TESTS[test] for test in selected_tests]
+    due_patients = filter_due_patients(df, tests, due_months)
+
+    if not due_patients.empty:
+        ui.badges(badge_list=[("Patient Count: ", "outline"), (due_patients.shape[0], "default")], class_name="flex gap-2", key="badges2")
+        plot_histograms(due_patients, plot_columns)
+
+
+        paged_dataframe(due_patients, "hca_table", columns=default_columns(due_patients, tests), height=300)
+        download_sms_csv(due_patients, sms_df, actioned_df, filename="hca_selfbook_sms.csv")
+        download_recall_waves(
+            due_patients, sms_df, actioned_df, tests, "hca_selfbook_sms.csv",
+            load_predictions=lambda: data_graph.get("prediction"), due_months=due_months,
+        )
+
+
+    else:
+        st.warning(
+            "Please upload the necessary CSV file to display the dataframe. Select at least one criterion to filter by."
+        )
+
+@st.fragment
+def filter_dataframe_panel(df, sms_df, actioned_df):
+    # Get the min and max values for each column to use in sliders
+    metrics = {
+        "hba1c_value": (
+            "HbA1c value",
+            df["hba1c_value"].min(),
+            df["hba1c_value"].max(),
+        ),
+        "sbp": ("SBP", df["sbp"].min(), df["sbp"].max()),
+        "dbp": ("DBP", df["dbp"].min(), df["dbp"].max()),
+        "latest_ldl": (
+            "Latest LDL",
+            df["latest_ldl"].min(),
+            df["latest_ldl"].max(),
+        ),
+        "latest_egfr": (
+            "Latest eGFR",
+            df["latest_egfr"].min(),
+            df["latest_egfr"].max(),
+        ),
+        "latest_bmi": (
+            "Latest BMI",
+            df["latest_bmi"].min(),
+            df["latest_bmi"].max(),
+        ),
+    }
+
+    # Dictionary to store slider values for each metric
+    filter_values = {}
+    # Fragments cannot write to the sidebar, so the sliders live in the panel itself
+    with st.expander("**Filter** ranges", expanded=True):
+        slider_columns = st.columns(3)
+        # Create sliders for each metric and store the selected range
+        for i, (key, (label, min_val, max_val)) in enumerate(metrics.items()):
+            with slider_columns[i % 3]:
+                filter_values[key] = st.slider(
+                    f"Select **{label}** range",
+                    min_value=float(min_val),
+                    max_value=float(max_val),
+                    value=(float(min_val), float(max_val)),
+                )
+
+    # One mask over the shared register for all metrics; only the matching rows are taken from it
+    mask = np.ones(len(df), dtype=bool)
+    for key, (label, _, _) in metrics.items():
+        min_val, max_val = filter_values[key]
+        mask &= df[key].between(min_val, max_val).to_numpy(dtype=bool)
+    filtered_df = df.iloc[np.flatnonzero(mask)]
+    ui.badges(badge_list=[("Patient Count: ", "outline"), (filtered_df.shape[0], "default")], class_name="flex gap-2", key="badges3")
+    # Display the filtered DataFram
+    plot_histograms(filtered_df, plot_columns)
+
+    paged_dataframe(filtered_df, "filtered_table", height=300)  # Only shows rows within the slider-selected range
+    if sms_df is not None:
+        download_sms_csv(filtered_df, sms_df, actioned_df, filename="filtered_data_sms.csv")
+
+@st.fragment
+def cohort_query_panel(df, sms_df, actioned_df, register_id):
+    from cohortquery import CohortQueryEngine, load_saved_queries, run_cohort_query, save_query, delete_query
+
+    saved_queries = load_saved_queries()
+    c1, c2 = st.columns([1, 2], gap="large")
+    with c1:
+        selected_query = st.selectbox("Saved **cohort queries**:", options=["(new query)"] + sorted(saved_queries))
+        due_months = due_window_control("due_months_cohort")
+    with c2:
+        condition = st.text_area(
+            "Cohort **condition** (SQL):",
+            value=saved_queries.get(selected_query, ""),
+            placeholder="hba1c_value > 75 AND egfr_due AND age < 80",
+            key=f"cohort_condition_{selected_query}",
+        )
 
+    with st.expander("Available columns"):
+        st.write(", ".join(f"`{col}`" for col in CohortQueryEngine(df.iloc[0:0]).columns()))
 
-            st.dataframe(due_patients, height=300)
-            download_sms_csv(due_patients, sms_df, actioned_df, filename="hca_selfbook_sms.csv")
+    if not condition.strip():
+        st.info("Enter a condition, or pick a saved query.")
+        return
 
+    try:
+        with span("cohort_query"):
+            rows = run_cohort_query(register_id, condition, df, due_months)
+    except ValueError as e:
+        st.error(f"Invalid cohort condition: {e}")
+        return
+
+    cohort_df = df.iloc[rows]
+    ui.badges(badge_list=[("Patient Count: ", "outline"), (cohort_df.shape[0], "default")], class_name="flex gap-2", key="badges_cohort")
+    paged_dataframe(cohort_df, "cohort_table")
 
+    c1, c2, c3 = st.columns([2, 1, 1])
+    with c1:
+        query_name = st.text_input("Save as:", value="" if selected_query == "(new query)" else selected_query)
+    with c2:
+        st.container(height=12, border=False)
+        if st.button("Save query", disabled=not query_name.strip()):
+            save_query(query_name.strip(), condition)
+            st.toast(f"Saved cohort query **{query_name.strip()}**.")
+    with c3:
+        st.container(height=12, border=False)
+        if st.button("Delete query", disabled=selected_query not in saved_queries):
+            delete_query(selected_query)
+            st.rerun()
+
+    if sms_df is not None:
+        download_sms_csv(cohort_df, sms_df, actioned_df, filename="cohort_query_sms.csv")
+
+# Trends read the snapshot store, not the current upload
+@st.fragment
+def trends_panel():
+    from snapshotstore import SnapshotStore, TREND_COLUMNS
+
+    store = SnapshotStore()
+    snapshots = store.snapshots()
+    if snapshots.empty:
+        st.info("No dashboard snapshots yet. Each uploaded Diabetes Dashboard is saved as a monthly snapshot; older exports can be added with `python snapshotstore.py add <csv> --date YYYY-MM-DD`.")
+        return
+
+    months = snapshots["month"].unique().tolist()
+    c1, c2, c3 = st.columns([2, 1, 1], gap="large")
+    with c1:
+        trend_columns = st.multiselect("Select **values** to trend:", options=TREND_COLUMNS, default=["hba1c_value"])
+    with c2:
+        stat = st.selectbox("Statistic", options=["mean", "median"])
+    with c3:
+        start, end = st.select_slider("Months", options=months, value=(months[0], months[-1])) if len(months) > 1 else (months[0], months[0])
+
+    ui.badges(badge_list=[("Snapshots: ", "outline"), (len(snapshots), "default")], class_name="flex gap-2", key="badges_trends")
+    if trend_columns:
+        with span("cohort_trend"):
+            trend = store.cohort_trend(trend_columns, stat=stat, start=start, end=end)
+        st.line_chart(trend[trend_columns])
+
+    nhs_number = st.text_input("**NHS number** for a patient's history:")
+    if nhs_number:
+        with span("patient_series"):
+            series = store.patient_series(nhs_number, start=start, end=end)
+        if series.empty:
+            st.warning("No snapshots found for this NHS number.")
         else:
-            st.warning(
-                "Please upload the necessary CSV file to display the dataframe. Select at least one criterion to filter by."
-            )
-    except NameError as e:
-        st.warning(f"Upload csv data to use this tool. Error: {e}")
+            st.line_chart(series[trend_columns or TREND_COLUMNS])
+            st.dataframe(series)
+
+tab_selector = ui.tabs(
+    options=[
+        "Quick Start",
+        "Online Pre-assessment",
+        "HCA Self-book",
+        "Rewind",
+        "Filter Dataframe",
+        "Cohort Query",
+        "Predicted Hba1c",
+        "Trends",
+        "Guidelines",
+        "Integrations",
+    ],
+    default_value="Quick Start",
+    key="tab3",
+)
+
+@st.fragment(run_every=1.0)
+def job_progress_panel(jobs):
+    # Polls the background jobs; once all have finished the whole page reruns to show their results
+    for job in jobs:
+        fraction, stage = job.progress()
+        detail = f" - {stage.replace('_', ' ')} done" if stage else ""
+        st.progress(fraction, text=f"⏳ {job.label}{detail} ({job.elapsed():.0f}s)")
+    if all(job.done() for job in jobs):
+        st.rerun(scope="app")
+
+
+# Load the tab's datasets concurrently, reporting each source as it finishes
+needed_datasets = tab_datasets.get(tab_selector, [])
+if needed_datasets:
+    load_status = st.status(f"Loading {len(needed_datasets)} data sources...", expanded=False)
+    status_icons = {"done": "✅", "unavailable": "➖", "error": "❌"}
+
+    def report_progress(name, status):
+        error = f" - {status['error']}" if status["error"] else ""
+        load_status.write(f"{status_icons[status['state']]} **{name}** {status['seconds']:.2f}s{error}")
+
+    with span("load_datasets", datasets=len(needed_datasets)):
+        datasets = data_graph.require(needed_datasets, max_workers=LOADER_THREADS, on_update=report_progress)
+    failed = {name: s["error"] for name, s in data_graph.status().items() if s["state"] == "error"}
+    load_status.update(
+        label=f"Data sources loaded{f' ({len(failed)} failed)' if failed else ''}",
+        state="error" if failed else "complete",
+    )
+    for name, error in failed.items():
+        st.error(f"Could not load **{name}**: {error}")
+    for name, value in datasets.items():
+        invalid = getattr(value, "attrs", {}).get("invalid_nhs_numbers", 0)
+        if invalid:
+            st.warning(f"**{name}**: {invalid} NHS numbers failed validation (unreadable or wrong Modulus-11 check digit) and won't match other sources.")
+    if pending_jobs:
+        job_progress_panel(list(pending_jobs.values()))
+        if any(datasets.get(name) is None for name in pending_jobs):
+            st.info("The page will update when processing has finished.")
+            st.stop()
+        st.info("Showing the previous upload while the new one is processed.")
+else:
+    datasets = {}
+df = datasets.get("dashboard")
+sms_df = datasets.get("sms")
+actioned_df = datasets.get("actioned")
+prediction = datasets.get("prediction")
+
+if tab_selector == "Online Pre-assessment":
+
+    if sms_df is None or df is None:
+        st.warning("Please upload both CSV files to proceed.")
+
+    online_preassessment_panel(df, sms_df, actioned_df)
+
+
+
+
+
+
+
+elif tab_selector == "HCA Self-book":
+
+    if sms_df is None or df is None:
+        st.warning("Please upload both CSV files to proceed.")
+
+    hca_selfbook_panel(df, sms_df, actioned_df)
 
 elif tab_selector == "Filter Dataframe":
 
-    if "df" not in globals():
+    if df is None:
         st.warning("Please upload the Diabetes Dashboard CSV file to proceed.")
     else:
-        # Get the min and max values for each column to use in sliders
-        metrics = {
-            "hba1c_value": (
-                "HbA1c value",
-                df["hba1c_value"].min(),
-                df["hba1c_value"].max(),
-            ),
-            "sbp": ("SBP", df["sbp"].min(), df["sbp"].max()),
-            "dbp": ("DBP", df["dbp"].min(), df["dbp"].max()),
-            "latest_ldl": (
-                "Latest LDL",
-                df["latest_ldl"].min(),
-                df["latest_ldl"].max(),
-            ),
-            "latest_egfr": (
-                "Latest eGFR",
-                df["latest_egfr"].min(),
-                df["latest_egfr"].max(),
-            ),
-            "bmi": (
-                "Latest BMI",
-                df["bmi"].min(),
-                df["bmi"].max(),
-            ),
-        }
-
-        # Dictionary to store slider values for each metric
-        filter_values = {}
-        st.sidebar.divider()
-        # Create sliders for each metric and store the selected range
-        for key, (label, min_val, max_val) in metrics.items():
-            filter_values[key] = st.sidebar.slider(
-                f"Select **{label}** range",
-                min_value=float(min_val),
-                max_value=float(max_val),
-                value=(float(min_val), float(max_val)),
-            )
+        filter_dataframe_panel(df, sms_df, actioned_df)
+
+
 
-        # Filter the DataFrame based on the selected ranges for all metrics
-        filtered_df = df.copy()
-        for key, (label, _, _) in metrics.items():
-            min_val, max_val = filter_values[key]
-            filtered_df = filtered_df[
-                (filtered_df[key] >= min_val) & (filtered_df[key] <= max_val)
-            ]
-        ui.badges(badge_list=[("Patient Count: ", "outline"), (filtered_df.shape[0], "default")], class_name="flex gap-2", key="badges3")
-        # Display the filtered DataFram
-        plot_histograms(filtered_df, plot_columns)
-
-        st.dataframe(filtered_df, height=300)  # Only shows rows within the slider-selected range
-        download_sms_csv(filtered_df, sms_df, actioned_df, filename="filtered_data_sms.csv")
 
 
 
+elif tab_selector == "Cohort Query":
 
+    st.write("Define a cohort with a **SQL condition** over the Diabetes Dashboard, e.g. `hba1c_value > 75 AND egfr_due AND age < 80`. The `*_due` columns follow the due window chosen below, and `*_days` columns hold the days since each test (e.g. `hba1c_days > 365`).")
+    if df is None:
+        st.warning("Please upload the Diabetes Dashboard CSV file to proceed.")
+    else:
+        cohort_query_panel(df, sms_df, actioned_df, os.path.basename(df.attrs["register_path"]))
 
 
 elif tab_selector == "Rewind":
 
     st.write("Patients eligible for referral to **Rewind**.")
-    if "sms_df" not in globals() or "df" not in globals():
+    if sms_df is None or df is None:
         st.warning("Please upload both CSV files to proceed.")
     else:
         rewind_df = df[
             (df["eligible_for_rewind"] == "Yes") & (df["rewind_-_started"] == 0)
         ]
         ui.badges(badge_list=[("Patient Count: ", "outline"), (rewind_df.shape[0], "default")], class_name="flex gap-2", key="badges4")
-        st.dataframe(rewind_df)
+        paged_dataframe(rewind_df, "rewind_table", columns=default_columns(rewind_df, ["eligible_for_rewind", "rewind_-_started"]))
         download_sms_csv(rewind_df, sms_df, actioned_df, filename="dm_rewind_sms.csv")
 
 
@@ -328,6 +617,12 @@ elif tab_selector == "Rewind":
 
 
 
+elif tab_selector == "Trends":
+
+    st.write("Cohort and patient **trends** across uploaded dashboard snapshots.")
+    trends_panel()
+
+
 elif tab_selector == "Guidelines":
 
     st.write("""In the management of diabetes, the frequency of monitoring various metrics can change based on the patient’s condition and previous results. According to NICE (National Institute for Health and Care Excellence) guidelines, here are recommended timeframes for common diabetic metrics, with adjustments based on results:
@@ -372,7 +667,7 @@ elif tab_selector == "Guidelines":
 	- If on weight loss medications or interventions: Check every 3 months."""
     )
 
-    st.image("images/table.png")
+    st.image(asset_url("images/table.png"))
 
 
 elif tab_selector == "Quick Start":
@@ -395,11 +690,11 @@ Use the Pre-assessment on this tool to target the appropriate cohort of patients
 5. Once you are happy with your patient cohort, download a custom CSV using the **Download Button** on each page. This will have the exact list of patient you have selected using the tool.""")
         st.write("**Tally form preview:**")
         with st.container(height=450, border=True):
-            st.image('images/tallyform.png')
+            st.image(asset_url("images/tallyform.png"))
         ui.link_button(text="Download Pre-assessment Form Template", url="https://tally.so/templates/diabetes-pre-assessment-questionnaire/mYQ4zm", key="link_btn")
     with c2:
         st.container(height=45, border=False)
-        st.image('images/flowchart.png')
+        st.image(asset_url("images/flowchart.png"))
 
     st.write("If you find this tool useful, please follow the link to GitHub and :material/star: this project.")
     st.write("For assistance with using this tool or setting up a Tally integration please contact me via a GitHub issue.")
@@ -411,7 +706,11 @@ elif tab_selector == "Predicted Hba1c":
 
 
     st.write("**Prediction DF** here")
-    st.dataframe(prediction)
+    if prediction is None:
+        st.warning("Please upload the Diabetes Dashboard CSV file to see predictions.")
+    else:
+        st.caption(f"Re-scored **{prediction.attrs.get('rescored', len(prediction))}** of {len(prediction)} patients - predictions for patients whose data hasn't changed since the last upload are reused.")
+        prediction_panel(prediction, df)
 
     st.write("This app will soon include a feature to predict patients’ next **HbA1c levels** based on their medical history. A regression model is being trained on data from the **Brompton Health PCN** to support this functionality.")
     st.markdown("""
@@ -427,20 +726,63 @@ This paper explores machine learning techniques to predict the risks of diabetic
 5. “**Predictive Modelling of Glycated Hemoglobin Levels Using Machine Learning Regressors**”
 This study develops a methodology for predicting HbA1c levels using various machine learning regression algorithms, demonstrating the potential for improved diabetes management. (Iieta)
 """)
-    st.image('images/r2.png')
-    st.image('images/regression2.png')
+    st.image(asset_url("images/r2.png"))
+    st.image(asset_url("images/regression2.png"))
 
     st.subheader("Systematic Review: HbA1c Prediction")
-    with st.container(height=650, border=True):
-        pdf_viewer("hba1c-paper.pdf")
+    st.link_button("Open **PDF** in a new tab", asset_url("hba1c-paper.pdf"))
+    # The PDF is only embedded (and sent to the browser) when asked for
+    if st.toggle("Show the **PDF** here", key="show_hba1c_paper"):
+        with st.container(height=650, border=True):
+            from streamlit_pdf_viewer import pdf_viewer
+
+            pdf_viewer("hba1c-paper.pdf")
 
 
 
 
 
 elif tab_selector == "Integrations":
-    st.image("images/integrations.png")
+    st.image(asset_url("images/integrations.png"))
     st.write(st.session_state)
 
     st.subheader("Actioned DF Loaded:")
     st.dataframe(actioned_df)
+
+    st.subheader("Cache Statistics")
+    cache_stats = registry.stats()
+    st.dataframe(stats_dataframe(cache_stats), hide_index=True)
+    entries = [(s["cache"], e) for s in cache_stats for e in s["entry_details"]]
+    if entries:
+        st.dataframe(
+            pd.DataFrame([{"cache": name, **entry} for name, entry in entries]),
+            hide_index=True,
+        )
+        c1, c2 = st.columns([3, 1])
+        with c1:
+            selected_entry = st.selectbox(
+                "Select a cache entry to **invalidate**:",
+                options=range(len(entries)),
+                format_func=lambda i: f"{entries[i][0]} - {entries[i][1]['key'][:80]}",
+            )
+        with c2:
+            st.container(height=12, border=False)
+            if st.button("Invalidate", key="invalidate_cache_entry"):
+                name, entry = entries[selected_entry]
+                if registry.invalidate(name, entry["key"]):
+                    st.toast(f"Invalidated entry of **{name}**.")
+                else:
+                    st.toast(f"Cleared all entries of **{name}** (entry arguments are not stored).")
+                st.rerun()
+
+
+# Optional per-rerun timing breakdown in the sidebar
+st.sidebar.divider()
+if st.sidebar.toggle("Show **stage timings**", key="show_timings"):
+    spans = get_spans()
+    if spans:
+        timings_df = pd.DataFrame(spans)[["stage", "parent", "duration_ms"]]
+        st.sidebar.caption(f"Slowest stage: **{timings_df.loc[timings_df['duration_ms'].idxmax(), 'stage']}**")
+        st.sidebar.dataframe(timings_df, hide_index=True)
+    else:
+        st.sidebar.caption("No pipeline stages ran in this rerun (cached or not needed).")
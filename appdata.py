@@ -0,0 +1,32 @@
+"""
+This module contains the app's private data directory, where files holding patient data (the
+prediction store and the shared registers) are kept instead of the shared temporary directory.
+
+The directory is DATA_DIR (~/.a1sense by default; set A1SENSE_DATA_DIR to move it). Directories
+are created readable by the app's user only (mode 0700).
+"""
+
+import os
+
+DATA_DIR = os.environ.get("A1SENSE_DATA_DIR", os.path.join(os.path.expanduser("~"), ".a1sense"))
+
+
+def private_dir(path):
+    """
+    Creates a directory, and any missing parents, readable by the app's user only.
+
+    Parameters:
+    - path (str): The directory.
+
+    Returns:
+    - str: The path.
+    """
+    path = os.path.abspath(path)
+    if not os.path.isdir(path):
+        private_dir(os.path.dirname(path))
+        try:
+            os.mkdir(path, mode=0o700)
+        except FileExistsError:
+            # Created by another process meanwhile
+            pass
+    return path
@@ -0,0 +1,169 @@
+"""
+This module contains the static asset pipeline for the dashboard images and the HbA1c paper.
+
+`python assets.py build` writes resized, compressed WebP variants of the images in images/ (sized
+for where the app displays them) and a copy of the PDF into static/, with a content hash in each
+file name, and records them in static/manifest.json. The app then refers to the assets through Streamlit's static file
+serving (enableStaticServing in .streamlit/config.toml) instead of reading and re-sending the
+originals on every rerun. Because a file's name changes whenever its content changes, browsers
+and any proxy in front of the app can cache /app/static/ responses indefinitely.
+
+The PDF's copy is large, so it is not committed (static/*.pdf is git-ignored): run the build when
+deploying. The app never writes to static/ itself.
+
+If the manifest or an entry is missing, asset_url falls back to the original file path.
+"""
+
+import argparse
+import functools
+import hashlib
+import io
+import json
+import os
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, "static")
+MANIFEST_PATH = os.path.join(STATIC_DIR, "manifest.json")
+
+# Maximum pixel width of each image, about twice the width it is displayed at (for high-DPI screens)
+IMAGE_WIDTHS = {
+    "images/a1sense.png": 1600,
+    "images/notion_connected.png": 600,
+    "images/notion_offline.png": 600,
+    "images/google_online.png": 600,
+    "images/google_offline.png": 600,
+    "images/flowchart.png": 1200,
+    "images/tallyform.png": 1200,
+    "images/table.png": 1600,
+    "images/r2.png": 1200,
+    "images/regression2.png": 1200,
+    "images/integrations.png": 1600,
+}
+
+# Documents copied as-is by the build (they are only fetched when the user asks for them)
+DOCUMENTS = ["hba1c-paper.pdf"]
+
+WEBP_QUALITY = 85
+
+
+def _content_hash(data):
+    return hashlib.sha1(data).hexdigest()[:10]
+
+
+def build_image(source, max_width):
+    """
+    Writes a resized WebP variant of an image into static/.
+
+    Parameters:
+    - source (str): Image path relative to the repository root.
+    - max_width (int): Maximum width in pixels; smaller images keep their size.
+
+    Returns:
+    - str: The variant's path relative to static/.
+    """
+    from PIL import Image
+
+    with Image.open(os.path.join(ROOT, source)) as image:
+        image.load()
+        if image.width > max_width:
+            height = round(image.height * max_width / image.width)
+            image = image.resize((max_width, height), Image.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="WEBP", quality=WEBP_QUALITY, method=6)
+        data = buffer.getvalue()
+
+    stem = os.path.splitext(source)[0]
+    target = f"{stem}.{_content_hash(data)}.webp"
+    _write(target, data)
+    return target
+
+
+def build_document(source):
+    """Copies a document into static/ under a content-hashed name and returns its path relative to static/."""
+    with open(os.path.join(ROOT, source), "rb") as f:
+        data = f.read()
+    stem, ext = os.path.splitext(source)
+    target = f"{stem}.{_content_hash(data)}{ext}"
+    _write(target, data)
+    return target
+
+
+def _write(relative_path, data):
+    path = os.path.join(STATIC_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written under a temporary name, so a concurrent reader never sees a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build():
+    """
+    Builds every asset variant, removes stale ones and writes static/manifest.json.
+
+    Returns:
+    - dict: The manifest, mapping each source path to its variant path relative to static/.
+    """
+    manifest = {}
+    for source, width in IMAGE_WIDTHS.items():
+        manifest[source] = build_image(source, width)
+    for source in DOCUMENTS:
+        manifest[source] = build_document(source)
+
+    # Remove variants from previous builds
+    current = {os.path.normpath(path) for path in manifest.values()}
+    for dirpath, _, filenames in os.walk(STATIC_DIR):
+        for filename in filenames:
+            relative = os.path.normpath(os.path.relpath(os.path.join(dirpath, filename), STATIC_DIR))
+            if relative != "manifest.json" and relative not in current:
+                os.remove(os.path.join(dirpath, filename))
+
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    for source, target in manifest.items():
+        before = os.path.getsize(os.path.join(ROOT, source))
+        after = os.path.getsize(os.path.join(STATIC_DIR, target))
+        print(f"{source:<32} {before / 1024:>8.0f} KB -> {after / 1024:>6.0f} KB  static/{target}")
+    return manifest
+
+
+@functools.lru_cache(maxsize=1)
+def load_manifest():
+    """Returns the asset manifest, or an empty dictionary if the assets have not been built."""
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(source):
+    """
+    Returns the URL to display an asset with.
+
+    Parameters:
+    - source (str): The original path, e.g. "images/a1sense.png".
+
+    Returns:
+    - str: The "/app/static/..." URL of the built variant, or `source` itself if there isn't one.
+    """
+    target = load_manifest().get(source)
+    if target is None or not os.path.exists(os.path.join(STATIC_DIR, target)):
+        return source
+    return f"/app/static/{target}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the dashboard's static asset variants.")
+    parser.add_argument("command", choices=["build"], help="Build the static assets and manifest.")
+    parser.parse_args()
+    build()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Throughput benchmark of the Notion and Google Sheets loaders against local stub servers.
+
+Runs NotionHelper.get_all_pages_as_dataframe, load_notion_df, load_google_sheet_df and
+SheetHelper.gsheet_to_df against NotionStub and SheetsStub (see stubservers.py) for each record
+count, and reports per loader the wall time, the requests the stub received (including 429s and
+injected errors that were retried) and the bytes transferred. The stubs' latency, Notion page
+size, rate limit and error injection are options, so the effect of each can be measured offline.
+The loaders run uncached, once per repeat; results can be written as JSON to compare runs.
+
+Usage:
+    python benchmarks/bench_integrations.py --records 1000 10000 50000 --latency 0.05 --rate-limit 3
+    python benchmarks/bench_integrations.py --records 10000 --fail-every 20 --output benchmarks/integrations.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httptransport  # noqa: E402
+from stubservers import NotionStub, SheetsStub, service_account_info  # noqa: E402
+
+NOTION_TOKEN = "stub-token"
+DATABASE_ID = "stub-database"
+SHEET_URL = "https://docs.google.com/spreadsheets/d/stub-sheet/edit"
+
+
+def use_secrets(credentials, directory):
+    """Points st.secrets at a secrets file holding the stub service account (for load_google_sheet_df)."""
+    import streamlit as st
+    from streamlit import config
+
+    path = os.path.join(directory, "secrets.toml")
+    with open(path, "w") as f:
+        f.write("[google_sheets]\n")
+        for key, value in {**credentials, "auth_uri": "", "auth_provider_x509_cert_url": "", "client_x509_cert_url": ""}.items():
+            f.write(f"{key} = {json.dumps(value)}\n")
+    config.set_option("secrets.files", [path])
+    st.secrets._secrets = None  # Reloaded from the new file on next access
+
+
+def loaders(key_file):
+    """Returns {loader name: (stub name, function returning the loaded DataFrame)}."""
+    import main
+    from notionhelper import NotionHelper
+    from sheethelper import SheetHelper
+
+    # The undecorated functions, so every run fetches instead of hitting the Streamlit cache
+    return {
+        "NotionHelper.get_all_pages_as_dataframe": (
+            "notion", lambda: NotionHelper(NOTION_TOKEN, DATABASE_ID).get_all_pages_as_dataframe()
+        ),
+        "load_notion_df": ("notion", lambda: main.load_notion_df.__wrapped__(NOTION_TOKEN, DATABASE_ID)),
+        "load_google_sheet_df": ("sheets", lambda: main.load_google_sheet_df.__wrapped__(SHEET_URL, 0)),
+        "SheetHelper.gsheet_to_df": ("sheets", lambda: SheetHelper(SHEET_URL, 0, key_file).gsheet_to_df()),
+    }
+
+
+def measure(name, n_records, stub, load):
+    """
+    Runs one loader once and records its wall time and what the stub saw.
+
+    Returns:
+    - dict: The result record.
+    """
+    stub.reset()
+    start = time.perf_counter()
+    rows, error = None, None
+    try:
+        rows = len(load())
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    stats = stub.stats()
+
+    record = {
+        "loader": name,
+        "n_records": n_records,
+        "rows": rows,
+        "seconds": round(seconds, 6),
+        "records_per_second": round(rows / seconds) if rows else 0,
+        "requests": stats["requests"],
+        "throttled": stats["throttled"],
+        "failed": stats["failed"],
+        "kb_sent": round(stats["bytes_received"] / 1024, 1),
+        "kb_received": round(stats["bytes_sent"] / 1024, 1),
+        "connections": stats["connections"],
+        "error": error,
+    }
+    status = "✅" if error is None and rows == n_records else f"❌ {error or f'{rows} rows'}"
+    print(
+        f"{name:<42} {n_records:>7} {seconds:>9.3f}s {record['requests']:>6} req "
+        f"{record['throttled']:>4} 429 {record['failed']:>4} 5xx {record['kb_received']:>10.1f} KB  {status}"
+    )
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, nargs="+", default=[1_000, 10_000], help="Records served by each stub.")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs of each loader per record count.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds each stub request takes.")
+    parser.add_argument("--page-size", type=int, default=100, help="Most results per Notion response.")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Requests per second each stub accepts (0 for no limit).")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth request with 429.")
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every Nth request with 503.")
+    parser.add_argument("--output", help="Path of a JSON results file.")
+    args = parser.parse_args()
+
+    httptransport.BACKOFF_BASE = 0.05
+    stub_options = {
+        "latency": args.latency,
+        "rate_limit": args.rate_limit,
+        "throttle_every": args.throttle_every,
+        "fail_every": args.fail_every,
+        "retry_after": 0.05,
+    }
+    records = []
+    with tempfile.TemporaryDirectory() as tmp:
+        credentials = service_account_info()
+        key_file = os.path.join(tmp, "service_account.json")
+        with open(key_file, "w") as f:
+            json.dump(credentials, f)
+        use_secrets(credentials, tmp)
+
+        print(f"{'loader':<42} {'records':>7} {'wall':>10} {'requests':>10} {'':>8} {'':>8} {'received':>13}")
+        for n_records in args.records:
+            with NotionStub(pages=n_records, page_size=args.page_size, **stub_options) as notion, \
+                    SheetsStub(rows=n_records, **stub_options) as sheets:
+                httptransport.ENDPOINT_OVERRIDES.update({**notion.overrides(), **sheets.overrides()})
+                stubs = {"notion": notion, "sheets": sheets}
+                for name, (stub_name, load) in loaders(key_file).items():
+                    for _ in range(args.repeats):
+                        records.append(measure(name, n_records, stubs[stub_name], load))
+
+    if args.output:
+        results = {
+            "benchmark": "integrations",
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "stub_options": {**stub_options, "page_size": args.page_size},
+            "results": records,
+        }
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    sys.exit(0 if all(record["error"] is None for record in records) else 1)
+
+
+if __name__ == "__main__":
+    main()
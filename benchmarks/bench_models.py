@@ -0,0 +1,208 @@
+"""
+Evaluation of the registered HbA1c models (modelregistry.py): latency, memory and error.
+
+For every model version in the registry and every evaluator it supports (compiled, sklearn),
+on a synthetic register or a held-out dashboard export:
+- load: the time and peak memory of loading (and checksumming) its artifacts in this process,
+  and the time in a fresh one (which also pays for importing scikit-learn, for sklearn);
+- latency: the median wall time of predicting the whole register, and its peak memory;
+- error: MAE, RMSE, bias and R² of the predictions against the register's latest HbA1c, and the
+  largest difference from the first version and evaluator evaluated (the reference).
+
+The run fails (exit status 1) when an evaluator can't load or predict - it is reported and the
+others are still evaluated - or when its predictions are unusable: R² below MIN_R2, or a spread
+below recallscheduler.PREDICTION_MIN_SPREAD of the latest HbA1c values' spread. Synthetic
+registers derive the earlier HbA1c results (Column1-Column9) from the latest value, so a model
+fed the right inputs does well on them too; use --register with a real export to measure
+accuracy.
+
+Usage:
+    python benchmarks/bench_models.py --patients 10000 --output benchmarks/results_models.json
+    python benchmarks/bench_models.py --register held_out_dashboard.csv --versions gbr-2024-11-13
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import modelregistry  # noqa: E402
+from recallscheduler import PREDICTION_MIN_SPREAD  # noqa: E402
+from synthetic import generate_dashboard  # noqa: E402
+
+# Lowest acceptable R² of a version's predictions against the latest HbA1c
+MIN_R2 = 0.0
+
+
+def traced(func):
+    """Returns (result, seconds, peak traced MB) of one call."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 1024 ** 2
+
+
+def fresh_load_seconds(registry_path, name, evaluator):
+    """Times loading a version's artifacts in a fresh interpreter (including the imports it needs)."""
+    script = (
+        "import time; start = time.perf_counter(); import modelregistry; "
+        f"modelregistry.ModelRegistry({registry_path!r}).get({name!r}).load({evaluator!r}); "
+        "print(time.perf_counter() - start)"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def error_metrics(predicted, actual):
+    """Returns MAE, RMSE, bias (mean predicted - actual) and R² over rows with an actual value."""
+    known = ~np.isnan(actual)
+    error = predicted[known] - actual[known]
+    if not known.any():
+        return {"n": 0, "mae": None, "rmse": None, "bias": None, "r2": None}
+    variance = np.sum((actual[known] - actual[known].mean()) ** 2)
+    return {
+        "n": int(known.sum()),
+        "mae": round(float(np.mean(np.abs(error))), 4),
+        "rmse": round(float(np.sqrt(np.mean(error ** 2))), 4),
+        "bias": round(float(np.mean(error)), 4),
+        "r2": round(float(1 - np.sum(error ** 2) / variance), 4) if variance > 0 else None,
+    }
+
+
+def prediction_problems(record, predicted, actual):
+    """Returns what makes a version's predictions unusable (empty if nothing does)."""
+    problems = []
+    if record["r2"] is not None and record["r2"] < MIN_R2:
+        problems.append(f"R² {record['r2']} below {MIN_R2}")
+    spread, reference = float(np.nanstd(predicted)), float(np.nanstd(actual))
+    if spread < 1e-6 or spread < PREDICTION_MIN_SPREAD * reference:
+        problems.append(f"prediction SD {spread:.2f} against {reference:.2f} for the latest HbA1c")
+    return problems
+
+
+def evaluate(args, df, actual, name, evaluator, reference):
+    """Returns the record of one version and evaluator, and its predictions."""
+    from predict import prepare_features
+
+    # New registries, so the artifacts are loaded rather than memoized; the load is timed
+    # without tracemalloc, which slows imports down, and traced again for its memory
+    version = modelregistry.ModelRegistry(args.registry).get(name)
+    start = time.perf_counter()
+    version.load(evaluator)
+    load_seconds = time.perf_counter() - start
+    _, _, load_mb = traced(lambda: modelregistry.ModelRegistry(args.registry).get(name).load(evaluator))
+    features = prepare_features(df.copy(), version.features)
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        version.predict(features, evaluator)
+        timings.append(time.perf_counter() - start)
+    predicted, _, predict_mb = traced(lambda: version.predict(features, evaluator))
+
+    record = {
+        "version": name,
+        "evaluator": evaluator,
+        "n_patients": len(df),
+        "load_seconds": round(load_seconds, 6),
+        "load_peak_mb": round(load_mb, 3),
+        "fresh_load_seconds": fresh_load_seconds(args.registry, name, evaluator),
+        "predict_seconds": round(statistics.median(timings), 6),
+        "predict_peak_mb": round(predict_mb, 3),
+        "patients_per_second": round(len(df) / statistics.median(timings)),
+        "max_diff_from_reference": float(np.max(np.abs(predicted - reference))) if reference is not None else 0.0,
+        "prediction_sd": round(float(np.nanstd(predicted)), 4),
+        **error_metrics(predicted, actual),
+    }
+    record["problems"] = prediction_problems(record, predicted, actual)
+    return record, predicted
+
+
+def load_register(args):
+    """Returns the preprocessed register to evaluate on (a held-out export, or synthetic)."""
+    from main import date_cols, preprocess_dashboard
+
+    if args.register:
+        return preprocess_dashboard(args.register, date_cols)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "diabetes_dashboard.csv")
+        generate_dashboard(args.patients, seed=args.seed).to_csv(path, index=False)
+        return preprocess_dashboard(path, date_cols)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--registry", default=modelregistry.REGISTRY_PATH,
+                        help="Path of the registry manifest.")
+    parser.add_argument("--versions", nargs="+", default=None, help="Versions to evaluate (all by default).")
+    parser.add_argument("--register", default=None, help="Held-out dashboard CSV (synthetic if omitted).")
+    parser.add_argument("--patients", type=int, default=10_000, help="Size of the synthetic register.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic register.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per latency measurement.")
+    parser.add_argument("--output", default=None, help="Path of a JSON results file.")
+    args = parser.parse_args()
+
+    registry = modelregistry.ModelRegistry(args.registry)
+    df = load_register(args)
+    actual = df["hba1c_value"].to_numpy(dtype="float64", na_value=np.nan)
+
+    records, reference = [], None
+    print(f"{'version':<24} {'evaluator':<9} {'load':>9} {'fresh load':>11} {'predict':>9} {'peak':>9} {'MAE':>7} {'RMSE':>7} {'max diff':>9}")
+    for name in args.versions or registry.names():
+        for evaluator in registry.get(name).evaluators():
+            try:
+                record, predicted = evaluate(args, df, actual, name, evaluator, reference)
+            except Exception as e:
+                # e.g. a missing or unloadable artifact; the other evaluators are still run
+                records.append({"version": name, "evaluator": evaluator, "error": f"{type(e).__name__}: {e}"})
+                print(f"{name:<24} {evaluator:<9} failed: {type(e).__name__}: {e}")
+                continue
+            if reference is None:
+                reference = predicted
+            records.append(record)
+            fresh = f"{record['fresh_load_seconds']:.3f}s" if record["fresh_load_seconds"] is not None else "failed"
+            print(
+                f"{name:<24} {evaluator:<9} {record['load_seconds']:>8.3f}s {fresh:>11} {record['predict_seconds']:>8.4f}s "
+                f"{record['predict_peak_mb']:>6.1f} MB {record['mae'] or 0:>7.2f} {record['rmse'] or 0:>7.2f} {record['max_diff_from_reference']:>9.1e}"
+            )
+            for problem in record["problems"]:
+                print(f"{'':<24} {'':<9} unusable predictions: {problem}")
+
+    if args.output:
+        results = {
+            "benchmark": "models",
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "register": args.register or f"synthetic ({args.patients} patients, seed {args.seed})",
+            "results": records,
+        }
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    failed = [r for r in records if "error" in r or r["problems"]]
+    if failed:
+        print(f"{len(failed)} of {len(records)} evaluations failed")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+End-to-end benchmark of the dashboard pipeline on synthetic registers.
+
+Times preprocess_dashboard, filter_due_patients, extract_sms_df, plot_histograms and
+predict for each register size, records the peak memory allocated by each stage and writes the
+results as JSON so runs can be compared before deployment.
+
+Usage:
+    python benchmarks/bench_pipeline.py --sizes 1000 10000 100000 --output benchmarks/results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from synthetic import generate_dashboard, generate_sms_register, generate_actioned
+
+
+def measure(stage, n_patients, func, *args, **kwargs):
+    """
+    Runs one benchmark stage and records its wall time and peak traced memory.
+
+    Returns:
+    - tuple: (result of func or None, result record as a dict)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result, error = None, None
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    record = {
+        "stage": stage,
+        "n_patients": n_patients,
+        "seconds": round(seconds, 6),
+        "peak_mb": round(peak / 1024 ** 2, 3),
+        "error": error,
+    }
+    status = "✅" if error is None else f"❌ {error}"
+    print(f"{stage:<32} {n_patients:>9} {seconds:>10.3f}s {record['peak_mb']:>10.1f} MB  {status}")
+    return result, record
+
+
+def run_predict(df):
+    """Imports and runs predict, so import failures are recorded against the predict stage."""
+    from predict import predict
+    return predict(df.copy(), df[["nhs_number", "hba1c_value"]])
+
+
+def run_recall_schedule(due_patients, sms_df, actioned_df, tests):
+    """Schedules the due patients into weekly waves and splits the SMS rows per wave."""
+    from recallscheduler import schedule_recall, wave_cohorts
+    schedule = schedule_recall(due_patients, sms_df, actioned_df, tests, hca_capacity=100, clinician_capacity=20)
+    return wave_cohorts(schedule, sms_df, "recall_sms.csv")
+
+
+def bench_size(n_patients, seed=0):
+    """Runs every pipeline stage on a synthetic register of `n_patients` patients."""
+    from main import (
+        preprocess_dashboard,
+        filter_due_patients,
+        extract_sms_df,
+        plot_histograms,
+        plot_columns,
+        date_cols,
+    )
+
+    records = []
+    dashboard = generate_dashboard(n_patients, seed=seed)
+    sms_df = generate_sms_register(dashboard, seed=seed)
+    actioned_df = generate_actioned(dashboard, seed=seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "diabetes_dashboard.csv")
+        dashboard.to_csv(path, index=False)
+        del dashboard
+
+        # Uncached and in this process, so every run does the full work and its memory is measured
+        df, record = measure("preprocess_dashboard", n_patients,
+                             preprocess_dashboard, path, date_cols)
+        records.append(record)
+
+    if df is None:
+        return records
+
+    recall_tests = ["annual_review_done", "foot_risk"]
+    due_patients, record = measure("filter_due_patients", n_patients,
+                                   filter_due_patients, df, recall_tests)
+    records.append(record)
+
+    _, record = measure("extract_sms_df", n_patients, extract_sms_df, df, sms_df, actioned_df)
+    records.append(record)
+
+    _, record = measure("schedule_recall", n_patients,
+                        run_recall_schedule, due_patients, sms_df, actioned_df, recall_tests)
+    records.append(record)
+
+    _, record = measure("plot_histograms", n_patients, plot_histograms, df, plot_columns)
+    plt.close("all")
+    records.append(record)
+
+    _, record = measure("predict", n_patients, run_predict, df)
+    records.append(record)
+
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard pipeline on synthetic registers.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="Register sizes to benchmark.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data.")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results.json"),
+                        help="Path of the JSON results file.")
+    args = parser.parse_args()
+
+    records = []
+    for n_patients in args.sizes:
+        records.extend(bench_size(n_patients, seed=args.seed))
+
+    results = {
+        "benchmark": "pipeline",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": records,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
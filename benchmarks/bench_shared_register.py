@@ -0,0 +1,95 @@
+"""
+Measures the memory each additional session costs with the shared, memory-mapped register
+(sharedregister.py) compared with a pickled copy per session (what st.cache_data does).
+
+A synthetic dashboard is preprocessed and published once. Then:
+- in this process, `--sessions` sessions open the register, and separately `--sessions` pickled
+  copies are made; the private (anonymous) memory added per session is reported for each;
+- `--processes` separate processes map the same file and read every column, and report their
+  private memory and the file-backed memory they share with each other.
+
+Memory is read from /proc, so this runs on Linux only.
+
+Usage:
+    python benchmarks/bench_shared_register.py --patients 100000 --sessions 20 --processes 4
+"""
+
+import argparse
+import gc
+import multiprocessing
+import os
+import pickle
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import generate_dashboard  # noqa: E402
+
+
+def process_memory_mb():
+    """Returns this process's private (RssAnon) and file-backed (RssFile) resident memory in MB."""
+    memory = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                name, value, _ = line.split()
+                memory[name.rstrip(":")] = int(value) / 1024
+    return memory["RssAnon"], memory["RssFile"]
+
+
+def per_session_mb(open_session, sessions):
+    """Returns the private memory added per session by `sessions` calls of open_session."""
+    gc.collect()
+    before, _ = process_memory_mb()
+    kept = [open_session() for _ in range(sessions)]
+    after, _ = process_memory_mb()
+    del kept
+    return (after - before) / sessions
+
+
+def read_register(path):
+    """Opens the register in a fresh process, reads every column, and returns its memory use."""
+    import sharedregister
+
+    private_before, _ = process_memory_mb()
+    df = sharedregister.open_register(path)
+    for col in df.columns:
+        # Touch every value, so the mapped pages are actually read
+        df[col].isna().sum()
+    private_after, shared = process_memory_mb()
+    return private_after - private_before, shared
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patients", type=int, default=100_000, help="Size of the synthetic register.")
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions opened in this process.")
+    parser.add_argument("--processes", type=int, default=4, help="Server processes mapping the register.")
+    args = parser.parse_args()
+
+    import sharedregister
+    from main import date_cols, preprocess_dashboard
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "diabetes_dashboard.csv")
+        generate_dashboard(args.patients).to_csv(csv_path, index=False)
+        df = preprocess_dashboard(csv_path, date_cols)
+        path = sharedregister.publish(df, os.path.join(tmp, "register-bench.arrow"))
+        size_mb = os.path.getsize(path) / 1024 ** 2
+
+        mapped = per_session_mb(lambda: sharedregister.open_register(path).copy(deep=False), args.sessions)
+        pickled_df = pickle.dumps(df)
+        pickled = per_session_mb(lambda: pickle.loads(pickled_df), args.sessions)
+
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            processes = pool.map(read_register, [path] * args.processes)
+
+    print(f"📦 Register: {args.patients} patients, {size_mb:.1f} MB file")
+    print(f"🧠 Private memory per session: {mapped:.2f} MB memory-mapped, {pickled:.2f} MB pickled copy")
+    for i, (private, shared) in enumerate(processes, 1):
+        print(f"🖥️ Process {i}: {private:.2f} MB private for the register, {shared:.1f} MB file-backed (shared)")
+
+
+if __name__ == "__main__":
+    main()
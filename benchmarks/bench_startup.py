@@ -0,0 +1,103 @@
+"""
+Startup-time benchmark for the dashboard.
+
+Each scenario runs in a fresh Python process, so the timings reflect a container cold start:
+importing main and predict, and the first render of app.py (the "Quick Start" tab) through
+Streamlit's AppTest. For each scenario the heavy dependencies that ended up imported are listed,
+which shows whether the import-on-first-use layer is doing its job.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 5 --output benchmarks/results_startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies that should only load when a tab needs them
+HEAVY_MODULES = [
+    "matplotlib.pyplot",
+    "seaborn",
+    "gspread",
+    "notion_client",
+    "sklearn",
+    "joblib",
+    "jan883_eda",
+    "streamlit_pdf_viewer",
+]
+
+SCENARIOS = {
+    "import_main": "import main",
+    "import_predict": "import predict",
+    "app_first_render": (
+        "from streamlit.testing.v1 import AppTest\n"
+        "at = AppTest.from_file('app.py', default_timeout=120).run()\n"
+        "assert not at.exception, at.exception"
+    ),
+}
+
+RUNNER = """
+import json, sys, time
+start = time.perf_counter()
+exec(compile({code!r}, "<scenario>", "exec"))
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def run_scenario(code):
+    """Runs a scenario in a fresh interpreter and returns its timing record (or an error)."""
+    script = RUNNER.format(code=code, heavy=HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import and first render times.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario.")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results_startup.json"),
+                        help="Path of the JSON results file.")
+    args = parser.parse_args()
+
+    records = []
+    for name, code in SCENARIOS.items():
+        runs = [run_scenario(code) for _ in range(args.repeat)]
+        errors = [run["error"] for run in runs if "error" in run]
+        timings = [run["seconds"] for run in runs if "seconds" in run]
+        record = {
+            "scenario": name,
+            "runs": len(timings),
+            "median_seconds": round(statistics.median(timings), 4) if timings else None,
+            "min_seconds": round(min(timings), 4) if timings else None,
+            "heavy_modules_loaded": runs[-1].get("loaded", []),
+            "error": errors[0] if errors else None,
+        }
+        records.append(record)
+        status = "✅" if not errors else f"❌ {errors[0]}"
+        print(f"{name:<20} {record['median_seconds'] or 0:>8.3f}s  loaded={record['heavy_modules_loaded']}  {status}")
+
+    results = {
+        "benchmark": "startup",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": records,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
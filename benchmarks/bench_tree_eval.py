@@ -0,0 +1,131 @@
+"""
+Benchmark of the compiled tree-ensemble evaluator (treeeval.py) against scikit-learn.
+
+For each batch size, random patient feature matrices (drawn around the scaler's training means)
+are predicted with GradientBoostingRegressor.predict and with CompiledEnsemble.predict_scaled on
+the same scaled inputs. The largest absolute difference is checked against the tolerance. The
+time to load the joblib model and the compiled .npz artifact is measured in fresh processes,
+since the joblib load also pays for importing scikit-learn.
+
+Usage:
+    python benchmarks/bench_tree_eval.py --sizes 1000 10000 100000 --output benchmarks/results_tree_eval.json
+"""
+
+import argparse
+import json
+import os
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from treeeval import CompiledEnsemble, compile_model  # noqa: E402
+
+MODEL_PATH = os.path.join(ROOT, "models", "gradient_boosting_model_13nov24.joblib")
+COMPILED_PATH = os.path.join(ROOT, "models", "gradient_boosting_model_13nov24.npz")
+SCALER_PATH = os.path.join(ROOT, "models", "scaler_StandardScaler_2024-11-13_17-59-35.pkl")
+
+TOLERANCE = 1e-9
+
+LOAD_SCENARIOS = {
+    "joblib": f"import joblib; joblib.load({MODEL_PATH!r})",
+    "compiled": f"from treeeval import CompiledEnsemble; CompiledEnsemble.load({COMPILED_PATH!r})",
+}
+
+
+def best_of(func, repeat):
+    """Returns the median wall time of `repeat` calls and the result of the last one."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def load_seconds(code):
+    """Times a model load in a fresh interpreter (including the imports it needs)."""
+    script = f"import time; start = time.perf_counter(); {code}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compiled tree evaluator against scikit-learn.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Numbers of patients to predict for.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the feature matrices.")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results_tree_eval.json"),
+                        help="Path of the JSON results file.")
+    args = parser.parse_args()
+
+    import joblib
+
+    # The model was fitted on a DataFrame; plain arrays are passed here on purpose
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    model = joblib.load(MODEL_PATH)
+    with open(SCALER_PATH, "rb") as f:
+        scaler = pickle.load(f)
+    if not os.path.exists(COMPILED_PATH):
+        compile_model(MODEL_PATH, COMPILED_PATH, SCALER_PATH)
+    compiled = CompiledEnsemble.load(COMPILED_PATH)
+
+    rng = np.random.default_rng(args.seed)
+    records = []
+    for n in args.sizes:
+        X = scaler.mean_ + rng.normal(size=(n, len(scaler.mean_))) * scaler.scale_
+        X_scaled = compiled.scale(X)
+        sklearn_seconds, expected = best_of(lambda: model.predict(X_scaled), args.repeat)
+        compiled_seconds, actual = best_of(lambda: compiled.predict_scaled(X_scaled), args.repeat)
+        max_abs_diff = float(np.abs(expected - actual).max())
+        record = {
+            "rows": n,
+            "sklearn_seconds": round(sklearn_seconds, 5),
+            "compiled_seconds": round(compiled_seconds, 5),
+            "speedup": round(sklearn_seconds / compiled_seconds, 2),
+            "max_abs_diff": max_abs_diff,
+            "within_tolerance": max_abs_diff <= TOLERANCE,
+        }
+        records.append(record)
+        status = "✅" if record["within_tolerance"] else "❌"
+        print(f"{n:>8} rows  sklearn {sklearn_seconds:.4f}s  compiled {compiled_seconds:.4f}s  "
+              f"x{record['speedup']:<6} max diff {max_abs_diff:.2e} {status}")
+
+    load = {}
+    for name, code in LOAD_SCENARIOS.items():
+        timings = [t for t in (load_seconds(code) for _ in range(args.repeat)) if t is not None]
+        load[name] = {
+            "median_seconds": round(statistics.median(timings), 4) if timings else None,
+            "size_bytes": os.path.getsize(MODEL_PATH if name == "joblib" else COMPILED_PATH),
+        }
+        print(f"load {name:<9} {load[name]['median_seconds'] or 0:.4f}s  {load[name]['size_bytes'] / 1024:.0f} KB")
+
+    results = {
+        "benchmark": "tree_eval",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "n_trees": compiled.n_trees,
+        "n_nodes": len(compiled.feature),
+        "results": records,
+        "load": load,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Checks the shared HTTP transport against local Notion and Google Sheets stub servers.
+
+Runs several concurrent Notion and Sheets loads while the stubs answer every Nth request with
+429, then checks that:
+- every load returned all rows (rate limits were retried, not raised);
+- the service account token was fetched once and reused;
+- no stub saw more concurrent requests than the host's limit in httptransport.ENDPOINT_LIMITS;
+- connections were reused (far fewer TCP connections than requests).
+
+Usage:
+    python benchmarks/check_transport.py --loads 8 --throttle-every 5
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httptransport  # noqa: E402
+from stubservers import NotionStub, SheetsStub, service_account_info  # noqa: E402
+
+DATABASE_ID = "stub-database"
+SHEET_URL = "https://docs.google.com/spreadsheets/d/stub-sheet/edit"
+
+
+def fetch_notion(token):
+    """Pages through the stub database with the shared Notion client; returns the number of rows."""
+    client = httptransport.notion_client(token)
+    rows, cursor = 0, None
+    while True:
+        body = {"start_cursor": cursor} if cursor else {}
+        page = client.request(path=f"databases/{DATABASE_ID}/query", method="POST", body=body)
+        rows += len(page["results"])
+        if not page["has_more"]:
+            return rows
+        cursor = page["next_cursor"]
+
+
+def fetch_sheet(credentials):
+    """Loads the stub worksheet with the shared gspread client; returns the number of rows."""
+    sheet = httptransport.sheets_client(credentials).open_by_url(SHEET_URL).get_worksheet_by_id(0)
+    return len(sheet.get_all_records())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--loads", type=int, default=8, help="Concurrent loads per API.")
+    parser.add_argument("--rows", type=int, default=500, help="Rows served by each stub.")
+    parser.add_argument("--throttle-every", type=int, default=5, help="Answer every Nth request with 429.")
+    args = parser.parse_args()
+
+    httptransport.BACKOFF_BASE = 0.05
+    stub_options = {"latency": 0.02, "throttle_every": args.throttle_every, "retry_after": 0.05}
+    with NotionStub(pages=args.rows, **stub_options) as notion, SheetsStub(rows=args.rows, **stub_options) as sheets:
+        httptransport.ENDPOINT_OVERRIDES.update({**notion.overrides(), **sheets.overrides()})
+        credentials = service_account_info()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=2 * args.loads) as executor:
+            notion_loads = [executor.submit(fetch_notion, "stub-token") for _ in range(args.loads)]
+            sheet_loads = [executor.submit(fetch_sheet, credentials) for _ in range(args.loads)]
+            notion_rows = [load.result() for load in notion_loads]
+            sheet_rows = [load.result() for load in sheet_loads]
+        seconds = time.perf_counter() - start
+
+        notion_stats, sheets_stats = notion.stats(), sheets.stats()
+
+    print(f"⏱️ {2 * args.loads} loads in {seconds:.2f}s")
+    print(f"📒 Notion stub: {notion_stats}")
+    print(f"📗 Sheets stub: {sheets_stats}")
+    print(f"🔁 Transport: {httptransport.transport_stats()}")
+
+    checks = {
+        "all Notion rows loaded": notion_rows == [args.rows] * args.loads,
+        "all Sheets rows loaded": sheet_rows == [args.rows] * args.loads,
+        "429s were retried": notion_stats["throttled"] > 0 and sheets_stats["throttled"] > 0,
+        "token fetched once": sheets_stats["token_requests"] == 1,
+        "Notion concurrency limit held": notion_stats["peak_in_flight"] <= httptransport.ENDPOINT_LIMITS["api.notion.com"],
+        # The Sheets stub also serves the token and access boundary hosts
+        "Sheets concurrency limit held": sheets_stats["peak_in_flight"] <= sum(
+            httptransport.ENDPOINT_LIMITS.get(urlsplit(origin).hostname, httptransport.DEFAULT_ENDPOINT_LIMIT)
+            for origin in SheetsStub.origins
+        ),
+        "connections reused": notion_stats["connections"] <= httptransport.POOL_SIZE
+        and sheets_stats["connections"] <= 2 * httptransport.POOL_SIZE,
+    }
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
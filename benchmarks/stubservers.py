@@ -0,0 +1,299 @@
+"""
+Local stub servers for the Notion and Google Sheets APIs.
+
+The stubs serve the few endpoints the loaders call (the Notion database query, and the Sheets
+token, spreadsheet metadata and values endpoints) with generated patient rows. They can add
+latency, enforce a requests-per-second rate limit, answer every Nth request with 429 or inject
+server errors, and they record how many requests, bytes and TCP connections they received and
+the peak number of requests in flight, so the shared transport's pooling, retries and
+concurrency limits, and the loaders' throughput, can be checked without network access.
+
+Usage:
+    with NotionStub(pages=500, throttle_every=5) as notion, SheetsStub(rows=500) as sheets:
+        httptransport.ENDPOINT_OVERRIDES.update(notion.overrides() | sheets.overrides())
+        ...
+"""
+
+import json
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+
+class StubServer:
+    """
+    Class StubServer
+    ----------------
+    A threaded HTTP/1.1 (keep-alive) server on a free local port.
+
+    Parameters:
+    - latency (float): Seconds each request takes.
+    - throttle_every (int): Answer every Nth request with 429 (0 to never throttle).
+    - retry_after (float): The Retry-After sent with a 429.
+    - rate_limit (float): Requests accepted per second; the rest get 429 (0 for no limit).
+    - fail_every (int): Answer every Nth request with `fail_status` (0 to never fail).
+    - fail_status (int): The server error injected by fail_every.
+
+    Methods:
+    - route: Returns (status, payload) for a request; implemented by subclasses.
+    - overrides: Returns the HTTP_ENDPOINT_OVERRIDES entries that point the real hosts here.
+    - stats: Returns the request, throttle, error, byte, connection and peak concurrency counts.
+    - reset: Sets the counts back to zero.
+    """
+
+    origins = ()
+
+    def __init__(self, latency=0.01, throttle_every=0, retry_after=0.05, rate_limit=0, fail_every=0, fail_status=503):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.rate_limit = rate_limit
+        self.fail_every = fail_every
+        self.fail_status = fail_status
+        self._lock = threading.Lock()
+        self._accepted = deque()
+        self.in_flight = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.throttled = self.failed = self.connections = self.peak_in_flight = 0
+            self.bytes_received = self.bytes_sent = 0
+            self.paths = []
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, payload, headers = stub._dispatch(self.command, self.path, self.headers, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                with stub._lock:
+                    stub.bytes_received += len(body)
+                    stub.bytes_sent += len(data)
+
+            do_GET = do_POST = do_PUT = _handle
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
+
+    def _over_rate_limit(self):
+        """Returns the seconds until a request is accepted again, or 0 if this one is (holds _lock)."""
+        if not self.rate_limit:
+            return 0
+        now = time.monotonic()
+        while self._accepted and now - self._accepted[0] >= 1:
+            self._accepted.popleft()
+        if len(self._accepted) >= self.rate_limit:
+            return 1 - (now - self._accepted[0])
+        self._accepted.append(now)
+        return 0
+
+    def _dispatch(self, method, path, headers, body):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            wait = self._over_rate_limit()
+            throttle = wait or (self.throttle_every and self.requests % self.throttle_every == 0)
+            fail = not throttle and self.fail_every and self.requests % self.fail_every == 0
+            self.paths.append(path)
+        try:
+            time.sleep(self.latency)
+            if throttle:
+                with self._lock:
+                    self.throttled += 1
+                retry_after = f"{max(wait, self.retry_after):.3f}"
+                return 429, {"object": "error", "code": "rate_limited"}, {"Retry-After": retry_after}
+            if fail:
+                with self._lock:
+                    self.failed += 1
+                return self.fail_status, {"object": "error", "code": "service_unavailable"}, {}
+            is_json = headers.get("Content-Type", "").startswith("application/json") and body.strip()
+            status, payload = self.route(method, urlsplit(path), headers, json.loads(body) if is_json else {})
+            return status, payload, {}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def route(self, method, url, headers, body):
+        raise NotImplementedError
+
+    def overrides(self):
+        """Returns {real origin: stub URL} for httptransport.ENDPOINT_OVERRIDES."""
+        return {origin: self.url for origin in self.origins}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "failed": self.failed,
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+                "connections": self.connections,
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+
+def patient_rows(count, seed=0):
+    """Returns `count` generated actioned-patient rows, with valid NHS numbers."""
+    import numpy as np
+    from synthetic import generate_nhs_numbers
+
+    nhs_numbers = generate_nhs_numbers(count, np.random.default_rng(seed)).tolist()
+    return [
+        {
+            "nhs_number": nhs_numbers[i],
+            "name": f"Patient {i}",
+            "status": ("Invited", "Booked", "Declined")[i % 3],
+            "date": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "notes": f"Recall wave {i % 7 + 1}",
+        }
+        for i in range(count)
+    ]
+
+
+# First Notion API version without database queries (replaced by data_sources/<id>/query)
+NOTION_DATA_SOURCES_VERSION = "2025-09-03"
+
+
+class NotionStub(StubServer):
+    """
+    Serves POST /v1/databases/<id>/query with cursor pagination over generated pages. Like
+    Notion, it rejects the query for API versions that replaced it with data source queries.
+
+    Parameters:
+    - pages (int): Number of database pages (rows) served.
+    - page_size (int): Most results per response (Notion's maximum is 100).
+    """
+
+    origins = ("https://api.notion.com",)
+
+    def __init__(self, pages=500, page_size=100, **kwargs):
+        super().__init__(**kwargs)
+        self.rows = patient_rows(pages)
+        self.page_size = page_size
+
+    def route(self, method, url, headers, body):
+        if method != "POST" or not re.fullmatch(r"/v1/databases/[^/]+/query", url.path):
+            return 404, {"object": "error", "code": "object_not_found"}
+        if not headers.get("Authorization", "").startswith("Bearer "):
+            return 401, {"object": "error", "code": "unauthorized"}
+        version = headers.get("Notion-Version", "")
+        if not version or version >= NOTION_DATA_SOURCES_VERSION:
+            return 400, {"object": "error", "code": "invalid_request_url", "message": f"Notion-Version {version!r}"}
+        start = int(body.get("start_cursor") or 0)
+        end = min(start + min(int(body.get("page_size") or self.page_size), self.page_size), len(self.rows))
+        results = [
+            {
+                "object": "page",
+                "id": f"page-{start + i}",
+                "properties": {
+                    "Name": {"type": "title", "title": [{"plain_text": row["name"]}]},
+                    "NHS number": {"type": "number", "number": row["nhs_number"]},
+                    "Status": {"type": "select", "select": {"name": row["status"]}},
+                    "Actioned": {"type": "date", "date": {"start": row["date"]}},
+                    "Notes": {"type": "rich_text", "rich_text": [{"plain_text": row["notes"]}]},
+                },
+            }
+            for i, row in enumerate(self.rows[start:end])
+        ]
+        has_more = end < len(self.rows)
+        return 200, {"object": "list", "results": results, "has_more": has_more, "next_cursor": str(end) if has_more else None}
+
+
+class SheetsStub(StubServer):
+    """Serves the OAuth token, access boundary, Sheets metadata and Sheets values endpoints for one worksheet."""
+
+    origins = ("https://oauth2.googleapis.com", "https://sheets.googleapis.com", "https://iamcredentials.googleapis.com")
+
+    def __init__(self, rows=500, **kwargs):
+        super().__init__(**kwargs)
+        self.rows = patient_rows(rows)
+
+    def route(self, method, url, headers, body):
+        if url.path == "/token":
+            with self._lock:
+                self.token_requests += 1
+            return 200, {"access_token": f"stub-token-{self.token_requests}", "expires_in": 3600, "token_type": "Bearer"}
+        if url.path.endswith("/allowedLocations"):
+            # google-auth's regional access boundary lookup
+            return 200, {"encodedLocations": "0x0", "locations": []}
+        if not headers.get("Authorization", "").startswith("Bearer "):
+            return 401, {"error": {"code": 401, "message": "unauthenticated", "status": "UNAUTHENTICATED"}}
+
+        match = re.fullmatch(r"/v4/spreadsheets/([^/]+)(/values/(.+))?", url.path)
+        if not match:
+            return 404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}}
+        if match.group(2) is None:
+            return 200, {
+                "spreadsheetId": match.group(1),
+                "properties": {"title": "Actioned patients"},
+                "sheets": [{"properties": {
+                    "sheetId": 0, "title": "Sheet1", "index": 0, "sheetType": "GRID",
+                    "gridProperties": {"rowCount": len(self.rows) + 1, "columnCount": 5},
+                }}],
+            }
+        values = [["NHS number", "Name", "Status", "Actioned", "Notes"]] + [
+            [str(row["nhs_number"]), row["name"], row["status"], row["date"], row["notes"]] for row in self.rows
+        ]
+        return 200, {"range": unquote(match.group(3)), "majorDimension": "ROWS", "values": values}
+
+    def reset(self):
+        super().reset()
+        self.token_requests = 0
+
+    def stats(self):
+        return {**super().stats(), "token_requests": self.token_requests}
+
+
+def service_account_info():
+    """Returns a service account key (with a freshly generated RSA key) for use against SheetsStub."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    return {
+        "type": "service_account",
+        "project_id": "stub",
+        "private_key_id": "stub",
+        "private_key": pem,
+        "client_email": "loader@stub.iam.gserviceaccount.com",
+        "client_id": "1",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
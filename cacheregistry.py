@@ -0,0 +1,366 @@
+"""
+This module contains a registry of the app's Streamlit caches with hit, miss, size, age and
+eviction statistics.
+
+Loaders are wrapped with `tracked_cache`, which applies the usual `st.cache_data` or
+`st.cache_resource` decorator and detects misses by probing whether the wrapped function ran.
+Entries are dropped from the registry when Streamlit would drop them: after the cache's `ttl`,
+and least recently used first beyond its `max_entries`. Any other miss for an entry the registry
+had already seen (e.g. the cache was cleared) also counts as an eviction.
+
+Statistics are written to a JSON snapshot so they can be inspected from the command line:
+    python cacheregistry.py show
+    python cacheregistry.py invalidate load_notion_df [entry_key]
+Invalidation requests from the command line are applied on the app's next rerun.
+"""
+
+import argparse
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+# Where the app writes its cache statistics and reads invalidation requests from
+CACHE_STATS_PATH = os.environ.get(
+    "CACHE_STATS_PATH", os.path.join(tempfile.gettempdir(), "a1sense_cache_stats.json")
+)
+CACHE_INVALIDATE_PATH = CACHE_STATS_PATH.replace(".json", "_invalidate.jsonl")
+
+# Minimum number of seconds between two snapshot writes
+SNAPSHOT_INTERVAL = 2.0
+
+_PRIMITIVES = (str, int, float, bool, type(None))
+
+
+def _hash_arg(value):
+    """
+    Returns a short, content-based hash of a cache argument.
+    Strings (e.g. Notion tokens and Google Sheet URLs) are hashed too, so entry keys - which are
+    shown in the app and written to the statistics snapshot - never contain them.
+    """
+    if isinstance(value, str):
+        return "str:" + hashlib.sha1(value.encode()).hexdigest()[:12]
+    if isinstance(value, _PRIMITIVES):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        joined = "[" + ",".join(_hash_arg(v) for v in value) + "]"
+        return joined if len(joined) <= 64 else "list:" + hashlib.sha1(joined.encode()).hexdigest()[:12]
+    if isinstance(value, pd.DataFrame):
+        digest = hashlib.sha1(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        return "df:" + digest.hexdigest()[:12]
+    if hasattr(value, "getvalue"):
+        # Uploaded files are identified by their contents, like st.cache_data does
+        return "file:" + hashlib.sha1(value.getvalue()).hexdigest()[:12]
+    return type(value).__name__ + ":" + hashlib.sha1(repr(value).encode()).hexdigest()[:12]
+
+
+def _is_primitive(value):
+    if isinstance(value, (list, tuple)):
+        return all(_is_primitive(v) for v in value)
+    return isinstance(value, _PRIMITIVES)
+
+
+def estimate_size(value):
+    """
+    Estimates the memory held by a cached value in bytes.
+
+    DataFrames use their deep memory usage, bytes use their length and tuples are summed.
+    Other values fall back to their pickled size.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(v) for v in value)
+    if isinstance(value, str):
+        return len(value.encode())
+    try:
+        return len(pickle.dumps(value))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def ttl_seconds(ttl):
+    """Returns a Streamlit cache ttl (seconds, timedelta or a string such as "1h") in seconds."""
+    if ttl is None or isinstance(ttl, (int, float)):
+        return ttl
+    return pd.Timedelta(ttl).total_seconds()
+
+
+class CacheStats:
+    """
+    Class CacheStats
+    ----------------
+    Statistics for one registered cache.
+
+    Attributes:
+    - name: The cache name (the loader's function name).
+    - kind: "data" or "resource".
+    - hits, misses, evictions: Counters since the server started.
+    - entries: Maps each entry key to its size, creation time, hit count and (when the
+      arguments are simple values) the arguments needed to invalidate just that entry, least
+      recently used first.
+    - max_entries, ttl: The cache's limits (None for unlimited); ttl in seconds.
+    """
+
+    def __init__(self, name, kind, cached_func, max_entries=None, ttl=None):
+        self.name = name
+        self.kind = kind
+        self.cached_func = cached_func
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds(ttl)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        """Drops the entries Streamlit has expired or evicted (call with the lock held)."""
+        if self.ttl is not None:
+            for key in [key for key, e in self.entries.items() if now - e["created"] >= self.ttl]:
+                del self.entries[key]
+                self.evictions += 1
+        while self.max_entries is not None and len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]
+            self.evictions += 1
+
+    def record_miss(self, key, value, args, kwargs, seconds):
+        now = time.time()
+        with self.lock:
+            self.misses += 1
+            if self.entries.pop(key, None) is not None:
+                self.evictions += 1
+            self.entries[key] = {
+                "size_bytes": estimate_size(value),
+                "created": now,
+                "compute_seconds": round(seconds, 4),
+                "hits": 0,
+                "args": (args, kwargs) if _is_primitive(list(args) + list(kwargs.values())) else None,
+            }
+            self._expire(now)
+
+    def record_hit(self, key):
+        with self.lock:
+            self.hits += 1
+            if key in self.entries:
+                # Moved to the end: the most recently used entry is evicted last
+                self.entries[key] = self.entries.pop(key)
+                self.entries[key]["hits"] += 1
+            self._expire(time.time())
+
+    def invalidate(self, key=None):
+        """
+        Invalidates one entry, or the whole cache if `key` is None.
+        Entries created with non-primitive arguments (e.g. uploaded files) can only be dropped
+        together with the rest of the cache.
+
+        Returns:
+        - bool: True if only the requested entry was cleared.
+        """
+        with self.lock:
+            entry = self.entries.get(key) if key is not None else None
+            if entry is not None and entry["args"] is not None:
+                args, kwargs = entry["args"]
+                self.cached_func.clear(*args, **kwargs)
+                del self.entries[key]
+                return True
+            self.cached_func.clear()
+            self.entries.clear()
+            return False
+
+    def summary(self):
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            lookups = self.hits + self.misses
+            return {
+                "cache": self.name,
+                "kind": self.kind,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size_mb": round(sum(e["size_bytes"] for e in self.entries.values()) / 1024 ** 2, 3),
+                "entry_details": [
+                    {
+                        "key": key,
+                        "size_mb": round(e["size_bytes"] / 1024 ** 2, 3),
+                        "age_seconds": round(now - e["created"], 1),
+                        "compute_seconds": e["compute_seconds"],
+                        "hits": e["hits"],
+                        "invalidatable": e["args"] is not None,
+                    }
+                    for key, e in self.entries.items()
+                ],
+            }
+
+
+class CacheRegistry:
+    """
+    Class CacheRegistry
+    -------------------
+    Process-wide registry of tracked caches.
+
+    Methods:
+    - register: Registers a cache's statistics.
+    - stats: Returns a summary of every cache.
+    - invalidate: Invalidates a cache entry, or a whole cache.
+    - write_snapshot: Writes the statistics to CACHE_STATS_PATH for the CLI.
+    - apply_invalidation_requests: Applies invalidations queued by the CLI.
+    """
+
+    def __init__(self):
+        self.caches = {}
+        self._last_snapshot = 0.0
+
+    def register(self, stats):
+        self.caches[stats.name] = stats
+
+    def stats(self):
+        return [cache.summary() for cache in self.caches.values()]
+
+    def invalidate(self, name, key=None):
+        if name not in self.caches:
+            raise KeyError(f"Unknown cache '{name}'.")
+        result = self.caches[name].invalidate(key)
+        self.write_snapshot(force=True)
+        return result
+
+    def write_snapshot(self, force=False):
+        now = time.time()
+        if not force and now - self._last_snapshot < SNAPSHOT_INTERVAL:
+            return
+        self._last_snapshot = now
+        snapshot = {"pid": os.getpid(), "written": now, "caches": self.stats()}
+        try:
+            tmp_path = CACHE_STATS_PATH + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f, indent=2)
+            os.replace(tmp_path, CACHE_STATS_PATH)
+        except OSError:
+            pass
+
+    def apply_invalidation_requests(self):
+        """Applies invalidation requests queued with `python cacheregistry.py invalidate`."""
+        if not os.path.exists(CACHE_INVALIDATE_PATH):
+            return
+        processing_path = CACHE_INVALIDATE_PATH + f".{os.getpid()}"
+        try:
+            os.replace(CACHE_INVALIDATE_PATH, processing_path)
+        except OSError:
+            return
+        with open(processing_path) as f:
+            for line in f:
+                request = json.loads(line)
+                if request["cache"] in self.caches:
+                    self.invalidate(request["cache"], request.get("key"))
+        os.remove(processing_path)
+
+
+registry = CacheRegistry()
+
+
+def tracked_cache(kind="data", **cache_kwargs):
+    """
+    Decorator that caches a function with st.cache_data (kind="data") or st.cache_resource
+    (kind="resource") and tracks it in the registry.
+
+    Parameters:
+    - kind (str): "data" or "resource".
+    - **cache_kwargs: Passed on to the Streamlit cache decorator (e.g. ttl, max_entries).
+    """
+    import streamlit as st
+
+    cache_decorator = st.cache_data if kind == "data" else st.cache_resource
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        probe = threading.local()
+
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            start = time.perf_counter()
+            value = func(*args, **kwargs)
+            probe.computed = (value, time.perf_counter() - start)
+            return value
+
+        cached_func = cache_decorator(**cache_kwargs)(compute) if cache_kwargs else cache_decorator(compute)
+        stats = CacheStats(
+            func.__name__, kind, cached_func,
+            max_entries=cache_kwargs.get("max_entries"), ttl=cache_kwargs.get("ttl"),
+        )
+        registry.register(stats)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            key = "|".join(
+                f"{name}={_hash_arg(value)}"
+                for name, value in bound.arguments.items()
+                if not name.startswith("_")
+            )
+            probe.computed = None
+            value = cached_func(*args, **kwargs)
+            if probe.computed is not None:
+                stats.record_miss(key, probe.computed[0], args, kwargs, probe.computed[1])
+            else:
+                stats.record_hit(key)
+            registry.write_snapshot()
+            return value
+
+        wrapper.clear = cached_func.clear
+        wrapper.__wrapped__ = func
+        wrapper.cache_stats = stats
+        return wrapper
+
+    return decorator
+
+
+def stats_dataframe(stats):
+    """Returns a one-row-per-cache summary DataFrame of registry statistics."""
+    columns = ["cache", "kind", "hits", "misses", "hit_rate", "evictions", "entries", "size_mb"]
+    return pd.DataFrame([{col: s[col] for col in columns} for s in stats], columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and invalidate the dashboard's Streamlit caches.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show = subparsers.add_parser("show", help="Show cache statistics from the running app.")
+    show.add_argument("--entries", action="store_true", help="Also list individual cache entries.")
+    invalidate = subparsers.add_parser("invalidate", help="Invalidate a cache entry on the app's next rerun.")
+    invalidate.add_argument("cache", help="Cache name, e.g. load_notion_df.")
+    invalidate.add_argument("key", nargs="?", default=None, help="Entry key (omit to clear the whole cache).")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        if not os.path.exists(CACHE_STATS_PATH):
+            print(f"No cache statistics found at {CACHE_STATS_PATH}. Is the app running?")
+            return
+        with open(CACHE_STATS_PATH) as f:
+            snapshot = json.load(f)
+        age = time.time() - snapshot["written"]
+        print(f"Cache statistics from pid {snapshot['pid']}, written {age:.0f}s ago:")
+        print(stats_dataframe(snapshot["caches"]).to_string(index=False))
+        if args.entries:
+            for cache in snapshot["caches"]:
+                for entry in cache["entry_details"]:
+                    print(f"{cache['cache']}: {json.dumps(entry)}")
+    elif args.command == "invalidate":
+        with open(CACHE_INVALIDATE_PATH, "a") as f:
+            f.write(json.dumps({"cache": args.cache, "key": args.key}) + "\n")
+        print(f"Queued invalidation of {args.cache} {args.key or '(all entries)'} - applied on the next rerun.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+This module contains the ad-hoc cohort query engine.
+
+Cohorts are defined as SQL conditions over the loaded Diabetes Dashboard, for example
+    hba1c_value > 75 AND egfr_due AND age < 80
+and run by DuckDB, an in-process analytical database. The dashboard frame is registered with
+DuckDB without copying it. A `register` view adds:
+- a boolean "{col}_due" column for each "{col}_days" column, true when the test was last done
+  more than the chosen due window (15 months by default) ago;
+- an underscore alias for every column whose name isn't a plain SQL identifier
+  (e.g. `rewind_started` for "rewind_-_started").
+
+Named queries are saved in cohort_queries.json, and query results (the matching row positions)
+are cached per loaded register and condition.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+
+from cacheregistry import tracked_cache
+from main import DUE_MONTHS, date_cols, due_threshold_days
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+COHORT_QUERIES_PATH = os.environ.get("COHORT_QUERIES_PATH", os.path.join(ROOT, "cohort_queries.json"))
+
+# Name of the registered frame and of the view queries run against
+RAW_TABLE = "dashboard_raw"
+VIEW = "register"
+ROW_COLUMN = "_row"
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sql_alias(column):
+    """
+    Returns the plain SQL identifier a column can be referred to by, or None if there isn't one.
+
+    Parameters:
+    - column (str): The dashboard column name, e.g. "mh_screen_-_dds_or_phq".
+
+    Returns:
+    - str: e.g. "mh_screen_dds_or_phq"; None if the alias would start with a digit.
+    """
+    alias = re.sub(r"_+", "_", re.sub(r"[^0-9A-Za-z_]", "_", column)).strip("_")
+    return alias if _IDENTIFIER.match(alias) else None
+
+
+def register_view_sql(columns, due_threshold):
+    """
+    Builds the SQL of the `register` view over the registered dashboard frame.
+
+    Parameters:
+    - columns (list): Columns of the registered frame.
+    - due_threshold (int): The smallest "{col}_days" value of a due test (see main.due_threshold_days).
+
+    Returns:
+    - str: The CREATE VIEW statement.
+    """
+    columns = list(columns)
+    select = [_quote(col) for col in columns]
+    names = set(columns)
+    due_expressions = {}
+
+    for col in date_cols:
+        due_col = f"{col}_due"
+        if f"{col}_days" in names and due_col not in names:
+            due_expressions[due_col] = f"{_quote(col + '_days')} >= {int(due_threshold)}"
+            select.append(f"{due_expressions[due_col]} AS {_quote(due_col)}")
+            names.add(due_col)
+
+    for col in sorted(names):
+        if col == ROW_COLUMN:
+            continue
+        alias = sql_alias(col)
+        if alias and alias != col and alias not in names:
+            select.append(f"{_quote(col) if col in columns else due_expressions[col]} AS {alias}")
+            names.add(alias)
+
+    return f"CREATE OR REPLACE VIEW {VIEW} AS SELECT {', '.join(select)} FROM {RAW_TABLE}"
+
+
+class CohortQueryEngine:
+    """
+    Class CohortQueryEngine
+    -----------------------
+    A DuckDB connection with the loaded dashboard registered as the `register` view.
+
+    External file and network access is disabled once the view is created, so conditions typed
+    into the app can only read the register.
+
+    Methods:
+    - columns: Lists the columns conditions can use.
+    - matching_rows: Returns the positions of the rows matching a condition.
+    """
+
+    def __init__(self, df, due_months=DUE_MONTHS):
+        import duckdb
+
+        self.connection = duckdb.connect()
+        # Under copy-on-write the existing columns are shared, not copied
+        self.connection.register(RAW_TABLE, df.assign(**{ROW_COLUMN: np.arange(len(df))}))
+        due_threshold = due_threshold_days(due_months, counted=df.attrs.get("days_since_date"))
+        self.connection.execute(register_view_sql(list(df.columns) + [ROW_COLUMN], due_threshold))
+        self.connection.execute("SET enable_external_access = false")
+        self.connection.execute("SET lock_configuration = true")
+
+    def columns(self):
+        """Returns the names of the columns in the `register` view."""
+        rows = self.connection.execute(f"DESCRIBE {VIEW}").fetchall()
+        return [row[0] for row in rows if row[0] != ROW_COLUMN]
+
+    def matching_rows(self, condition):
+        """
+        Runs a cohort condition against the register.
+
+        Parameters:
+        - condition (str): A SQL boolean expression, e.g. "hba1c_value > 75 AND egfr_due".
+
+        Returns:
+        - np.ndarray: Positions of the matching rows, in register order.
+        """
+        import duckdb
+
+        condition = condition.strip()
+        if not condition:
+            raise ValueError("The cohort condition is empty.")
+        query = f"SELECT {ROW_COLUMN} FROM {VIEW} WHERE ({condition}) ORDER BY {ROW_COLUMN}"
+        try:
+            # Parsed rather than scanned for ';', which may appear in string literals
+            if len(self.connection.extract_statements(query)) != 1:
+                raise ValueError("A cohort condition must be a single expression.")
+            result = self.connection.execute(query).fetchnumpy()
+        except duckdb.Error as e:
+            raise ValueError(str(e).splitlines()[0]) from e
+        return np.asarray(result[ROW_COLUMN], dtype=np.int64)
+
+
+@tracked_cache("data", max_entries=64)
+def run_cohort_query(register_id, condition, _register_df, due_months=DUE_MONTHS):
+    """
+    Runs a cohort condition, caching the result per loaded register, condition and due window.
+
+    Parameters:
+    - register_id (str): Identifies the loaded register (e.g. the uploaded file's id).
+    - condition (str): The cohort condition.
+    - _register_df (pd.DataFrame): The loaded dashboard (not hashed; `register_id` stands for it).
+    - due_months (int): The due window of the "{col}_due" columns.
+
+    Returns:
+    - np.ndarray: Positions of the matching rows.
+    """
+    return CohortQueryEngine(_register_df, due_months).matching_rows(condition)
+
+
+def load_saved_queries(path=COHORT_QUERIES_PATH):
+    """Returns the saved cohort queries as a {name: condition} dictionary."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_query(name, condition, path=COHORT_QUERIES_PATH):
+    """Saves (or replaces) a named cohort query."""
+    queries = load_saved_queries(path)
+    queries[name] = condition.strip()
+    _write_queries(queries, path)
+
+
+def delete_query(name, path=COHORT_QUERIES_PATH):
+    """Deletes a named cohort query."""
+    queries = load_saved_queries(path)
+    queries.pop(name, None)
+    _write_queries(queries, path)
+
+
+def _write_queries(queries, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(queries, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
@@ -0,0 +1,316 @@
+"""
+This module contains the HTTP transport shared by the Notion and Google Sheets loaders.
+
+Both loaders used to build a new client per call, paying a TLS handshake (and, for Sheets, a
+service account token exchange) every time, and failed the whole page on the first 429 from
+either API. The clients built here are created once per credential and reused, and every request
+goes through the same policy:
+- connections are kept alive in a pool per client;
+- 429 responses are retried after a jittered exponential backoff, honouring Retry-After;
+- 5xx responses and connection errors are retried the same way for requests that are safe to
+  repeat (GET/HEAD/PUT/DELETE, and the read-only Notion query/search POSTs);
+- each API host has a concurrency limit (Notion averages about 3 requests per second per
+  integration), so concurrent loaders queue instead of tripping the rate limits.
+
+Notion requests go through httpx (which notion-client uses) and Sheets requests through requests
+(which gspread uses); both transports share the retry policy and the per-host limits.
+
+Hosts can be redirected, e.g. to local stub servers, with
+    HTTP_ENDPOINT_OVERRIDES="https://api.notion.com=http://127.0.0.1:8765,https://sheets.googleapis.com=http://127.0.0.1:8766"
+"""
+
+import email.utils
+import functools
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Retried for every request; 5xx are only retried for requests that are safe to repeat
+RATE_LIMIT_STATUS = 429
+SERVER_ERROR_STATUSES = frozenset({500, 502, 503, 504})
+
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", "30"))
+TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "60"))
+
+# Keep-alive connections per client
+POOL_SIZE = 10
+
+# Concurrent requests allowed per API host
+ENDPOINT_LIMITS = {
+    "api.notion.com": 3,
+    "sheets.googleapis.com": 4,
+    "www.googleapis.com": 4,
+    "oauth2.googleapis.com": 2,
+}
+DEFAULT_ENDPOINT_LIMIT = 4
+
+# Notion endpoints that are sent as POST but only read
+_READ_ONLY_POST_SUFFIXES = ("/query", "/search")
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Notion API version sent with every request. notion-client 3 defaults to 2025-09-03, which
+# replaces database queries (databases/{id}/query, used by NotionHelper) with data source queries
+NOTION_VERSION = "2022-06-28"
+
+SHEETS_SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+
+
+def _parse_overrides(value):
+    overrides = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        origin, _, target = item.partition("=")
+        overrides[origin.rstrip("/")] = target.rstrip("/")
+    return overrides
+
+
+ENDPOINT_OVERRIDES = _parse_overrides(os.environ.get("HTTP_ENDPOINT_OVERRIDES", ""))
+
+_semaphores = {}
+_stats = Counter()
+_lock = threading.Lock()
+
+
+def rewrite_url(url):
+    """Returns the URL with its origin replaced if it is listed in ENDPOINT_OVERRIDES."""
+    for origin, target in ENDPOINT_OVERRIDES.items():
+        if url == origin or url.startswith(origin + "/"):
+            return target + url[len(origin):]
+    return url
+
+
+def endpoint_slot(host):
+    """Returns the semaphore limiting the concurrent requests to an API host."""
+    with _lock:
+        if host not in _semaphores:
+            _semaphores[host] = threading.BoundedSemaphore(ENDPOINT_LIMITS.get(host, DEFAULT_ENDPOINT_LIMIT))
+        return _semaphores[host]
+
+
+def is_retry_safe(method, path):
+    """Checks whether a request can be repeated after a server error without side effects."""
+    method = method.upper()
+    return method in _IDEMPOTENT_METHODS or (method == "POST" and path.rstrip("/").endswith(_READ_ONLY_POST_SUFFIXES))
+
+
+def retry_after_seconds(value):
+    """Parses a Retry-After header (seconds or an HTTP date); returns None if absent or invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Returns how long to wait before retrying.
+
+    Parameters:
+    - attempt (int): The number of the retry (0 for the first).
+    - retry_after (float, optional): The delay the server asked for.
+
+    Returns:
+    - float: Seconds to wait. Without Retry-After this is drawn uniformly from
+      [0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)] ("full jitter"), so clients that were
+      throttled together don't retry together.
+    """
+    if retry_after is not None:
+        return min(BACKOFF_MAX, retry_after) + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _retry_reason(method, path, status=None, error=None):
+    """Returns why a response/error should be retried, or None if it shouldn't."""
+    if status == RATE_LIMIT_STATUS:
+        return "rate limited"
+    if not is_retry_safe(method, path):
+        return None
+    if status in SERVER_ERROR_STATUSES:
+        return f"HTTP {status}"
+    if error is not None:
+        return type(error).__name__
+    return None
+
+
+def _send_with_retries(send, method, url, retryable_errors):
+    """
+    Sends a request with the shared retry policy and per-host concurrency limit.
+
+    `url` is the request's URL before any endpoint override, so limits apply per API host.
+    `send()` performs one attempt and returns (response, status, retry_after header).
+    """
+    parts = urlsplit(url)
+    slot = endpoint_slot(parts.hostname)
+    for attempt in range(MAX_RETRIES + 1):
+        error = response = status = retry_after = None
+        with slot:
+            try:
+                response, status, retry_after = send()
+            except retryable_errors as e:
+                error = e
+        _count(parts.hostname, "requests")
+
+        reason = _retry_reason(method, parts.path, status, error)
+        if reason is None or attempt == MAX_RETRIES:
+            if error is not None:
+                raise error
+            return response
+
+        delay = backoff_delay(attempt, retry_after_seconds(retry_after))
+        _count(parts.hostname, "retries")
+        print(f"⏳ {parts.hostname}: {reason}, retrying in {delay:.1f}s ({attempt + 1}/{MAX_RETRIES})")
+        if response is not None:
+            response.close()
+        time.sleep(delay)
+
+
+def _count(host, key):
+    with _lock:
+        _stats[(host, key)] += 1
+
+
+def transport_stats():
+    """Returns the number of requests (attempts) and retries sent to each host so far."""
+    with _lock:
+        stats = {}
+        for (host, key), value in _stats.items():
+            stats.setdefault(host, {"requests": 0, "retries": 0})[key] = value
+        return stats
+
+
+class RetryingTransport(httpx.BaseTransport):
+    """httpx transport with a keep-alive pool, the shared retry policy and per-host limits (for Notion)."""
+
+    def __init__(self, pool_size=POOL_SIZE):
+        self._transport = httpx.HTTPTransport(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    def handle_request(self, request):
+        url = str(request.url)
+        request.url = httpx.URL(rewrite_url(url))
+
+        def send():
+            response = self._transport.handle_request(request)
+            # Read the body while holding the host's slot
+            response.read()
+            return response, response.status_code, response.headers.get("Retry-After")
+
+        return _send_with_retries(send, request.method, url, httpx.TransportError)
+
+    def close(self):
+        self._transport.close()
+
+
+class RetryingAdapter(HTTPAdapter):
+    """requests adapter with a keep-alive pool, the shared retry policy and per-host limits (for Sheets)."""
+
+    def __init__(self, pool_size=POOL_SIZE):
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        url = request.url
+        request.url = rewrite_url(url)
+
+        def send_once():
+            response = super(RetryingAdapter, self).send(request, stream=stream, timeout=timeout or TIMEOUT, **kwargs)
+            if not stream:
+                # Read the body while holding the host's slot
+                response.content
+            return response, response.status_code, response.headers.get("Retry-After")
+
+        retryable = (requests.ConnectionError, requests.Timeout)
+        return _send_with_retries(send_once, request.method, url, retryable)
+
+
+def _mount_retrying_adapter(session):
+    adapter = RetryingAdapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@functools.lru_cache(maxsize=8)
+def notion_client(token):
+    """
+    Returns the shared Notion client for a token.
+
+    Parameters:
+    - token (str): The Notion integration token.
+
+    Returns:
+    - notion_client.Client: A client whose connections, retries and rate limits are managed here
+      (notion-client's own retries are turned off so the two policies don't compound), pinned to
+      NOTION_VERSION.
+    """
+    from notion_client import Client
+
+    http_client = httpx.Client(transport=RetryingTransport())
+    return Client(
+        client=http_client, auth=token, timeout_ms=int(TIMEOUT * 1000), retry=False,
+        notion_version=NOTION_VERSION,
+    )
+
+
+_sheets_clients = {}
+_sheets_lock = threading.Lock()
+
+
+def sheets_client(credentials_info, scopes=SHEETS_SCOPES):
+    """
+    Returns the shared gspread client for a service account.
+
+    The client keeps its access token until it expires, so the token exchange happens once per
+    hour rather than once per load.
+
+    Parameters:
+    - credentials_info (dict): The service account key (as in the downloaded JSON file).
+    - scopes (list): OAuth scopes to request.
+
+    Returns:
+    - gspread.Client: The authorised client.
+    """
+    key = hashlib.sha256(json.dumps([credentials_info, list(scopes)], sort_keys=True).encode()).hexdigest()
+    # Held while building, so concurrent first loads share one client and one token exchange
+    with _sheets_lock:
+        if key not in _sheets_clients:
+            _sheets_clients[key] = _build_sheets_client(credentials_info, scopes)
+        return _sheets_clients[key]
+
+
+def _build_sheets_client(credentials_info, scopes):
+    import gspread
+    from google.auth.transport.requests import AuthorizedSession, Request
+    from google.oauth2 import service_account
+
+    credentials = service_account.Credentials.from_service_account_info(credentials_info, scopes=scopes)
+    # Token requests get their own pooled session; AuthorizedSession would otherwise open a new one
+    token_request = Request(session=_mount_retrying_adapter(requests.Session()))
+    credentials.refresh(token_request)
+    session = _mount_retrying_adapter(AuthorizedSession(credentials, auth_request=token_request))
+    return gspread.Client(credentials, session=session)
+
+
+def sheets_client_from_file(secret_file_path, scopes=SHEETS_SCOPES):
+    """Returns the shared gspread client for a service account key file (see sheets_client)."""
+    with open(secret_file_path) as f:
+        return sheets_client(json.load(f), scopes)
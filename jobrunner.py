@@ -0,0 +1,174 @@
+"""
+This module contains the background job runner for the heavy pipeline stages (dashboard
+preprocessing and HbA1c prediction).
+
+Jobs run in the worker process (see workerpool.py), so the script thread only checks on them and
+the page stays responsive. Each job is keyed by a hash of its inputs: a rerun caused by any
+widget, in any session, finds the job already in flight and waits on it instead of starting it
+again. Finished jobs keep their result (the newest MAX_FINISHED_JOBS of them) for other sessions.
+A failed job is dropped once its error has been read, so the next rerun tries again.
+
+Progress: the job reports each stage (top-level timing span) it finishes to a small JSON file in
+JOB_DIR, which the app polls. A job is submitted with the stages it is expected to go through,
+so progress can be shown as a fraction.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from timing import set_span_listener
+from workerpool import submit_in_process
+
+JOB_DIR = os.environ.get("JOB_DIR", os.path.join(tempfile.gettempdir(), "a1sense_jobs"))
+
+# Finished jobs whose results are kept for other sessions
+MAX_FINISHED_JOBS = 8
+
+_jobs = OrderedDict()
+# Reentrant: a job that finishes immediately runs its done callback inside submit
+_lock = threading.RLock()
+
+
+def _progress_path(key):
+    return os.path.join(JOB_DIR, f"{key}.json")
+
+
+def _write_progress(path, progress):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, path)
+
+
+def _run_job(key, stages, func, args, kwargs):
+    """Runs a job's function (in the worker), writing a progress record after each expected stage."""
+    os.makedirs(JOB_DIR, exist_ok=True)
+    path = _progress_path(key)
+    done = []
+
+    def report(record):
+        if record["depth"] == 0 and record["stage"] in stages:
+            done.append(record["stage"])
+            _write_progress(path, {"stages": done, "fraction": len(set(done)) / len(stages)})
+
+    _write_progress(path, {"stages": [], "fraction": 0.0})
+    set_span_listener(report)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        set_span_listener(None)
+
+
+class Job:
+    """
+    Class Job
+    ---------
+    A background job: its key, a label for the UI and the future of its result.
+
+    Methods:
+    - done: Checks whether the job has finished (successfully or not).
+    - elapsed: Returns the seconds since the job started.
+    - progress: Returns the fraction of the expected stages finished and the last one.
+    - result: Returns the job's result, waiting for it if needed.
+    """
+
+    def __init__(self, key, label, future, stages):
+        self.key = key
+        self.label = label
+        self.future = future
+        self.stages = stages
+        self.started = time.time()
+
+    def done(self):
+        return self.future.done()
+
+    def elapsed(self):
+        return time.time() - self.started
+
+    def progress(self):
+        """
+        Returns the job's progress.
+
+        Returns:
+        - tuple: (fraction between 0 and 1, name of the last stage finished or None)
+        """
+        if self.done():
+            return 1.0, None
+        try:
+            with open(_progress_path(self.key)) as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            return 0.0, None
+        stages = progress.get("stages") or [None]
+        return min(float(progress.get("fraction", 0.0)), 0.99), stages[-1]
+
+    def result(self, timeout=None):
+        """
+        Returns the job's result, waiting up to `timeout` seconds (forever if None).
+        Exceptions raised by the job are re-raised here, and the failed job is forgotten.
+        """
+        try:
+            return self.future.result(timeout)
+        except Exception:
+            if self.future.done():
+                forget(self.key)
+            raise
+
+
+def submit(key, func, *args, label=None, stages=(), **kwargs):
+    """
+    Starts a job, or returns the job already running (or finished) for the same key.
+
+    Parameters:
+    - key (str): Identifies the job's inputs, e.g. "dashboard-<hash of the upload>".
+    - func (callable): A module-level (importable) function; it runs in the worker process.
+    - *args, **kwargs: Its arguments.
+    - label (str, optional): Shown with the job's progress.
+    - stages (tuple): Names of the timing spans the job goes through, for progress.
+
+    Returns:
+    - Job: The job.
+    """
+    with _lock:
+        job = _jobs.get(key)
+        if job is None:
+            future = submit_in_process(_run_job, key, tuple(stages), func, args, kwargs)
+            job = _jobs[key] = Job(key, label or key, future, tuple(stages))
+            future.add_done_callback(lambda _: _finished(key))
+            print(f"🏗️ Started job {key}")
+        return job
+
+
+def find(key):
+    """Returns the job for a key, or None if there is none (it never ran, failed or was evicted)."""
+    with _lock:
+        return _jobs.get(key)
+
+
+def forget(key):
+    """Drops a job, so the next submit for its key starts it again."""
+    with _lock:
+        _jobs.pop(key, None)
+
+
+def _finished(key):
+    try:
+        os.remove(_progress_path(key))
+    except OSError:
+        pass
+    with _lock:
+        if key in _jobs:
+            _jobs.move_to_end(key)
+        finished = [k for k, job in _jobs.items() if job.done()]
+        for k in finished[:-MAX_FINISHED_JOBS]:
+            del _jobs[k]
+
+
+def running():
+    """Returns the jobs that are still running."""
+    with _lock:
+        return [job for job in _jobs.values() if not job.done()]
@@ -0,0 +1,192 @@
+"""
+This module contains a small lazy dependency graph for the datasets used by the Streamlit app.
+Each dataset is registered with a loader function and the names of the datasets it depends on.
+A dataset is only computed the first time it is requested and is then memoized for the rest of
+the script run, so tabs that do not need a dataset never pay for loading it.
+
+`require(names, max_workers=n)` loads independent datasets concurrently in threads (e.g. the
+Notion fetch runs while the dashboard is being preprocessed) and records each dataset's state,
+duration and error, so the time to first render is that of the slowest chain of dependencies
+rather than the sum of all loads.
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from timing import current_run, join_run
+
+
+def _in_worker_thread(func, run):
+    """
+    Wraps a loader so it runs with the script's Streamlit context and timing run.
+    The wrapped loader returns (value, seconds spent loading).
+    """
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except ImportError:
+        ctx = None
+
+    def run_loader(*args):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        join_run(run)
+        start = time.perf_counter()
+        value = func(*args)
+        return value, time.perf_counter() - start
+
+    return run_loader
+
+
+class LazyDataGraph:
+    """
+    Class LazyDataGraph
+    -------------------
+    A registry of named datasets that are computed on first access and then memoized.
+
+    A loader returns None when its source is not available (e.g. a CSV has not been uploaded).
+    Any dataset that depends on an unavailable dataset resolves to None without calling its loader.
+
+    Methods:
+    - register: Registers a dataset loader and its dependencies.
+    - get: Returns a dataset, computing it (and its dependencies) on first access.
+    - require: Returns a dictionary of the requested datasets.
+    - is_loaded: Checks whether a dataset has already been computed.
+    - status: Returns the state, duration and error of each dataset loaded concurrently.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._dependencies = {}
+        self._values = {}
+        self._resolving = set()
+        self._status = {}
+
+    def register(self, name, loader, depends_on=()):
+        """
+        Registers a dataset loader.
+
+        Parameters:
+        - name (str): The name of the dataset.
+        - loader (callable): Called with the resolved dependencies as positional arguments.
+        - depends_on (iterable of str): Names of the datasets the loader needs, in argument order.
+        """
+        self._loaders[name] = loader
+        self._dependencies[name] = tuple(depends_on)
+        self._values.pop(name, None)
+
+    def get(self, name):
+        """
+        Returns the named dataset, computing it on first access.
+
+        Parameters:
+        - name (str): The name of the dataset.
+
+        Returns:
+        - The dataset returned by the loader, or None if it (or one of its dependencies) is unavailable.
+        """
+        if name in self._values:
+            return self._values[name]
+        if name not in self._loaders:
+            raise KeyError(f"Unknown dataset '{name}'.")
+        if name in self._resolving:
+            raise RuntimeError(f"Circular dependency while resolving dataset '{name}'.")
+
+        self._resolving.add(name)
+        try:
+            args = [self.get(dependency) for dependency in self._dependencies[name]]
+            if any(arg is None for arg in args):
+                value = None
+            else:
+                value = self._loaders[name](*args)
+        finally:
+            self._resolving.discard(name)
+
+        self._values[name] = value
+        return value
+
+    def require(self, names, max_workers=None, on_update=None):
+        """
+        Returns the requested datasets.
+
+        Parameters:
+        - names (iterable of str): The names of the datasets needed.
+        - max_workers (int, optional): Load independent datasets concurrently in this many threads.
+          A loader that raises then resolves to None (as do its dependents) and the error is
+          recorded in `status()` instead of being raised.
+        - on_update (callable, optional): Called as on_update(name, status) from the calling thread
+          whenever a dataset finishes, for progress reporting.
+
+        Returns:
+        - dict: A dictionary mapping each dataset name to its value (None if unavailable).
+        """
+        names = list(names)
+        if max_workers:
+            self._load_concurrently(names, max_workers, on_update)
+        return {name: self.get(name) for name in names}
+
+    def _pending(self, names):
+        """Returns the datasets (including dependencies) that still need loading."""
+        pending = {}
+
+        def visit(name, path):
+            if name in self._values or name in pending:
+                return
+            if name not in self._loaders:
+                raise KeyError(f"Unknown dataset '{name}'.")
+            if name in path:
+                raise RuntimeError(f"Circular dependency while resolving dataset '{name}'.")
+            for dependency in self._dependencies[name]:
+                visit(dependency, path | {name})
+            pending[name] = self._dependencies[name]
+
+        for name in names:
+            visit(name, frozenset())
+        return pending
+
+    def _load_concurrently(self, names, max_workers, on_update):
+        pending = self._pending(names)
+        if not pending:
+            return
+
+        run = current_run()
+        running = {}
+
+        def finish(name, value, state, seconds=0.0, error=None):
+            self._values[name] = value
+            self._status[name] = {"state": state, "seconds": round(seconds, 3), "error": error}
+            if on_update is not None:
+                on_update(name, self._status[name])
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="loader") as executor:
+            while pending or running:
+                # Start every dataset whose dependencies have been resolved
+                for name in [n for n, deps in pending.items() if all(d in self._values for d in deps)]:
+                    args = [self._values[d] for d in pending.pop(name)]
+                    if any(arg is None for arg in args):
+                        finish(name, None, "unavailable")
+                        continue
+                    self._status[name] = {"state": "running", "seconds": None, "error": None}
+                    future = executor.submit(_in_worker_thread(self._loaders[name], run), *args)
+                    running[future] = (name, time.perf_counter())
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, submitted = running.pop(future)
+                    try:
+                        value, seconds = future.result()
+                    except Exception as e:
+                        finish(name, None, "error", time.perf_counter() - submitted, f"{type(e).__name__}: {e}")
+                    else:
+                        finish(name, value, "done" if value is not None else "unavailable", seconds)
+
+    def status(self):
+        """Returns the state ("done", "unavailable" or "error"), seconds and error of each dataset loaded concurrently."""
+        return dict(self._status)
+
+    def is_loaded(self, name):
+        """Checks whether the named dataset has already been computed in this run."""
+        return name in self._values
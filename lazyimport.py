@@ -0,0 +1,60 @@
+"""
+This module contains an import-on-first-use helper for heavy dependencies.
+`lazy_import("matplotlib.pyplot")` returns a stand-in that imports the real module the first
+time one of its attributes is used, so plotting, integration and ML libraries are only loaded
+when a tab actually needs them.
+"""
+
+import importlib
+import sys
+
+
+class LazyModule:
+    """
+    Class LazyModule
+    ----------------
+    A stand-in for a module that is imported on first attribute access.
+
+    Methods:
+    - is_loaded: Checks whether the real module has been imported yet.
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def is_loaded(self):
+        """Checks whether the real module has been imported yet."""
+        return self.__dict__["_module"] is not None or self.__dict__["_name"] in sys.modules
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded() else "not loaded"
+        return f"<LazyModule '{self.__dict__['_name']}' ({state})>"
+
+
+def lazy_import(name):
+    """
+    Returns a module that is imported on first use.
+
+    Parameters:
+    - name (str): The full module name, e.g. "matplotlib.pyplot".
+
+    Returns:
+    - LazyModule: The stand-in, or the module itself if it has already been imported.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
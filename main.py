@@ -5,16 +5,29 @@ calculating age and length of diagnosis, plotting histograms, and handling data
 and Google Sheets.
 """
 
+import io
+import os
 import pandas as pd
 from datetime import datetime
-import matplotlib.pyplot as plt
-import seaborn as sns
 import streamlit as st
 import numpy as np
-import gspread
 
-from notionhelper import NotionHelper
-from jan883_eda import update_column_names
+from lazyimport import lazy_import
+from patientindex import clean_nhs_numbers, patient_key_index, contactable_rows
+from timing import span, timed
+from cacheregistry import tracked_cache
+from smsexport import ACCURX_BATCH_SIZE, build_sms_export, cohort_fingerprint
+import pagedtable
+import recallscheduler
+
+# Heavy dependencies are imported on first use, so tabs that don't plot or fetch don't pay for them
+plt = lazy_import("matplotlib.pyplot")
+sns = lazy_import("seaborn")
+notionhelper = lazy_import("notionhelper")
+httptransport = lazy_import("httptransport")
+sharedregister = lazy_import("sharedregister")
+jobrunner = lazy_import("jobrunner")
+snapshotstore = lazy_import("snapshotstore")
 
 # Dictionary containing information about different tests and their due calculation parameters.
 # Each key represents a test (e.g., "hba1c_due"), and the value is a dictionary
@@ -82,15 +95,7 @@ date_cols = ['dob', 'first_dm_diagnosis', 'annual_review_done',
 fiveteen_m_columns = ['annual_review_done','smoking','foot_risk','retinal_screening','mh_screen_-_dds_or_phq','patient_goals','care_plan']
 
 # List of columns to be dropped from the DataFrame during preprocessing.
-columns_to_drop=['column1',
- 'column2',
- 'column3',
- 'column4',
- 'column5',
- 'column6',
- 'column7',
- 'column8',
- 'column9',
+columns_to_drop=['column9',
  'group_consultations',
  'hypo_mon_denom',
  'month_of_birth',
@@ -170,16 +175,9 @@ columns_to_drop=['column1',
 fiveteen_m_columns = ['annual_review_done','smoking','foot_risk','retinal_screening','mh_screen_-_dds_or_phq','patient_goals','care_plan']
 
 # List of columns to be dropped from the DataFrame during preprocessing.
+# Column1-Column8 (earlier HbA1c results) are kept: they are inputs of the prediction model
 columns_to_drop=[
-            "Column1", # Assuming these columns are consistently named and can be dropped before renaming
-            "Column2",
-            "Column3",
-            "Column4",
-            "Column5",
-            "Column6",
-            "Column7",
-            "Column8",
-            "Column9",
+            "Column9", # Assuming these columns are consistently named and can be dropped before renaming
             "Group consultations",
             "Hypo Mon Denom",
             "Month of Birth",
@@ -228,6 +226,13 @@ columns_to_drop=[
         ]
 
 
+# Default due window: a test is due when it was last done more than this many months ago
+DUE_MONTHS = 15
+
+# Due windows offered in the app (e.g. 12 months for QOF, 6 months for high-risk patients)
+DUE_WINDOW_OPTIONS = [3, 6, 9, 12, 15, 18, 24]
+
+
 def convert_date_columns(df, date_columns):
     """
     Converts specified columns in a DataFrame to datetime objects.
@@ -238,48 +243,98 @@ def convert_date_columns(df, date_columns):
         df[col] = pd.to_datetime(df[col], errors='coerce')
     return df
 
-def mark_due(df, date_cols):
+def add_days_since(df, date_cols, today=None):
     """
-    Adds boolean columns indicating if dates in given columns are more than 15 months old.
+    Adds a "{col}_days" column for each date column, holding the days since that date.
+    Due status is worked out from these columns when a cohort is filtered (see due_mask), so the
+    due window can change without reprocessing the dashboard.
+
+    Each column is stored as int16 when its values fit (a test done within the last 89 years)
+    and as int32 otherwise (e.g. dob); a missing date is stored as the dtype's minimum, so it is
+    never due. The date the days were counted from is kept in df.attrs["days_since_date"].
     Assumes date columns are already converted to datetime objects.
     """
-    today = pd.Timestamp.today()
-    cutoff = today - pd.DateOffset(months=15)
-
+    today = pd.Timestamp(today or datetime.today()).normalize()
     for col in date_cols:
-        df[f"{col}_due"] = df[col] < cutoff
-
+        dates = df[col].to_numpy(dtype="datetime64[D]")
+        missing = np.isnat(dates)
+        days = (np.datetime64(today.date(), "D") - dates).astype(np.int64)
+        present = days[~missing]
+        dtype = np.int16
+        if present.size and (present.min() <= np.iinfo(np.int16).min or present.max() > np.iinfo(np.int16).max):
+            dtype = np.int32
+        days[missing] = np.iinfo(dtype).min
+        df[f"{col}_days"] = days.astype(dtype)
+
+    df.attrs["days_since_date"] = today.date().isoformat()
     return df
 
 
+def due_threshold_days(due_months=DUE_MONTHS, today=None, counted=None):
+    """
+    Returns the smallest "{col}_days" value of a due test.
+
+    Parameters:
+    due_months (int): The due window in months.
+    today (date, optional): Defaults to today.
+    counted (str or date, optional): The date the days were counted from (df.attrs["days_since_date"]);
+    defaults to today. Days counted on an earlier day are that many days behind.
+
+    Returns:
+    int: The threshold in days, never low enough to match a missing date.
+    """
+    today = pd.Timestamp(today or datetime.today()).normalize()
+    counted = pd.Timestamp(counted) if counted is not None else today
+    threshold = (today - (today - pd.DateOffset(months=due_months))).days - (today - counted).days
+    return max(threshold, np.iinfo(np.int16).min + 1)
 
 
+def due_mask(data, test, due_months=DUE_MONTHS, today=None):
+    """
+    Returns which patients are due a test, i.e. last had it more than due_months months ago.
 
+    Parameters:
+    data (pd.DataFrame): Patients, with the "{test}_days" column added by add_days_since.
+    test (str): The date column of the test (e.g. "hba1c").
+    due_months (int): The due window in months.
+    today (date, optional): Defaults to today.
 
+    Returns:
+    np.ndarray: Boolean due status, one per row.
+    """
+    threshold = due_threshold_days(due_months, today, data.attrs.get("days_since_date"))
+    return data[f"{test}_days"].to_numpy() >= threshold
 
 
-def filter_due_patients(data, selected_tests):
+def filter_due_patients(data, selected_tests, due_months=DUE_MONTHS, today=None):
     """
     Filters the DataFrame to include only patients who are due for all of the selected tests.
 
     Parameters:
-    data (pd.DataFrame): DataFrame containing patient data with due status columns.
-    selected_tests (list): A list of strings, where each string is the base name of a test (e.g., "smoking", "foot_risk"). The function will look for columns named like "{test}_due".
+    data (pd.DataFrame): DataFrame containing patient data with "{test}_days" columns (see add_days_since).
+    selected_tests (list): A list of strings, where each string is the base name of a test (e.g., "smoking", "foot_risk").
+    due_months (int): A test is due when it was last done more than this many months ago.
+    today (date, optional): Defaults to today.
 
     Returns:
     pd.DataFrame: A filtered DataFrame containing only the patients who are due for all of the selected tests. Returns an empty DataFrame if no tests are selected or no patients are due.
+
+    A boolean "{test}_due" column, if present, is used as it is instead.
     """
-    filter_conditions = [
-        data[f"{test}_due"] for test in selected_tests if f"{test}_due" in data.columns
-    ]
+    filter_conditions = []
+    for test in selected_tests:
+        if f"{test}_due" in data.columns:
+            filter_conditions.append(data[f"{test}_due"].to_numpy(dtype=bool))
+        elif f"{test}_days" in data.columns:
+            filter_conditions.append(due_mask(data, test, due_months, today))
 
     if not filter_conditions:
         return data.iloc[0:0]
 
-    # Combine filter conditions using AND logic
+    # Combine filter conditions using AND logic (not in place, so the due columns of `data` are left untouched)
     combined_filter = filter_conditions[0]
     for condition in filter_conditions[1:]:
-        combined_filter &= condition
+        combined_filter = combined_filter & condition
 
     return data[combined_filter]
 
@@ -329,53 +384,286 @@ def calculate_length_of_diagnosis(diagnosis_date):
 
 
 
-@st.cache_data
+def memory_usage_mb(df):
+    """
+    Returns the memory used by a DataFrame in megabytes, including the contents of object columns.
+    """
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def downcast_numeric_columns(df):
+    """
+    Downcasts numeric columns without losing information.
+    Integer columns are reduced to the smallest integer type that holds their values, and float
+    columns are stored as float32 only when every value survives the round trip unchanged.
+    Nullable integer columns (e.g. nhs_number) are left as they are.
+    """
+    for col in df.columns:
+        dtype = df[col].dtype
+        if dtype == np.int64:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        elif dtype == np.float64:
+            values = df[col].to_numpy()
+            as_float32 = values.astype(np.float32)
+            if np.array_equal(as_float32.astype(np.float64), values, equal_nan=True):
+                df[col] = as_float32
+    return df
+
+
+def categorize_text_columns(df, max_unique_ratio=0.5):
+    """
+    Converts low-cardinality text columns (e.g. ethnicity, statin, diabetes_diagnosis,
+    eligible_for_rewind and the medication flags) to the pandas category dtype.
+
+    Parameters:
+    - df (pd.DataFrame): The DataFrame to convert.
+    - max_unique_ratio (float): Columns with at most this ratio of unique values to rows are converted.
+    """
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        n_unique = df[col].nunique(dropna=True)
+        if n_unique <= max_unique_ratio * len(df):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def compact_dashboard(df):
+    """
+    Reduces the memory footprint of the preprocessed dashboard.
+    Downcasts numerics and converts low-cardinality text to categoricals, then reports the
+    memory usage before and after.
+
+    Parameters:
+    df (pd.DataFrame): The preprocessed dashboard DataFrame.
+
+    Returns:
+    pd.DataFrame: The compacted DataFrame.
+    """
+    before = memory_usage_mb(df)
+    df = downcast_numeric_columns(df)
+    df = categorize_text_columns(df)
+    after = memory_usage_mb(df)
+    print(f"Compacted dashboard: {before:.2f} MB -> {after:.2f} MB - ✅")
+    df.attrs['memory_usage_mb'] = {'before': before, 'after': after}
+    return df
+
+
+# Date columns converted to "{col}_length" columns (see add_length_columns) for the HbA1c prediction model.
+cols_toget_length = [
+    "annual_review_done",
+    "hba1c",
+    "cholesterol",
+    "bmi",
+    "egfr",
+    "urine_acr",
+    "smoking",
+    "foot_risk",
+    "retinal_screening",
+    "education",
+    "statin_date",
+]
+
+# Numerical columns where a value of 0 means "not recorded" and is imputed before prediction.
+impute_cols = [
+    "sbp",
+    "dbp",
+    "total_chol",
+    "non-hdl_chol",
+    "latest_hdl",
+    "latest_ldl",
+    "latest_egfr",
+    "latest_bmi",
+    "latest_qrisk2",
+]
+
+def add_length_columns(df, columns, length_function):
+    """
+    Adds a "{col}_length" column for each date column, holding the time elapsed since that date.
+
+    Parameters:
+    df (pd.DataFrame): DataFrame containing the date columns.
+    columns (list): The date columns to convert.
+    length_function (callable): Called with each date, returns the elapsed time (e.g. calculate_length_of_diagnosis).
+
+    Returns:
+    pd.DataFrame: The DataFrame with the added length columns.
+    """
+    for col in columns:
+        if col in df.columns:
+            df[f"{col}_length"] = df[col].apply(length_function)
+    return df
+
+def impute_values(df, missing_values=0, copy=True, strategy="mean", columns=None):
+    """
+    Imputes a placeholder value in the given columns with the column mean or median.
+
+    Parameters:
+    df (pd.DataFrame): The input DataFrame.
+    missing_values: The placeholder for missing values. All occurrences are imputed, as are NaNs.
+    copy (bool): If True, a copy of the DataFrame is imputed, otherwise it is imputed in place.
+    strategy (str): "mean" or "median".
+    columns (list): Columns to impute. If None, all columns are imputed.
+
+    Returns:
+    pd.DataFrame: The DataFrame with imputed values.
+    """
+    if copy:
+        df = df.copy()
+    columns = [col for col in (columns if columns is not None else df.columns) if col in df.columns]
+
+    values = df[columns].replace(missing_values, np.nan)
+    fill = values.mean() if strategy == "mean" else values.median()
+    df[columns] = values.fillna(fill)
+    return df
+
+
+
+# Stages (timing spans) of a dashboard job, for its progress bar
+DASHBOARD_JOB_STAGES = (
+    "csv_read",
+    "column_drop",
+    "nhs_cleanup",
+    "date_parsing",
+    "days_since",
+    "age_and_diagnosis_length",
+    "compaction",
+    "register_publish",
+    "snapshot_write",
+)
+
+
+def dashboard_job(file_path, col_list):
+    """
+    Starts the background job that preprocesses an upload, publishes it as a shared register
+    (see sharedregister.py and jobrunner.py) and snapshots it, unless the register has already
+    been published.
+    The job runs in the worker process and writes the register itself, so the frame is never
+    pickled back to the app; reruns while it runs find the same job rather than starting another.
+
+    Parameters:
+    file_path (str or file-like): The raw diabetes dashboard CSV file (path or upload).
+    col_list (list): A list of column names that should be treated as dates.
+
+    Returns:
+    tuple: (path of the register, the jobrunner.Job publishing it or None if it already exists)
+    """
+    if hasattr(file_path, "getvalue"):
+        data = file_path.getvalue()
+    else:
+        with open(file_path, "rb") as f:
+            data = f.read()
+    key = sharedregister.register_key(data, col_list)
+    path = sharedregister.register_path(key)
+    job = jobrunner.find(f"dashboard-{key}")
+    if job is None and os.path.exists(path):
+        return path, None
+    if job is None:
+        # Uploads can't be pickled, so the worker is sent their contents
+        job = jobrunner.submit(
+            f"dashboard-{key}", publish_dashboard, io.BytesIO(data), col_list, path,
+            label="Preprocessing the dashboard", stages=DASHBOARD_JOB_STAGES,
+        )
+    return path, job
+
+
+@tracked_cache("resource", max_entries=8)
+def open_shared_register(path):
+    """Memory-maps a published register once per process (see sharedregister.open_register)."""
+    df = sharedregister.open_register(path)
+    df.attrs["register_path"] = path
+    return df
+
+
+def open_dashboard(path):
+    """
+    Returns a published dashboard register.
+
+    Parameters:
+    path (str): The register file (see dashboard_job).
+
+    Returns:
+    pd.DataFrame: A shallow copy of the shared register - changes made to it (copy-on-write)
+    stay in the calling session.
+    """
+    return open_shared_register(path).copy(deep=False)
+
+
 def load_and_preprocess_dashboard(file_path, col_list):
+    """
+    Returns the preprocessed dashboard for an upload, waiting for its job if it is still running.
+
+    Parameters:
+    file_path (str or file-like): The raw diabetes dashboard CSV file (path or upload).
+    col_list (list): A list of column names that should be treated as dates.
+
+    Returns:
+    pd.DataFrame: The preprocessed dashboard (see open_dashboard).
+    """
+    path, job = dashboard_job(file_path, col_list)
+    if job is not None:
+        job.result()
+    return open_dashboard(path)
+
+
+def publish_dashboard(file_path, col_list, path):
+    """
+    Preprocesses a dashboard, publishes it as a shared register and keeps a snapshot of it for
+    the Trends tab (see snapshotstore.py); returns the register's path.
+    """
+    df = preprocess_dashboard(file_path, col_list)
+    with span("register_publish", rows=len(df)):
+        sharedregister.publish(df, path)
+    with span("snapshot_write", rows=len(df)):
+        snapshotstore.SnapshotStore().write(df)
+    return path
+
+
+def preprocess_dashboard(file_path, col_list):
     """
     Loads the raw diabetes dashboard data from a CSV file, preprocesses it,
-    calculates age and length of diagnosis, and determines the due status for various tests.
+    calculates age and length of diagnosis, and counts the days since each test (from which due
+    status is worked out for any due window).
 
     Parameters:
     file_path (str): The path to the raw diabetes dashboard CSV file.
     col_list (list): A list of column names that should be treated as dates.
     test_info (dict): A dictionary containing information about different tests and their due calculation parameters.
-    fiveteen_m_columns (list): A list of column names for which to calculate due status based on a 15-month threshold.
 
     Returns:
-    pd.DataFrame: A preprocessed and enriched DataFrame with calculated age, length of diagnosis, and due statuses for various tests.
+    pd.DataFrame: A preprocessed and enriched DataFrame with calculated age, length of diagnosis, and "{col}_days" columns for the date columns.
     """
     # Load the CSV file
-    df = pd.read_csv(file_path)
+    with span("csv_read"):
+        df = pd.read_csv(file_path)
 
     # Check if columns are in DataFrame, and drop only those present
-    df = df.drop(columns=[col for col in columns_to_drop if col in df.columns])
-
-    # Update column names to lowercase with underscores
-    df = update_column_names(df)
-
-    # Handle NHS number - clean and convert
-    df['nhs_number'] = (
-        df['nhs_number']
-        .astype(str)
-        .str.replace(r"\.0$", "", regex=True)  # Remove trailing .0 if present
-        .str.replace(" ", "")  # Remove any spaces
-    )
+    with span("column_drop"):
+        df = df.drop(columns=[col for col in columns_to_drop if col in df.columns])
 
-    # Convert valid numbers to integers, ignoring invalid entries
-    df['nhs_number'] = pd.to_numeric(df['nhs_number'], errors='coerce').astype('Int64')
+        # Update column names to lowercase with underscores
+        df = update_column_names(df)
 
+    # Canonicalize NHS numbers and validate their check digits
+    with span("nhs_cleanup", rows=len(df)):
+        df = clean_nhs_numbers(df, source="the dashboard")
 
     # Convert date columns to datetime objects
-    df = convert_date_columns(df, col_list)
+    with span("date_parsing", columns=len(col_list)):
+        df = convert_date_columns(df, col_list)
 
-    # Apply 'mark_due' for columns in fiveteen_m_columns
-    df = mark_due(df, col_list) # Note: mark_due should use fiveteen_m_columns, not col_list
+    # Days since each date, from which due status is worked out at query time
+    with span("days_since"):
+        df = add_days_since(df, col_list)
 
     # Calculate age and length of diagnosis
-    if 'dob' in df.columns:
-        df['age'] = df['dob'].apply(calculate_age)
-    if 'first_dm_diagnosis' in df.columns:
-        df['lenght_of_diagnosis_years'] = df['first_dm_diagnosis'].apply(calculate_length_of_diagnosis)
+    with span("age_and_diagnosis_length"):
+        if 'dob' in df.columns:
+            df['age'] = df['dob'].apply(calculate_age)
+        if 'first_dm_diagnosis' in df.columns:
+            df['lenght_of_diagnosis_years'] = df['first_dm_diagnosis'].apply(calculate_length_of_diagnosis)
+
+    # Shrink the frame held in the cache and sent to each session
+    with span("compaction"):
+        df = compact_dashboard(df)
 
     return df
 
@@ -392,6 +680,7 @@ plot_columns = [
     "non-hdl_chol",
 ]
 
+@timed("plotting")
 def plot_histograms(data, columns, color="#e3964a"):
     """
     Generates and displays a grid of histograms for specified numerical columns in a DataFrame using Seaborn and Matplotlib,
@@ -448,7 +737,7 @@ def plot_histograms(data, columns, color="#e3964a"):
     st.pyplot(fig)
 
 
-@st.cache_resource
+@tracked_cache("resource")
 def load_notion_df(notion_token, notion_database):
     """
     Loads data from a Notion database into a Pandas DataFrame.
@@ -462,15 +751,18 @@ def load_notion_df(notion_token, notion_database):
                     or an empty DataFrame if token or database ID is missing.
     """
     if notion_token != "" and notion_database != "":
-        nh = NotionHelper(notion_token, notion_database)
-        notion_df = nh.get_all_pages_as_dataframe()
+        with span("notion_fetch"):
+            nh = notionhelper.NotionHelper(notion_token, notion_database)
+            notion_df = nh.get_all_pages_as_dataframe()
         # Ensure 'NHS number' is consistent in the returned DataFrame
         if 'NHS number' in notion_df.columns:
              notion_df.rename(columns={'NHS number': 'nhs_number'}, inplace=True)
+        if 'nhs_number' in notion_df.columns:
+            notion_df = clean_nhs_numbers(notion_df, source="Notion")
         return notion_df
     return pd.DataFrame() # Return empty DataFrame if credentials are not provided
 
-@st.cache_resource
+@tracked_cache("resource")
 def load_google_sheet_df(sheet_url, sheet_index):
     """
     Loads data from a Google Sheet into a Pandas DataFrame using service account credentials.
@@ -495,11 +787,12 @@ def load_google_sheet_df(sheet_url, sheet_index):
         "client_x509_cert_url": st.secrets.google_sheets.client_x509_cert_url,
 }
 
-    gc = gspread.service_account_from_dict(credentials)
+    with span("sheets_fetch"):
+        gc = httptransport.sheets_client(credentials)
 
-    sh = gc.open_by_url(sheet_url)
-    sheet = sh.get_worksheet_by_id(sheet_index)
-    records = sheet.get_all_records()
+        sh = gc.open_by_url(sheet_url)
+        sheet = sh.get_worksheet_by_id(sheet_index)
+        records = sheet.get_all_records()
     df = pd.DataFrame.from_dict(records)
     # Attempt to find and rename the NHS number column to 'nhs_number'
     nhs_col_candidates = ['NHS number', 'NHS Number', 'NHS_number', 'NHS_Number', 'NHSNo', 'NHS No', 'NHS_No']
@@ -511,9 +804,9 @@ def load_google_sheet_df(sheet_url, sheet_index):
 
     if nhs_col_found:
         df.rename(columns={nhs_col_found: 'nhs_number'}, inplace=True)
-        df['nhs_number'] = df['nhs_number'].astype(str).replace("", np.nan)
+        df = clean_nhs_numbers(df, source="Google Sheets")
+        # Drop rows without a readable NHS number (unreadable ones are counted in attrs)
         df = df.dropna(subset=['nhs_number'])
-        df['nhs_number'] = pd.to_numeric(df['nhs_number'], errors='coerce').astype('Int64') # Use Int64 for nullable integer
     else:
         st.warning("NHS number column not found in Google Sheet with common names. Returning empty DataFrame.")
         return pd.DataFrame() # Return empty DataFrame if NHS number column is not found
@@ -545,13 +838,12 @@ def extract_sms_df(intervention_df, sms_df, notion_df):
         st.error("Notion DataFrame is missing 'nhs_number' column.")
         return pd.DataFrame()
 
-    intervention_df['nhs_number'] = pd.to_numeric(intervention_df['nhs_number'], errors='coerce').astype('Int64')
-    sms_df["nhs_number"] = pd.to_numeric(sms_df["nhs_number"], errors='coerce').astype('Int64')
-    notion_df["nhs_number"] = pd.to_numeric(notion_df["nhs_number"], errors='coerce').astype('Int64')
-
-    output_sms_df = sms_df.merge(intervention_df[["nhs_number"]], on="nhs_number", how="inner")
+    # Canonical patient keys are built once per loaded frame; the input frames are not modified
+    sms_index = patient_key_index(sms_df)
+    contact_mask = contactable_rows(sms_index, patient_key_index(intervention_df), patient_key_index(notion_df))
 
-    patients_to_contact = output_sms_df[~output_sms_df['nhs_number'].isin(notion_df['nhs_number'])]
+    patients_to_contact = sms_df[contact_mask].copy()
+    patients_to_contact["nhs_number"] = pd.array(sms_index.row_keys[contact_mask], dtype="Int64")
     return patients_to_contact
 
 
@@ -570,27 +862,190 @@ def update_column_names(df):
 
 
 
-def download_sms_csv(rewind_df, sms_df, notion_df, filename="dm_rewind_sms.csv"):
+@tracked_cache("data", max_entries=32)
+def build_cached_sms_export(fingerprint, filename, batch_size, as_zip, _cohort_df):
     """
-    Extracts an SMS DataFrame, converts it to CSV, and provides a Streamlit download button.
+    Builds the SMS export for a cohort, cached by the cohort fingerprint.
+
+    Parameters:
+    - fingerprint (str): The cohort fingerprint (see smsexport.cohort_fingerprint).
+    - filename (str): The name of the CSV file.
+    - batch_size (int): Maximum number of patients per Accurx batch file.
+    - as_zip (bool): Always bundle the export into a ZIP archive.
+    - _cohort_df (DataFrame): The cohort to export (not hashed, the fingerprint identifies it).
+
+    Returns:
+    - tuple: (data as bytes, download file name, mime type)
+    """
+    with span("export", rows=len(_cohort_df)):
+        return build_sms_export({filename: _cohort_df}, batch_size=batch_size, as_zip=as_zip)
+
+
+def paged_dataframe(df, key, columns=None, style=None, height="auto"):
+    """
+    Shows a table one page at a time, with a chosen subset of its columns.
+    Only the visible page is sent to the browser, and `style` is only applied to that page.
+
+    Parameters:
+    - df (DataFrame): The full table.
+    - key (str): Prefix of the widget keys, unique per table.
+    - columns (list, optional): Columns shown by default; defaults to pagedtable.default_columns(df).
+    - style (callable, optional): Turns a page into a pandas Styler (e.g. highlight_subtraction_result).
+    - height (int or str): Height of the table in pixels, or "auto".
+    """
+    options = list(df.columns)
+    with st.expander(f"Columns shown ({len(options)} available)"):
+        shown = st.multiselect(
+            "Columns", options=options, default=columns or pagedtable.default_columns(df),
+            key=f"{key}_columns", label_visibility="collapsed",
+        )
+
+    c1, c2, c3 = st.columns([3, 1, 1])
+    page_size = c2.selectbox(
+        "Rows per page", pagedtable.PAGE_SIZE_OPTIONS,
+        index=pagedtable.PAGE_SIZE_OPTIONS.index(pagedtable.PAGE_SIZE), key=f"{key}_page_size",
+    )
+    n_pages = pagedtable.page_count(len(df), page_size)
+    # The cohort may have shrunk since the page was picked
+    if st.session_state.get(f"{key}_page", 1) > n_pages:
+        del st.session_state[f"{key}_page"]
+    page = c3.number_input("Page", min_value=1, max_value=n_pages, value=1, key=f"{key}_page")
+
+    with span("table_page", rows=len(df), columns=len(shown)):
+        page_df = pagedtable.table_page(df, page - 1, page_size, shown or None)
+        table = style(page_df) if style is not None else page_df
+    first = (page - 1) * page_size
+    c1.caption(f"Rows {min(first + 1, len(df))}-{first + len(page_df)} of {len(df)} · {len(page_df.columns)} of {len(options)} columns")
+    st.dataframe(table, height=height)
+
+
+def download_sms_csv(rewind_df, sms_df, notion_df, filename="dm_rewind_sms.csv", batch_size=ACCURX_BATCH_SIZE, as_zip=False):
+    """
+    Extracts an SMS DataFrame and provides a Streamlit download button for it.
+
+    The CSV is only built once the user clicks the prepare button, and stays prepared while the
+    cohort is unchanged. Cohorts larger than `batch_size` are split into Accurx-sized batch files
+    bundled in a ZIP archive.
 
     Parameters:
     - rewind_df (DataFrame): The DataFrame used as input for the SMS extraction.
     - sms_df (DataFrame): The SMS DataFrame to be extracted.
     - notion_df (DataFrame): DataFrame containing patients already actioned in Notion.
     - filename (str): The name of the CSV file to be downloaded. Default is 'dm_rewind_sms.csv'.
+    - batch_size (int): Maximum number of patients per Accurx batch file.
+    - as_zip (bool): Always bundle the export into a ZIP archive.
     """
 
     # Extract the SMS DataFrame
-    output_sms_df = extract_sms_df(rewind_df, sms_df, notion_df)
+    with span("sms_extract"):
+        output_sms_df = extract_sms_df(rewind_df, sms_df, notion_df)
+    fingerprint = cohort_fingerprint(output_sms_df)
+
+    # Build the export only when requested
+    prepared_key = f"sms_export_{filename}"
+    if st.session_state.get(prepared_key) != fingerprint:
+        prepare = st.button(
+            f"Prepare **{filename}** ({output_sms_df.shape[0]} patients)",
+            key=f"prepare_{filename}",
+        )
+        if not prepare:
+            return
+        st.session_state[prepared_key] = fingerprint
 
-    # Convert DataFrame to CSV format
-    csv = output_sms_df.to_csv(index=False)
+    data, file_name, mime = build_cached_sms_export(fingerprint, filename, batch_size, as_zip, output_sms_df)
 
     # Display download button in Streamlit
     st.download_button(
-        label=f"Download **{filename}**",
-        data=csv,
-        file_name=filename,
-        mime="text/csv",
+        label=f"Download **{file_name}**",
+        data=data,
+        file_name=file_name,
+        mime=mime,
     )
+
+
+@tracked_cache("data", max_entries=16)
+def build_cached_wave_export(fingerprint, filename, batch_size, _cohorts):
+    """
+    Builds the ZIP of per-wave SMS CSVs for a recall schedule, cached by the schedule fingerprint.
+
+    Parameters:
+    - fingerprint (str): Fingerprint of the schedule (see smsexport.cohort_fingerprint).
+    - filename (str): The base name of the CSV files.
+    - batch_size (int): Maximum number of patients per Accurx batch file.
+    - _cohorts (dict): Maps each wave's CSV name to its SMS rows (not hashed, the fingerprint identifies it).
+
+    Returns:
+    - tuple: (data as bytes, download file name, mime type)
+    """
+    with span("wave_export", waves=len(_cohorts)):
+        data, _, mime = build_sms_export(_cohorts, batch_size=batch_size, as_zip=True)
+    return data, os.path.splitext(filename)[0] + "_waves.zip", mime
+
+
+def download_recall_waves(due_df, sms_df, notion_df, tests, filename, load_predictions=None, batch_size=ACCURX_BATCH_SIZE, due_months=DUE_MONTHS):
+    """
+    Schedules the due patients into weekly invitation waves that fit clinic capacity and provides
+    a Streamlit download button for one SMS CSV per wave.
+
+    Parameters:
+    - due_df (DataFrame): The due patients.
+    - sms_df (DataFrame): The SMS DataFrame.
+    - notion_df (DataFrame): DataFrame containing patients already actioned in Notion.
+    - tests (list): Date columns of the tests being recalled (e.g. ["hba1c", "egfr"]).
+    - filename (str): The base name of the CSV files, e.g. 'hca_selfbook_sms.csv'.
+    - load_predictions (callable, optional): Returns the HbA1c prediction table, only called if
+      the user asks to prioritise predicted rises.
+    - batch_size (int): Maximum number of patients per Accurx batch file.
+    - due_months (int): The due window the patients were selected with.
+    """
+    with st.expander("📅 **Schedule invitation waves** to match weekly clinic capacity"):
+        c1, c2, c3, c4 = st.columns(4)
+        hca_capacity = c1.number_input("HCA slots / week", min_value=1, value=100, step=10, key=f"hca_capacity_{filename}")
+        clinician_capacity = c2.number_input("Clinician slots / week", min_value=0, value=20, step=5, key=f"clinician_capacity_{filename}")
+        uptake = c3.slider("Expected uptake %", min_value=10, max_value=100, value=100, step=5, key=f"uptake_{filename}")
+        start_date = c4.date_input("First wave", value=recallscheduler.next_monday(), key=f"first_wave_{filename}")
+        use_predictions = st.checkbox(
+            "Prioritise patients with a **predicted HbA1c rise**",
+            key=f"use_predictions_{filename}",
+            disabled=load_predictions is None,
+        )
+        st.caption(
+            f"Patients are ranked by how overdue their tests are, their HbA1c and (optionally) their predicted rise. "
+            f"Patients with HbA1c ≥ {recallscheduler.CLINICIAN_HBA1C} mmol/mol also need a clinician slot."
+        )
+
+        predictions = load_predictions() if use_predictions and load_predictions is not None else None
+        with span("recall_scheduling", rows=len(due_df)):
+            schedule = recallscheduler.schedule_recall(
+                due_df, sms_df, notion_df, tests, hca_capacity, clinician_capacity,
+                start_date=start_date, predictions=predictions, expected_uptake=uptake / 100,
+                due_months=due_months,
+            )
+        if schedule.empty:
+            st.info("No due patients on the SMS register left to invite.")
+            return
+
+        st.dataframe(recallscheduler.wave_summary(schedule), hide_index=True, height=250)
+        unscheduled = int(schedule["wave"].isna().sum())
+        if unscheduled:
+            st.warning(f"{unscheduled} patients don't fit in {recallscheduler.MAX_WAVES} weeks at this capacity.")
+
+        cohorts = recallscheduler.wave_cohorts(schedule, sms_df, filename)
+        fingerprint = cohort_fingerprint(schedule[["nhs_number", "wave", "wave_start"]])
+
+        # Build the export only when requested
+        prepared_key = f"wave_export_{filename}"
+        if st.session_state.get(prepared_key) != fingerprint:
+            prepare = st.button(f"Prepare **{len(cohorts)} wave files**", key=f"prepare_waves_{filename}")
+            if not prepare:
+                return
+            st.session_state[prepared_key] = fingerprint
+
+        data, file_name, mime = build_cached_wave_export(fingerprint, filename, batch_size, cohorts)
+        st.download_button(
+            label=f"Download **{file_name}**",
+            data=data,
+            file_name=file_name,
+            mime=mime,
+            key=f"download_waves_{filename}",
+        )
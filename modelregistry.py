@@ -0,0 +1,308 @@
+"""
+This module contains the registry of the HbA1c prediction models.
+
+Each model version is recorded in a manifest (models/registry.json by default) with its
+artifacts - the fitted model (joblib), its scaler (pickle) and, optionally, the compiled model
+(.npz, see treeeval.py) - their SHA-256 checksums, and the features the model was fitted on, in
+order. The manifest names the default version; set MODEL_VERSION to predict with another one.
+
+Nothing is loaded until a version is used: each artifact is read, checked against its checksum
+and memoized on first use, so the app only pays for scikit-learn when it has to, and a version
+that is never selected costs nothing.
+
+Usage:
+    python modelregistry.py list
+    python modelregistry.py verify
+    python modelregistry.py add gbr-2024-11-13 --model models/gradient_boosting_model_13nov24.joblib \
+        --scaler models/scaler_StandardScaler_2024-11-13_17-59-35.pkl \
+        --compiled models/gradient_boosting_model_13nov24.npz --default
+"""
+
+import argparse
+import functools
+import hashlib
+import json
+import os
+import pickle
+import threading
+from datetime import date
+
+from timing import span
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+REGISTRY_PATH = os.environ.get("MODEL_REGISTRY", os.path.join(ROOT, "models", "registry.json"))
+
+# The version predictions are made with (None for the manifest's default)
+MODEL_VERSION = os.environ.get("MODEL_VERSION") or None
+
+# Ways a version can be evaluated, in order of preference
+EVALUATORS = ("compiled", "sklearn")
+
+
+def file_checksum(path):
+    """Returns the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelVersion:
+    """
+    Class ModelVersion
+    ------------------
+    One model version from the registry manifest. Its artifacts are loaded (and checked against
+    their checksums) on first use and kept for the life of the process.
+
+    Methods:
+    - evaluators: Returns the evaluators this version's artifacts support.
+    - load: Loads the artifacts an evaluator needs, if not loaded yet.
+    - fingerprint: Returns a short hash identifying the artifacts an evaluator predicts with.
+    - predict: Predicts HbA1c for a feature matrix.
+    - verify: Checks every artifact against its checksum.
+    """
+
+    def __init__(self, name, spec, directory):
+        """
+        Parameters:
+        - name (str): The version's name in the manifest.
+        - spec (dict): Its manifest entry.
+        - directory (str): Directory the artifact paths are relative to.
+        """
+        self.name = name
+        self.spec = spec
+        self.directory = directory
+        self.features = list(spec["features"])
+        self._artifacts = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"ModelVersion({self.name!r})"
+
+    def path(self, kind):
+        return os.path.join(self.directory, self.spec[kind]["path"])
+
+    def evaluators(self):
+        return [evaluator for evaluator in EVALUATORS if evaluator != "compiled" or "compiled" in self.spec]
+
+    def _artifact(self, kind):
+        with self._lock:
+            if kind not in self._artifacts:
+                path = self.path(kind)
+                with span("model_load", version=self.name, artifact=kind):
+                    if file_checksum(path) != self.spec[kind]["sha256"]:
+                        raise ValueError(f"Checksum mismatch for {path} (model version '{self.name}').")
+                    if kind == "compiled":
+                        from treeeval import CompiledEnsemble
+
+                        self._artifacts[kind] = CompiledEnsemble.load(path)
+                    elif kind == "model":
+                        # scikit-learn is only imported here, when the fitted model is needed
+                        import joblib
+
+                        self._artifacts[kind] = joblib.load(path)
+                    else:
+                        with open(path, "rb") as f:
+                            self._artifacts[kind] = pickle.load(f)
+            return self._artifacts[kind]
+
+    def _evaluator(self, evaluator):
+        evaluator = evaluator or self.evaluators()[0]
+        if evaluator not in self.evaluators():
+            raise ValueError(f"Model version '{self.name}' has no '{evaluator}' evaluator.")
+        return evaluator
+
+    def load(self, evaluator=None):
+        """Loads the artifacts an evaluator needs ("compiled" by default, if available)."""
+        evaluator = self._evaluator(evaluator)
+        for kind in ["compiled"] if evaluator == "compiled" else ["scaler", "model"]:
+            self._artifact(kind)
+        return evaluator
+
+    def fingerprint(self, evaluator=None):
+        """
+        Returns a short hash of the checksums of the artifacts an evaluator predicts with, used
+        to tell stored predictions of another model apart (see predictionstore.py).
+        """
+        evaluator = self._evaluator(evaluator)
+        kinds = ["compiled"] if evaluator == "compiled" else ["scaler", "model"]
+        digest = hashlib.sha1("|".join(self.spec[kind]["sha256"] for kind in kinds).encode())
+        return digest.hexdigest()[:12]
+
+    def predict(self, data, evaluator=None):
+        """
+        Scales a feature matrix and predicts HbA1c values for it.
+
+        Parameters:
+        - data (pd.DataFrame): Model inputs (see predict.prepare_features); at least this
+          version's features.
+        - evaluator (str, optional): "compiled" or "sklearn"; the first available by default.
+
+        Returns:
+        - np.ndarray: The predictions.
+        """
+        evaluator = self.load(evaluator)
+        features = data[self.features]
+
+        if evaluator == "compiled":
+            compiled = self._artifact("compiled")
+            with span("scaling"):
+                scaled = compiled.scale(features.to_numpy())
+            with span("inference", rows=len(data), evaluator="compiled", version=self.name):
+                return compiled.predict_scaled(scaled)
+
+        with span("scaling"):
+            scaled = self._artifact("scaler").transform(features)
+        with span("inference", rows=len(data), evaluator="sklearn", version=self.name):
+            return self._artifact("model").predict(scaled)
+
+    def verify(self):
+        """Returns {artifact: whether its file matches the manifest checksum}."""
+        return {
+            kind: os.path.exists(self.path(kind)) and file_checksum(self.path(kind)) == self.spec[kind]["sha256"]
+            for kind in ("model", "scaler", "compiled") if kind in self.spec
+        }
+
+
+class ModelRegistry:
+    """
+    Class ModelRegistry
+    -------------------
+    The model versions recorded in a manifest.
+
+    Methods:
+    - names: Returns the names of the versions, oldest first.
+    - get: Returns a version (the default one if no name is given).
+    - add: Records a version and writes the manifest.
+    """
+
+    def __init__(self, path=REGISTRY_PATH, create=False):
+        """
+        Parameters:
+        - path (str): The manifest.
+        - create (bool): Start an empty manifest if there is none (to add the first version).
+
+        Raises:
+        - FileNotFoundError: If the manifest doesn't exist and `create` is False.
+        """
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        if os.path.exists(path):
+            with open(path) as f:
+                self.manifest = json.load(f)
+        elif create:
+            self.manifest = {"default": None, "versions": {}}
+        else:
+            raise FileNotFoundError(
+                f"Model registry manifest {path} not found; set MODEL_REGISTRY or record a version "
+                "with 'python modelregistry.py add'."
+            )
+        self._versions = {}
+
+    @property
+    def default(self):
+        return self.manifest["default"]
+
+    def names(self):
+        return list(self.manifest["versions"])
+
+    def get(self, name=None):
+        name = name or self.default
+        if name is None:
+            raise KeyError(f"The model registry {self.path} has no default version.")
+        if name not in self.manifest["versions"]:
+            raise KeyError(f"Unknown model version '{name}'.")
+        if name not in self._versions:
+            self._versions[name] = ModelVersion(name, self.manifest["versions"][name], self.directory)
+        return self._versions[name]
+
+    def add(self, name, model_path, scaler_path, compiled_path=None, description="", created=None, default=False):
+        """
+        Records a model version (its artifacts' checksums and the model's features) and writes
+        the manifest.
+
+        Parameters:
+        - name (str): The version's name.
+        - model_path (str): The joblib-saved fitted model.
+        - scaler_path (str): The pickled scaler it was fitted with.
+        - compiled_path (str, optional): The compiled model (see treeeval.py).
+        - description (str): What changed in this version.
+        - created (str, optional): Date the model was fitted (YYYY-MM-DD); defaults to today.
+        - default (bool): Make it the default version.
+
+        Returns:
+        - ModelVersion: The version.
+        """
+        import joblib
+
+        artifacts = {"model": model_path, "scaler": scaler_path, "compiled": compiled_path}
+        spec = {"created": created or date.today().isoformat(), "description": description}
+        for kind, path in artifacts.items():
+            if path is not None:
+                spec[kind] = {
+                    "path": os.path.relpath(os.path.abspath(path), self.directory),
+                    "sha256": file_checksum(path),
+                }
+        spec["features"] = [str(col) for col in joblib.load(model_path).feature_names_in_]
+
+        self.manifest["versions"][name] = spec
+        self._versions.pop(name, None)
+        if default or self.default is None:
+            self.manifest["default"] = name
+        with open(self.path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+            f.write("\n")
+        return self.get(name)
+
+
+@functools.lru_cache(maxsize=4)
+def load_registry(path=REGISTRY_PATH):
+    """Returns the registry for a manifest, read once per process."""
+    return ModelRegistry(path)
+
+
+def get_version(name=None):
+    """Returns a model version from the registry: `name`, else MODEL_VERSION, else the default."""
+    return load_registry().get(name or MODEL_VERSION)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the model registry.")
+    parser.add_argument("--registry", default=REGISTRY_PATH, help="Path of the registry manifest.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List the model versions.")
+    verify = subparsers.add_parser("verify", help="Check the artifacts against their checksums.")
+    verify.add_argument("names", nargs="*", help="Versions to check (all by default).")
+    add = subparsers.add_parser("add", help="Record a model version.")
+    add.add_argument("name", help="Name of the version.")
+    add.add_argument("--model", required=True, help="Path of the joblib model.")
+    add.add_argument("--scaler", required=True, help="Path of the pickled scaler.")
+    add.add_argument("--compiled", default=None, help="Path of the compiled .npz model.")
+    add.add_argument("--description", default="", help="What changed in this version.")
+    add.add_argument("--created", default=None, help="Date the model was fitted (YYYY-MM-DD).")
+    add.add_argument("--default", action="store_true", help="Make it the default version.")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry, create=args.command == "add")
+    if args.command == "list":
+        for name in registry.names():
+            version = registry.get(name)
+            marker = "*" if name == registry.default else " "
+            print(f"{marker} {name:<24} {version.spec['created']:<12} {', '.join(version.evaluators()):<18} {version.spec['description']}")
+    elif args.command == "verify":
+        failed = False
+        for name in args.names or registry.names():
+            for kind, ok in registry.get(name).verify().items():
+                failed = failed or not ok
+                print(f"{'✅' if ok else '❌'} {name} {kind}")
+        raise SystemExit(1 if failed else 0)
+    elif args.command == "add":
+        version = registry.add(args.name, args.model, args.scaler, args.compiled,
+                               description=args.description, created=args.created, default=args.default)
+        print(f"Recorded model version {version.name} ({', '.join(version.evaluators())}) - ✅")
+
+
+if __name__ == "__main__":
+    main()
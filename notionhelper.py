@@ -1,6 +1,7 @@
-from notion_client import Client
 import pandas as pd
 
+from httptransport import notion_client
+
 class NotionHelper:
     """
     Class NotionHelper
@@ -12,6 +13,7 @@ class NotionHelper:
     - database_id: The ID of the Notion database to work with.
 
     Methods:
+    - query_database: Queries the initialized database (one page of results).
     - get_database: Fetches the schema of the initialized database.
     - notion_search_db: Searches the database for pages matching a query.
     - notion_get_page: Retrieves the properties and blocks of a Notion page.
@@ -26,7 +28,14 @@ class NotionHelper:
     def __init__(self, notion_token, database_id):
         self.notion_token = notion_token
         self.database_id = database_id
-        self.notion = Client(auth=self.notion_token)  # Initialize Notion client with the token
+        self.notion = notion_client(self.notion_token)  # Shared Notion client for the token
+
+    def query_database(self, **body):
+        """Queries the initialized database (one page of results)."""
+        # notion-client 3 has no databases.query; send the request directly (the client is pinned
+        # to an API version that still has it, see httptransport.NOTION_VERSION)
+        body = {key: value for key, value in body.items() if value is not None}
+        return self.notion.request(path=f"databases/{self.database_id}/query", method="POST", body=body)
 
     def get_database(self):
         """Fetches the schema of the initialized database."""
@@ -35,14 +44,11 @@ class NotionHelper:
 
     def notion_search_db(self, query=""):
         """Searches the initialized database for pages matching a query."""
-        my_pages = self.notion.databases.query(
-            **{
-                "database_id": self.database_id,
-                "filter": {
-                    "property": "title",
-                    "rich_text": {
-                        "contains": query,
-                    },
+        my_pages = self.query_database(
+            filter={
+                "property": "title",
+                "rich_text": {
+                    "contains": query,
                 },
             }
         )
@@ -97,7 +103,7 @@ class NotionHelper:
 
     def get_all_page_ids(self):
         """Returns the IDs of all pages in the initialized database."""
-        my_pages = self.notion.databases.query(database_id=self.database_id)
+        my_pages = self.query_database()
         page_ids = [page["id"] for page in my_pages["results"]]
         return page_ids
 
@@ -109,12 +115,7 @@ class NotionHelper:
         count = 0
 
         while has_more:
-            my_pages = self.notion.databases.query(
-                **{
-                    "database_id": self.database_id,
-                    "start_cursor": start_cursor,
-                }
-            )
+            my_pages = self.query_database(start_cursor=start_cursor)
             pages_json.extend([page["properties"] for page in my_pages["results"]])
             has_more = my_pages.get("has_more", False)
             start_cursor = my_pages.get("next_cursor", None)
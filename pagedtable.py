@@ -0,0 +1,67 @@
+"""
+This module contains the paging used by the cohort tables.
+
+st.dataframe serializes every row and column it is given and sends them to the browser on every
+rerun, which for a due cohort is often thousands of rows of the 80-column dashboard. Cohort
+tables instead show a subset of the columns and one page of rows. The page is cut from the
+frame before anything else is done to it, so styling is only computed for the rows shown.
+"""
+
+# Columns shown by default, in this order (when present); the rest can be added in the table
+TABLE_COLUMNS = [
+    "nhs_number",
+    "age",
+    "lenght_of_diagnosis_years",
+    "hba1c_value",
+    "hba1c",
+    "sbp",
+    "dbp",
+    "latest_egfr",
+    "total_chol",
+    "latest_ldl",
+    "latest_bmi",
+    "ethnicity",
+    "diabetes_diagnosis",
+]
+
+PAGE_SIZE = 100
+PAGE_SIZE_OPTIONS = [25, 50, 100, 250, 500]
+
+
+def default_columns(df, extra=()):
+    """
+    Returns the columns a table shows by default.
+
+    Parameters:
+    - df (pd.DataFrame): The table's frame.
+    - extra (list): Columns to show after nhs_number, e.g. the date columns of the selected tests.
+
+    Returns:
+    - list: The columns, without duplicates, in display order.
+    """
+    columns = [TABLE_COLUMNS[0], *extra, *TABLE_COLUMNS[1:]]
+    return [col for col in dict.fromkeys(columns) if col in df.columns]
+
+
+def page_count(n_rows, page_size=PAGE_SIZE):
+    """Returns the number of pages needed for n_rows rows (at least 1)."""
+    return max(1, -(-n_rows // page_size))
+
+
+def table_page(df, page, page_size=PAGE_SIZE, columns=None):
+    """
+    Cuts one page of rows and the chosen columns from a frame.
+
+    Parameters:
+    - df (pd.DataFrame): The full table.
+    - page (int): 0-based page number.
+    - page_size (int): Rows per page.
+    - columns (list, optional): Columns to keep; all columns if None.
+
+    Returns:
+    - pd.DataFrame: At most page_size rows.
+    """
+    start = page * page_size
+    # Rows are sliced first, so only the page is copied
+    rows = df.iloc[start:start + page_size]
+    return rows if columns is None else rows.loc[:, [col for col in columns if col in df.columns]]
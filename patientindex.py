@@ -0,0 +1,261 @@
+"""
+This module contains a patient-key index used to match patients across the Diabetes Dashboard,
+the Accurx SMS register and the actioned (Notion / Google Sheets) lists.
+NHS numbers are canonicalized once per loaded dataset into int64 keys, so cohort intersections
+and anti-joins become single vectorized set operations on sorted arrays.
+
+Every loader cleans its NHS number column with `clean_nhs_numbers`. Numbers written as text
+("943 476 5919", "943-476-5919", "9434765919.0") are parsed with NumPy digit arithmetic over the
+character codes, and the Modulus-11 check digit is validated, so a mistyped number is reported
+instead of silently failing to match (or matching the wrong patient) in a join.
+"""
+
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# Key used for rows whose NHS number is missing or not a whole number
+MISSING_KEY = -1
+
+# Indexes built for loaded frames, keyed by (id(frame), column) and dropped when the frame is freed
+_index_cache = {}
+
+
+# NHS numbers have 10 digits; the last one is the Modulus-11 check digit
+NHS_NUMBER_DIGITS = 10
+
+# Text longer than this can't be an NHS number, even with spaces or a ".0" suffix
+_MAX_TEXT_LENGTH = 24
+
+# Characters allowed between digits; 0 is the padding after the text
+_SEPARATORS = (0, ord("\t"), ord(" "), ord("-"))
+
+# Rows parsed at a time, bounding the (rows x characters) working arrays
+_CHUNK_ROWS = 65_536
+
+
+def modulus11_valid(numbers):
+    """
+    Checks the Modulus-11 check digit of NHS numbers.
+
+    Parameters:
+    - numbers (np.ndarray): int64 NHS numbers.
+
+    Returns:
+    - np.ndarray: Boolean mask, True where the number has at most 10 digits and a valid check digit.
+    """
+    numbers = np.asarray(numbers, dtype=np.int64)
+    in_range = (numbers >= 0) & (numbers < 10 ** NHS_NUMBER_DIGITS)
+    rest = np.where(in_range, numbers, 0)
+    check_digit = rest % 10
+    rest = rest // 10
+    # The first nine digits are weighted 10 down to 2
+    total = np.zeros(len(numbers), dtype=np.int64)
+    for weight in range(2, NHS_NUMBER_DIGITS + 1):
+        total += (rest % 10) * weight
+        rest //= 10
+    expected = (11 - total % 11) % 11
+    # A remainder of 10 means no valid check digit exists for the first nine digits
+    return in_range & (expected != 10) & (expected == check_digit)
+
+
+def _parse_text_chunk(text):
+    """Parses a chunk of NHS numbers written as text; returns (numbers, blank)."""
+    codes = np.asarray(text, dtype=f"U{_MAX_TEXT_LENGTH}").view(np.uint32).reshape(len(text), _MAX_TEXT_LENGTH)
+    numbers = np.zeros(len(text), dtype=np.int64)
+    n_digits = np.zeros(len(text), dtype=np.int64)
+    parsed = np.ones(len(text), dtype=bool)
+    blank = np.ones(len(text), dtype=bool)
+    fraction = np.zeros(len(text), dtype=bool)
+
+    # One vectorized step per character position, across all rows
+    for position in np.ascontiguousarray(codes.T):
+        digit = (position >= ord("0")) & (position <= ord("9"))
+        dot = position == ord(".")
+        separator = np.logical_or.reduce([position == code for code in _SEPARATORS])
+        # Only the integer part is read; a fractional part may only contain zeros ("9434765919.0")
+        parsed &= np.where(fraction, (position == ord("0")) | (position == 0), digit | separator | dot)
+        integer_digit = digit & ~fraction
+        numbers = np.where(integer_digit, numbers * 10 + (position.astype(np.int64) - ord("0")), numbers)
+        n_digits += integer_digit
+        blank &= separator
+        fraction |= dot
+
+    parsed &= (n_digits > 0) & (n_digits <= NHS_NUMBER_DIGITS)
+    return np.where(parsed, numbers, MISSING_KEY), blank
+
+
+def _parse_nhs_numbers(series):
+    """
+    Parses a column of NHS numbers without validating them.
+
+    Returns:
+    - tuple: (int64 numbers with MISSING_KEY where unparseable, mask of missing/blank entries)
+    """
+    series = pd.Series(series)
+    missing = series.isna().to_numpy()
+
+    if pd.api.types.is_integer_dtype(series):
+        numbers = series.to_numpy(dtype="int64", na_value=MISSING_KEY)
+        return np.where(numbers >= 0, numbers, MISSING_KEY), missing
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype="float64", na_value=np.nan)
+        whole = np.isfinite(values) & (values == np.floor(values)) & (values >= 0) & (values < 10 ** NHS_NUMBER_DIGITS)
+        return np.where(whole, values, MISSING_KEY).astype(np.int64), missing
+
+    text = series.astype("string")
+    too_long = (text.str.len() > _MAX_TEXT_LENGTH).fillna(False).to_numpy(dtype=bool)
+    text = text.to_numpy(dtype=object, na_value="")
+    numbers = np.empty(len(text), dtype=np.int64)
+    blank = np.empty(len(text), dtype=bool)
+    for start in range(0, len(text), _CHUNK_ROWS):
+        chunk = slice(start, start + _CHUNK_ROWS)
+        numbers[chunk], blank[chunk] = _parse_text_chunk(text[chunk])
+    numbers[too_long] = MISSING_KEY
+    return numbers, missing | (blank & ~too_long)
+
+
+def canonicalize_nhs_numbers(series):
+    """
+    Converts a column of NHS numbers into validated int64 patient keys.
+
+    Parameters:
+    - series (pd.Series): NHS numbers as numbers or text (spaces, hyphens and a ".0" suffix are allowed).
+
+    Returns:
+    - tuple: (keys, invalid)
+      - keys (np.ndarray): int64 keys, with MISSING_KEY for missing or invalid entries.
+      - invalid (np.ndarray): Boolean mask of entries that are present but not a valid NHS number
+        (unparseable, or failing the Modulus-11 check).
+    """
+    numbers, missing = _parse_nhs_numbers(series)
+    valid = modulus11_valid(numbers) & (numbers != MISSING_KEY) & ~missing
+    return np.where(valid, numbers, MISSING_KEY), ~valid & ~missing
+
+
+def canonical_nhs_keys(series):
+    """
+    Converts a column of NHS numbers into an int64 array of patient keys.
+
+    Parameters:
+    - series (pd.Series): NHS numbers as numbers or strings.
+
+    Returns:
+    - np.ndarray: int64 keys, with MISSING_KEY for missing or invalid entries.
+    """
+    return canonicalize_nhs_numbers(series)[0]
+
+
+def clean_nhs_numbers(df, column="nhs_number", source="data"):
+    """
+    Replaces a loaded frame's NHS number column with canonical numbers.
+
+    Numbers that fail validation are kept (so they can be found and corrected) but never match
+    in a join, and their count is recorded in df.attrs["invalid_nhs_numbers"].
+
+    Parameters:
+    - df (pd.DataFrame): The loaded frame.
+    - column (str): The NHS number column.
+    - source (str): Name of the source, for the warning message.
+
+    Returns:
+    - pd.DataFrame: The frame, with the column as nullable Int64 (NA where missing or unparseable).
+    """
+    numbers, missing = _parse_nhs_numbers(df[column])
+    invalid = ~missing & ~(modulus11_valid(numbers) & (numbers != MISSING_KEY))
+    df[column] = pd.arrays.IntegerArray(numbers, numbers == MISSING_KEY)
+    df.attrs["invalid_nhs_numbers"] = int(invalid.sum())
+    if invalid.any():
+        print(f"⚠️ {int(invalid.sum())} invalid NHS numbers in {source}")
+    return df
+
+
+def isin_sorted(values, sorted_keys):
+    """
+    Vectorized membership test of `values` against a sorted array of unique keys.
+
+    Parameters:
+    - values (np.ndarray): int64 keys to test.
+    - sorted_keys (np.ndarray): Sorted, unique int64 keys.
+
+    Returns:
+    - np.ndarray: Boolean mask, True where the value is in `sorted_keys`.
+    """
+    if len(sorted_keys) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_keys, values)
+    positions = np.minimum(positions, len(sorted_keys) - 1)
+    return sorted_keys[positions] == values
+
+
+class PatientKeyIndex:
+    """
+    Class PatientKeyIndex
+    ---------------------
+    Canonical int64 patient keys for the rows of one loaded frame.
+
+    Attributes:
+    - row_keys: int64 key per row of the frame (MISSING_KEY where the NHS number is invalid).
+    - keys: Sorted, unique valid keys in the frame.
+
+    Methods:
+    - from_series: Builds an index from a column of NHS numbers.
+    - rows_in: Returns a boolean row mask for rows whose key is in a set of keys.
+    """
+
+    def __init__(self, row_keys):
+        self.row_keys = row_keys
+        self.keys = np.unique(row_keys[row_keys != MISSING_KEY])
+
+    @classmethod
+    def from_series(cls, series):
+        """Builds an index from a column of NHS numbers."""
+        return cls(canonical_nhs_keys(series))
+
+    def rows_in(self, sorted_keys):
+        """Returns a boolean mask over the frame's rows whose key is in `sorted_keys`."""
+        return isin_sorted(self.row_keys, sorted_keys)
+
+    def __len__(self):
+        return len(self.row_keys)
+
+
+def patient_key_index(df, column="nhs_number"):
+    """
+    Returns the patient-key index for a frame, building it on first use.
+
+    The index is memoized for as long as the frame is alive, so loaded datasets are only
+    canonicalized once. Frames are treated as immutable once indexed.
+
+    Parameters:
+    - df (pd.DataFrame): The frame to index.
+    - column (str): The NHS number column.
+
+    Returns:
+    - PatientKeyIndex: The index for the frame.
+    """
+    cache_key = (id(df), column)
+    index = _index_cache.get(cache_key)
+    if index is None or len(index) != len(df):
+        index = PatientKeyIndex.from_series(df[column])
+        if cache_key not in _index_cache:
+            weakref.finalize(df, _index_cache.pop, cache_key, None)
+        _index_cache[cache_key] = index
+    return index
+
+
+def contactable_rows(sms_index, cohort_index, actioned_index):
+    """
+    Selects SMS register rows for patients in the cohort who have not yet been actioned.
+
+    Parameters:
+    - sms_index (PatientKeyIndex): Index of the SMS register.
+    - cohort_index (PatientKeyIndex): Index of the intervention cohort.
+    - actioned_index (PatientKeyIndex): Index of the patients already actioned.
+
+    Returns:
+    - np.ndarray: Boolean mask over the SMS register rows.
+    """
+    to_contact = np.setdiff1d(cohort_index.keys, actioned_index.keys, assume_unique=True)
+    return sms_index.rows_in(to_contact)
@@ -0,0 +1,132 @@
+"""
+This module contains the ranking used by the Predicted HbA1c tab.
+
+Only the few hundred patients most in need of action are looked at, so the register is not
+sorted: `top_k` selects the highest scores with np.argpartition (linear time) and only sorts
+those k rows. `RankedRows` pages through the rest of the ranking the same way, extending the
+sorted prefix only as far as the page asked for.
+
+Ties are broken by row position, so the ranking is a fixed order and consecutive pages never
+overlap or skip a row.
+"""
+
+import numpy as np
+import pandas as pd
+
+from recallscheduler import HBA1C_SCORE_RANGE, OVERDUE_CAP_DAYS, RISE_CAP, overdue_days, predictions_usable
+
+# Relative weight of each component of the prediction priority
+RANK_WEIGHTS = {"predicted_rise": 0.5, "hba1c": 0.3, "overdue": 0.2}
+
+# Number of patients shown as the priority list
+DEFAULT_TOP_K = 200
+
+# Rows per page of the rest of the ranking
+PAGE_SIZE = 100
+
+
+def prediction_priority(prediction, dashboard=None, weights=RANK_WEIGHTS, today=None):
+    """
+    Scores how urgently each patient in the prediction table needs action.
+
+    Parameters:
+    - prediction (pd.DataFrame): The output of predict.predict (latest_hba1c_value, predicted_hba1c,
+      subtraction_result). Degenerate predictions (see recallscheduler.predictions_usable) don't
+      contribute a predicted rise.
+    - dashboard (pd.DataFrame, optional): The preprocessed dashboard the predictions were made
+      from (same rows, same order), used for how overdue each patient's HbA1c test is.
+    - weights (dict): Weight of the "predicted_rise", "hba1c" and "overdue" components.
+    - today (date, optional): Defaults to today.
+
+    Returns:
+    - np.ndarray: float64 scores between 0 and 1.
+    """
+    # subtraction_result is latest - predicted, so a predicted rise is negative
+    rise = -pd.to_numeric(prediction["subtraction_result"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    hba1c = pd.to_numeric(prediction["latest_hba1c_value"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    low, high = HBA1C_SCORE_RANGE
+    components = {
+        "hba1c": np.nan_to_num(np.clip((hba1c - low) / (high - low), 0, 1), nan=0.0),
+    }
+    if predictions_usable(prediction):
+        components["predicted_rise"] = np.nan_to_num(np.clip(rise / RISE_CAP, 0, 1), nan=0.0)
+    if dashboard is not None and len(dashboard) == len(prediction):
+        components["overdue"] = overdue_days(dashboard, ["hba1c"], today) / OVERDUE_CAP_DAYS
+
+    total_weight = sum(weights.get(name, 0) for name in components)
+    if total_weight <= 0:
+        return np.zeros(len(prediction))
+    return sum(weights.get(name, 0) * values for name, values in components.items()) / total_weight
+
+
+def top_k(scores, k):
+    """
+    Returns the positions of the k highest scores, highest first, without sorting all scores.
+
+    Parameters:
+    - scores (np.ndarray): One score per row; NaN ranks last.
+    - k (int): Number of rows to return.
+
+    Returns:
+    - np.ndarray: Row positions, by descending score and then ascending position.
+    """
+    scores = np.nan_to_num(np.asarray(scores, dtype="float64"), nan=-np.inf)
+    k = min(max(int(k), 0), len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # argpartition picks arbitrarily among rows tied with the k-th score; take the first ones
+        threshold = scores[candidates].min()
+        above = np.flatnonzero(scores > threshold)
+        tied = np.flatnonzero(scores == threshold)[: k - len(above)]
+        candidates = np.concatenate([above, tied])
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+class RankedRows:
+    """
+    Class RankedRows
+    ----------------
+    Pages through rows in descending score order, sorting only as much of the ranking as the
+    pages requested so far need.
+
+    Methods:
+    - page: Returns the row positions on a page.
+    - n_pages: Returns the number of pages.
+    """
+
+    def __init__(self, scores, page_size=PAGE_SIZE, skip=0):
+        """
+        Parameters:
+        - scores (np.ndarray): One score per row.
+        - page_size (int): Rows per page.
+        - skip (int): Number of top-ranked rows to leave out (e.g. those already shown as the top-k).
+        """
+        self.scores = np.asarray(scores, dtype="float64")
+        self.page_size = page_size
+        self.skip = min(skip, len(self.scores))
+        self._prefix = np.empty(0, dtype=np.int64)
+
+    def n_pages(self):
+        return max(1, -(-(len(self.scores) - self.skip) // self.page_size))
+
+    def page(self, number):
+        """
+        Returns the row positions on a page.
+
+        Parameters:
+        - number (int): 0-based page number.
+
+        Returns:
+        - np.ndarray: Up to page_size row positions, in rank order.
+        """
+        start = self.skip + number * self.page_size
+        end = min(start + self.page_size, len(self.scores))
+        if end > len(self._prefix):
+            # Grow the sorted prefix geometrically, so paging forward costs amortised linear time
+            self._prefix = top_k(self.scores, max(end, 2 * len(self._prefix)))
+        return self._prefix[start:end]
@@ -1,12 +1,23 @@
-import pickle
-from joblib import load
+import numpy as np
 import pandas as pd
-from data_preprocessing.eda import update_column_names
-import streamlit as st
-from main import add_length_columns, cols_toget_length, calculate_length_of_diagnosis, impute_values, impute_cols
+import modelregistry
+from timing import span, timed
+from patientindex import canonical_nhs_keys
+from predictionstore import feature_fingerprints
+from main import update_column_names, add_length_columns, cols_toget_length, calculate_length_of_diagnosis, impute_values, impute_cols
+
+# The model, its scaler and its input columns come from the model registry (see modelregistry.py);
+# scikit-learn is only imported when a version without a compiled model is used
 
 final = pd.DataFrame({"nhs_number": [], "latest_hba1c_value": [], "predicted_hba1c": [], "subtraction_result":[]})
 
+# Dashboard column each model feature is taken from, where the names differ: the model's column1
+# is the latest HbA1c and column2-column9 are the dashboard's earlier results (Column1-Column8)
+MODEL_INPUT_COLUMNS = {
+    "column1": "hba1c_value",
+    **{f"column{i + 1}": f"column{i}" for i in range(1, 9)},
+}
+
 def update_statin_strength(df):
     # Define the mapping dictionary
     statin_map = {
@@ -54,90 +65,116 @@ def diabetes_diagnosis_map(df):
     df['diabetes_diagnosis'] = df['diabetes_diagnosis'].map(dm_map)
     return df
 
-def predict(df, nhs_df):
+def medication_flag(series):
+    """Converts a medication column recorded as Yes/No (or 1/0) to 1/0."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    return series.astype(str).str.strip().str.lower().map({"yes": 1, "1": 1, "no": 0, "0": 0})
+
+@timed("feature_prep")
+def prepare_features(df, features=None):
+    """
+    Converts the preprocessed dashboard into the feature matrix expected by the scaler and model.
+    Features are selected by name (`features`, by default those of the model version in use),
+    from the dashboard columns given in MODEL_INPUT_COLUMNS where the names differ.
+
+    Raises:
+    - ValueError: If the dashboard has no column for one of the features.
+    """
     data = update_column_names(df)
-    # data = load_df(data, col_list, columns_to_drop)
     print("🦖 Prep Dataframe")
     data = update_bame_column(data)
     print("😀 Bame Mapped")
-    data = data.drop(columns=["dob", "ethnicity", "first_dm_diagnosis", "9_kcp_complete", "3_levels_to_target", "mh_screen_-_dds_or_phq", "patient_goals", "care_plan"])
-    print("💧 Drop Columns")
 
     data = add_length_columns(data, cols_toget_length, calculate_length_of_diagnosis)
     print("🧮 Length of diagnosis columns")
-    data = data.drop(columns=['annual_review_done',
-    'hba1c', 'bp', 'cholesterol', 'bmi', 'egfr', 'urine_acr', 'smoking',
-    'foot_risk', 'retinal_screening', 'education',
-    'care_planning_consultation', 'struc_educ_in_l5y',
-    'struc_educ_in_12m_diag', 'statin_date'])
-    print("💧 Drop Columns")
 
     data = update_statin_strength(data)
     print("🗺️  Mapped Statiin Strength")
-    data = diabetes_diagnosis_map(data)
-    print("🗺️  Mapped Diabetes Diagnosis")
 
-    data['latest_qrisk2'] = data['latest_qrisk2'].str.replace("%", "").astype(float)
+    data['latest_qrisk2'] = pd.to_numeric(data['latest_qrisk2'].astype(str).str.replace("%", ""), errors='coerce')
+    data['metformin'] = medication_flag(data['metformin'])
+
+    sources = {feature: MODEL_INPUT_COLUMNS.get(feature, feature) for feature in features or modelregistry.get_version().features}
+    missing = [f"{feature} ({source})" if source != feature else feature for feature, source in sources.items() if source not in data.columns]
+    if missing:
+        raise ValueError(f"The dashboard has no column for model feature(s): {', '.join(missing)}.")
+    data = pd.DataFrame({feature: data[source] for feature, source in sources.items()}, index=data.index)
+    data = data.apply(pd.to_numeric, errors='coerce').astype(float)
     data = impute_values(data, missing_values=0, copy=False, strategy='mean', columns=impute_cols)
     data = data.fillna(0)  # STRATEGY FILL ALL NAA WITH ZERO
-    data.drop(columns=["statin"], inplace=True)
-
-    data.drop(columns=["nhs_number", "column9"], inplace=True)
-
-    new_col_list = ['imd_decile', 'bame', 'diabetes_diagnosis', 'column1',
-        'sbp', 'dbp', 'total_chol', 'non-hdl_chol', 'latest_hdl', 'latest_ldl',
-        'latest_egfr', 'latest_bmi', 'latest_qrisk2', 'column2', 'column3',
-        'column4', 'column5', 'column6', 'column7', 'column8', 'column9',
-        'metformin', 'sulphonylurea', 'dpp4', 'sglt2',
-        'pioglitazone', 'glp-1', 'basal_/_mix_insulin', 'rapid_acting_insulin',
-        'acei/arb', 'calcium_channel_blocker', 'diuretic', 'beta_blocker',
-        'spironolactone', 'doxazosin', 'age', 'lenght_of_diagnosis_months',
-        'lenght_of_diagnosis_years', 'annual_review_done_length',
-        'hba1c_length', 'cholesterol_length', 'bmi_length', 'egfr_length',
-        'urine_acr_length', 'smoking_length', 'foot_risk_length',
-        'retinal_screening_length', 'education_length', 'statin_date_length',
-        'statin_strenght']
-
-
-    arranged_col_list = ['imd_decile', 'bame', 'diabetes_diagnosis', 'sbp', 'dbp', 'total_chol',
-        'non-hdl_chol', 'latest_hdl', 'latest_ldl', 'latest_egfr', 'latest_bmi',
-        'latest_qrisk2', 'column1', 'column2', 'column3', 'column4', 'column5',
-        'column6', 'column7', 'column8', 'column9', 'metformin',
-        'sulphonylurea', 'dpp4', 'sglt2', 'pioglitazone', 'glp-1',
-        'basal_/_mix_insulin', 'rapid_acting_insulin', 'acei/arb',
-        'calcium_channel_blocker', 'diuretic', 'beta_blocker', 'spironolactone',
-        'doxazosin', 'age', 'lenght_of_diagnosis_months',
-        'lenght_of_diagnosis_years', 'annual_review_done_length',
-        'hba1c_length', 'cholesterol_length', 'bmi_length', 'egfr_length',
-        'urine_acr_length', 'smoking_length', 'foot_risk_length',
-        'retinal_screening_length', 'education_length', 'statin_date_length',
-        'statin_strenght']
-
-    data.columns = new_col_list
-
-    data = data[arranged_col_list]
-
-    drop_these = ['diabetes_diagnosis',
-        'sulphonylurea', 'dpp4', 'sglt2', 'pioglitazone', 'glp-1',
-        'basal_/_mix_insulin', 'rapid_acting_insulin', 'acei/arb',
-        'calcium_channel_blocker', 'diuretic', 'beta_blocker', 'spironolactone',
-        'doxazosin',  'lenght_of_diagnosis_months',
-        'annual_review_done_length',
-        'hba1c_length', 'cholesterol_length', 'bmi_length', 'egfr_length',
-        'urine_acr_length', 'smoking_length', 'foot_risk_length',
-        'retinal_screening_length', 'education_length', ]
-
-    data.drop(columns=drop_these, inplace=True)
-    with open('scaler_StandardScaler_2024-11-13_17-59-35.pkl', 'rb') as f:
-        scaler = pickle.load(f)
-
-    scaled_new_data = scaler.transform(data)
-
-    # Load the model from the file
-    gbr_loaded = load('gradient_boosting_model_13nov24.joblib')
-
-    # Now you can use it to make predictions
-    predictions = gbr_loaded.predict(scaled_new_data)
+    print("💧 Selected model features")
+    return data
+
+def score_features(data, version=None):
+    """
+    Scales a feature matrix and predicts HbA1c values for it.
+
+    Parameters:
+    - data (pd.DataFrame): Model inputs, as returned by prepare_features.
+    - version (str, optional): The model version (see modelregistry.get_version).
+
+    Returns:
+    - np.ndarray: The predictions.
+    """
+    # The version's artifacts are loaded and checked on first use, then kept
+    return modelregistry.get_version(version).predict(data)
+
+def score_incrementally(data, nhs_numbers, store, version=None):
+    """
+    Predicts using the prediction store: only patients whose model inputs (or the model) changed
+    since their stored prediction are scored, and their new predictions are saved.
+
+    Parameters:
+    - data (pd.DataFrame): Model inputs, as returned by prepare_features.
+    - nhs_numbers (pd.Series): NHS number of each row.
+    - store (PredictionStore): The prediction store.
+    - version (str, optional): The model version (see modelregistry.get_version).
+
+    Returns:
+    - tuple: (predictions as np.ndarray, number of patients re-scored)
+    """
+    keys = canonical_nhs_keys(nhs_numbers)
+    fingerprints = feature_fingerprints(data)
+    model = modelregistry.get_version(version)
+    version = model.fingerprint()
+
+    with span("prediction_store_lookup", rows=len(data)):
+        predictions = store.lookup(keys, fingerprints, version)
+
+    # Patients without a stored, up-to-date prediction (including those without a valid NHS number)
+    stale = np.isnan(predictions)
+    if stale.any():
+        predictions[stale] = model.predict(data[stale])
+        with span("prediction_store_update", rows=int(stale.sum())):
+            store.update(keys[stale], fingerprints[stale], version, predictions[stale])
+    print(f"🔁 Re-scored {int(stale.sum())} of {len(data)} patients")
+    return predictions, int(stale.sum())
+
+# Stages (timing spans) of a prediction job, for its progress bar
+PREDICTION_JOB_STAGES = ("feature_prep", "prediction_store_lookup", "inference", "prediction_store_update")
+
+
+def predict_register(register_path):
+    """
+    Predicts HbA1c for a published dashboard register (see sharedregister.py), using the
+    prediction store. This is the background prediction job run by the app (see jobrunner.py).
+    """
+    import sharedregister
+    from predictionstore import PredictionStore
+
+    df = sharedregister.open_register(register_path)
+    return predict(df.copy(), df[["nhs_number", "hba1c_value"]], store=PredictionStore())
+
+
+def predict(df, nhs_df, store=None, version=None):
+    data = prepare_features(df, modelregistry.get_version(version).features)
+
+    if store is None:
+        predictions = score_features(data, version)
+        rescored = len(data)
+    else:
+        predictions, rescored = score_incrementally(data, nhs_df['nhs_number'], store, version)
 
     nhs_list = nhs_df['nhs_number'].to_list()
     hba1c_list = nhs_df['hba1c_value'].to_list()
@@ -150,8 +187,7 @@ def predict(df, nhs_df):
     final = pd.DataFrame(data)
 
     final['subtraction_result'] = final['latest_hba1c_value']  - final['predicted_hba1c']
-
-    st.dataframe(final)
+    final.attrs['rescored'] = rescored
 
     return final
 
@@ -164,20 +200,16 @@ def predict(df, nhs_df):
 
 
 def highlight_subtraction_result(df):
-    # Define the style function with multiple conditions
-    def highlight(cell):
-        # Apply different colors based on the cell's value
-        if cell < -10:
-            color = '#fb923c'  # Highlight in red if the value is greater than 10
-        elif cell < -5:
-            color = '#fcd34d'  # Highlight in yellow if the value is greater than 5
-        else:
-            color = ''
-        return f'background-color: {color}'
-
-    # Apply the style function to the 'subtraction_result' column
-    styled_df = df.style.applymap(highlight, subset=['subtraction_result'])
+    # Colours for a predicted rise (subtraction_result is latest - predicted) of more than 10 and more than 5 mmol/mol
+    def highlight(column):
+        values = pd.to_numeric(column, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        return np.select(
+            [values < -10, values < -5],
+            ['background-color: #fb923c', 'background-color: #fcd34d'],
+            default='',
+        )
+
+    # Styled one column at a time (vectorized) rather than cell by cell - callers pass only the
+    # rows they show, since styling renders every cell it is given
+    styled_df = df.style.apply(highlight, subset=['subtraction_result'])
     return styled_df
-
-styled = highlight_subtraction_result(final)
-st.dataframe(styled)
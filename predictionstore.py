@@ -0,0 +1,128 @@
+"""
+This module contains a persistent store of HbA1c predictions, keyed by NHS number.
+
+Each stored prediction records a fingerprint (a hash of the patient's model input vector) and
+the version of the model that produced it. When a new dashboard is uploaded, only patients whose
+fingerprint or model version differ from the stored ones need to be re-scored; everyone else's
+prediction is read back from the store.
+
+The store is a SQLite database at PREDICTION_STORE_PATH, in the app's private data directory by
+default (see appdata.py; set the environment variable of the same name to keep it elsewhere).
+"""
+
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+
+from appdata import DATA_DIR, private_dir
+from patientindex import MISSING_KEY
+
+PREDICTION_STORE_PATH = os.environ.get("PREDICTION_STORE_PATH", os.path.join(DATA_DIR, "predictions.sqlite"))
+
+
+def feature_fingerprints(features):
+    """
+    Hashes each row of a feature matrix.
+
+    Parameters:
+    - features (pd.DataFrame): One row of model inputs per patient.
+
+    Returns:
+    - np.ndarray: int64 fingerprint per row (the same values always give the same fingerprint).
+    """
+    hashes = pd.util.hash_pandas_object(features, index=False).to_numpy()
+    return hashes.view(np.int64)
+
+
+class PredictionStore:
+    """
+    Class PredictionStore
+    ---------------------
+    Predictions keyed by NHS number, with the fingerprint and model version they were made for.
+
+    Methods:
+    - lookup: Returns stored predictions that are still valid for the given fingerprints.
+    - update: Saves new predictions.
+    - clear: Removes every stored prediction.
+    """
+
+    def __init__(self, path=PREDICTION_STORE_PATH):
+        self.path = path
+        private_dir(os.path.dirname(os.path.abspath(path)))
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "nhs_number INTEGER PRIMARY KEY, fingerprint INTEGER NOT NULL, "
+                "model_version TEXT NOT NULL, prediction REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call, as Streamlit may run the script on different threads; it is
+        # committed (or rolled back) and closed when the block exits
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            yield conn
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def lookup(self, keys, fingerprints, model_version):
+        """
+        Returns the stored predictions that are still valid.
+
+        Parameters:
+        - keys (np.ndarray): int64 patient keys (see patientindex.canonical_nhs_keys).
+        - fingerprints (np.ndarray): int64 feature fingerprints, one per key.
+        - model_version (str): Version of the model that would score the patients now.
+
+        Returns:
+        - np.ndarray: The stored prediction per key, or NaN where there is none, the patient's
+          fingerprint changed, or the prediction was made by another model version.
+        """
+        with self._connect() as conn:
+            stored = pd.read_sql_query(
+                "SELECT nhs_number, fingerprint, prediction FROM predictions "
+                "WHERE model_version = ? ORDER BY nhs_number",
+                conn,
+                params=(model_version,),
+            )
+
+        predictions = np.full(len(keys), np.nan)
+        if stored.empty:
+            return predictions
+        stored_keys = stored["nhs_number"].to_numpy(dtype=np.int64)
+        positions = np.minimum(np.searchsorted(stored_keys, keys), len(stored_keys) - 1)
+        valid = (
+            (stored_keys[positions] == keys)
+            & (stored["fingerprint"].to_numpy(dtype=np.int64)[positions] == fingerprints)
+            & (keys != MISSING_KEY)
+        )
+        predictions[valid] = stored["prediction"].to_numpy()[positions[valid]]
+        return predictions
+
+    def update(self, keys, fingerprints, model_version, predictions):
+        """
+        Saves predictions, replacing any stored for the same patients.
+        Rows with a missing patient key are skipped.
+        """
+        keep = keys != MISSING_KEY
+        now = time.time()
+        rows = zip(
+            keys[keep].tolist(),
+            fingerprints[keep].tolist(),
+            [model_version] * int(keep.sum()),
+            np.asarray(predictions, dtype=np.float64)[keep].tolist(),
+            [now] * int(keep.sum()),
+        )
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)", rows)
+
+    def clear(self):
+        """Removes every stored prediction."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM predictions")
@@ -0,0 +1,341 @@
+"""
+This module contains the capacity-aware recall scheduler used by the HCA Self-book and Online
+Pre-assessment tabs.
+
+Instead of one SMS list of every due patient, due patients are split into weekly invitation
+waves that match clinic capacity:
+- each patient gets a priority score from how long their selected tests are overdue, their
+  latest HbA1c and (optionally) their predicted HbA1c rise;
+- every invited patient needs an HCA slot, and patients with a high HbA1c also need a
+  clinician slot;
+- waves are filled in priority order, each wave up to the week's HCA and clinician capacity.
+
+Scores and wave assignment are vectorized (one pass per wave), so a PCN-sized register is
+scheduled in milliseconds. Each wave is exported as its own SMS CSV.
+"""
+
+import warnings
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from patientindex import MISSING_KEY, canonical_nhs_keys, isin_sorted, patient_key_index
+
+# Relative weight of each priority component
+DEFAULT_WEIGHTS = {"overdue": 0.5, "hba1c": 0.3, "predicted_rise": 0.2}
+
+# Tests are due 15 months after they were last done, unless another window is chosen (see main.DUE_MONTHS)
+DUE_AFTER_MONTHS = 15
+
+# Overdue durations at or beyond this count as fully overdue (and so do never-recorded tests)
+OVERDUE_CAP_DAYS = 730
+
+# HbA1c (mmol/mol) scored from 0 at the lower bound to 1 at the upper bound
+HBA1C_SCORE_RANGE = (48, 100)
+
+# Predicted HbA1c rise (mmol/mol) that scores 1
+RISE_CAP = 20
+
+# Predictions whose spread (standard deviation) is below this fraction of the latest HbA1c
+# values' spread are treated as degenerate, and the predicted rise is left out of the priority
+PREDICTION_MIN_SPREAD = 0.2
+
+# Patients at or above this HbA1c (mmol/mol) also need a clinician appointment
+CLINICIAN_HBA1C = 75
+
+# Longest schedule offered
+MAX_WAVES = 52
+
+
+def _unit_range(values, low, high):
+    """Scales values to [0, 1] between low and high; missing values score 0."""
+    return np.nan_to_num(np.clip((values - low) / (high - low), 0, 1), nan=0.0)
+
+
+def overdue_days(df, tests, today=None, due_months=DUE_AFTER_MONTHS):
+    """
+    Returns how many days each patient's most overdue test is past its due date.
+
+    Parameters:
+    - df (pd.DataFrame): Patients, with the tests' date columns.
+    - tests (list): Date columns of the tests (e.g. ["hba1c", "egfr"]).
+    - today (date, optional): Defaults to today.
+    - due_months (int): Months after which a test is due.
+
+    Returns:
+    - np.ndarray: float64 days (0 if not overdue), OVERDUE_CAP_DAYS for never-recorded tests.
+    """
+    cutoff = pd.Timestamp(today or date.today()) - pd.DateOffset(months=due_months)
+    days = np.zeros(len(df))
+    for test in tests:
+        if test not in df.columns:
+            continue
+        dates = pd.to_datetime(df[test], errors="coerce")
+        overdue = ((cutoff - dates) / pd.Timedelta(days=1)).to_numpy(dtype="float64", na_value=np.nan)
+        days = np.maximum(days, np.nan_to_num(overdue, nan=OVERDUE_CAP_DAYS))
+    return np.clip(days, 0, OVERDUE_CAP_DAYS)
+
+
+def predictions_usable(predictions):
+    """
+    Checks that predictions vary enough to rank patients by. A model fed the wrong inputs
+    predicts (nearly) the same value for everyone, which would make the predicted rise noise.
+
+    Parameters:
+    - predictions (pd.DataFrame): The prediction table (latest_hba1c_value, predicted_hba1c).
+
+    Returns:
+    - bool: False, with a warning, if the predictions are degenerate.
+    """
+    predicted = pd.to_numeric(predictions["predicted_hba1c"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    latest = pd.to_numeric(predictions["latest_hba1c_value"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    predicted, latest = predicted[~np.isnan(predicted)], latest[~np.isnan(latest)]
+    if len(predicted) < 2 or len(latest) < 2:
+        return True
+    spread, reference = np.std(predicted), np.std(latest)
+    if spread < 1e-6 or spread < PREDICTION_MIN_SPREAD * reference:
+        warnings.warn(
+            f"Predicted HbA1c values barely vary (SD {spread:.2f} against {reference:.2f} for the latest "
+            "values); the predicted rise is left out of the priority."
+        )
+        return False
+    return True
+
+
+def predicted_rise(df, predictions):
+    """
+    Looks up each patient's predicted HbA1c rise.
+
+    Parameters:
+    - df (pd.DataFrame): Patients, with an nhs_number column.
+    - predictions (pd.DataFrame): The prediction table (nhs_number, latest_hba1c_value, predicted_hba1c).
+
+    Returns:
+    - np.ndarray: float64 predicted rise in mmol/mol, NaN where there is no prediction.
+    """
+    keys = canonical_nhs_keys(predictions["nhs_number"])
+    rise = (
+        pd.to_numeric(predictions["predicted_hba1c"], errors="coerce")
+        - pd.to_numeric(predictions["latest_hba1c_value"], errors="coerce")
+    ).to_numpy(dtype="float64", na_value=np.nan)
+    keep = keys != MISSING_KEY
+    keys, rise = keys[keep], rise[keep]
+    order = np.argsort(keys, kind="stable")
+    keys, rise = keys[order], rise[order]
+
+    row_keys = patient_key_index(df).row_keys
+    found = isin_sorted(row_keys, keys)
+    result = np.full(len(df), np.nan)
+    result[found] = rise[np.searchsorted(keys, row_keys[found])]
+    return result
+
+
+def priority_scores(df, tests, predictions=None, weights=DEFAULT_WEIGHTS, today=None, due_months=DUE_AFTER_MONTHS):
+    """
+    Scores how urgently each patient should be invited.
+
+    Parameters:
+    - df (pd.DataFrame): The due patients.
+    - tests (list): Date columns of the tests the recall is for.
+    - predictions (pd.DataFrame, optional): The prediction table; without it, or if its predictions
+      are degenerate (see predictions_usable), the predicted rise is not used.
+    - weights (dict): Weight of the "overdue", "hba1c" and "predicted_rise" components.
+    - today (date, optional): Defaults to today.
+    - due_months (int): Months after which a test is due.
+
+    Returns:
+    - np.ndarray: float64 scores between 0 and 1 (the weighted mean of the components).
+    """
+    components = {
+        "overdue": overdue_days(df, tests, today, due_months) / OVERDUE_CAP_DAYS,
+        "hba1c": _unit_range(
+            pd.to_numeric(df["hba1c_value"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            if "hba1c_value" in df.columns else np.full(len(df), np.nan),
+            *HBA1C_SCORE_RANGE,
+        ),
+    }
+    if predictions is not None and len(predictions) and predictions_usable(predictions):
+        components["predicted_rise"] = _unit_range(predicted_rise(df, predictions), 0, RISE_CAP)
+
+    total_weight = sum(weights.get(name, 0) for name in components)
+    if total_weight <= 0:
+        return np.zeros(len(df))
+    return sum(weights.get(name, 0) * values for name, values in components.items()) / total_weight
+
+
+def needs_clinician(df, threshold=CLINICIAN_HBA1C):
+    """Returns a boolean mask of patients whose HbA1c means they also need a clinician slot."""
+    if "hba1c_value" not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    hba1c = pd.to_numeric(df["hba1c_value"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    return np.nan_to_num(hba1c, nan=0.0) >= threshold
+
+
+def assign_waves(scores, clinician, hca_capacity, clinician_capacity, max_waves=MAX_WAVES):
+    """
+    Assigns patients to weekly waves in priority order without exceeding either capacity.
+
+    Each wave is filled greedily: going down the priority list, a patient joins the wave if an
+    HCA slot is left and, when they need one, a clinician slot is left; patients who don't fit
+    move to the next wave. Each wave is one vectorized pass over the remaining patients.
+
+    Parameters:
+    - scores (np.ndarray): Priority score of each patient (higher goes first).
+    - clinician (np.ndarray): Boolean mask of patients who need a clinician slot.
+    - hca_capacity (int): HCA slots per wave.
+    - clinician_capacity (int): Clinician slots per wave.
+    - max_waves (int): Number of waves to fill.
+
+    Returns:
+    - np.ndarray: 0-based wave of each patient, -1 if they don't fit in `max_waves` waves.
+    """
+    waves = np.full(len(scores), -1, dtype=np.int64)
+    if hca_capacity <= 0:
+        return waves
+    remaining = np.argsort(-np.asarray(scores, dtype="float64"), kind="stable")
+    clinician = np.asarray(clinician, dtype=bool)
+
+    for wave in range(max_waves):
+        if len(remaining) == 0:
+            break
+        needs = clinician[remaining]
+        # Clinician patients fit until the clinician slots run out; everyone takes an HCA slot
+        fits = ~needs | (np.cumsum(needs) <= clinician_capacity)
+        joins = fits & (np.cumsum(fits) <= hca_capacity)
+        if not joins.any():
+            break
+        waves[remaining[joins]] = wave
+        remaining = remaining[~joins]
+    return waves
+
+
+def next_monday(today=None):
+    """Returns the first Monday after today."""
+    today = today or date.today()
+    return today + timedelta(days=7 - today.weekday())
+
+
+def schedule_recall(
+    due_patients,
+    sms_df,
+    actioned_df,
+    tests,
+    hca_capacity,
+    clinician_capacity,
+    start_date=None,
+    predictions=None,
+    weights=DEFAULT_WEIGHTS,
+    expected_uptake=1.0,
+    max_waves=MAX_WAVES,
+    due_months=DUE_AFTER_MONTHS,
+):
+    """
+    Schedules the due patients who can be invited by SMS into weekly invitation waves.
+
+    Patients who are not on the SMS register, or have already been actioned, are left out, so
+    they don't take up capacity.
+
+    Parameters:
+    - due_patients (pd.DataFrame): The due patients (from filter_due_patients).
+    - sms_df (pd.DataFrame): The Accurx SMS register.
+    - actioned_df (pd.DataFrame): Patients already actioned (Notion / Google Sheets).
+    - tests (list): Date columns of the tests the recall is for.
+    - hca_capacity (int): HCA slots per week.
+    - clinician_capacity (int): Clinician slots per week.
+    - start_date (date, optional): Date of the first wave; defaults to next Monday.
+    - predictions (pd.DataFrame, optional): The prediction table, to prioritise predicted rises.
+    - weights (dict): Priority weights (see priority_scores).
+    - expected_uptake (float): Share of invited patients expected to book; waves invite
+      capacity / expected_uptake patients so the slots are filled.
+    - max_waves (int): Number of weeks to schedule.
+    - due_months (int): The due window the patients were selected with.
+
+    Returns:
+    - pd.DataFrame: The contactable due patients with "priority", "needs_clinician", "wave"
+      (1-based, <NA> if they don't fit) and "wave_start" columns, in wave and priority order.
+    """
+    sms_keys = patient_key_index(sms_df).keys
+    if actioned_df is not None and "nhs_number" in actioned_df.columns:
+        sms_keys = np.setdiff1d(sms_keys, patient_key_index(actioned_df).keys, assume_unique=True)
+    patients = due_patients[patient_key_index(due_patients).rows_in(sms_keys)].copy()
+
+    scores = priority_scores(patients, tests, predictions, weights, due_months=due_months)
+    clinician = needs_clinician(patients)
+    uptake = min(max(expected_uptake, 0.05), 1.0)
+    waves = assign_waves(
+        scores, clinician, int(hca_capacity / uptake), int(clinician_capacity / uptake), max_waves
+    )
+
+    start = pd.Timestamp(start_date or next_monday())
+    patients["priority"] = scores.round(3)
+    patients["needs_clinician"] = clinician
+    patients["wave"] = pd.arrays.IntegerArray(waves + 1, waves < 0)
+    patients["wave_start"] = pd.Series(start + pd.to_timedelta(7 * waves, unit="D"), index=patients.index).where(waves >= 0)
+
+    order = np.lexsort((-scores, np.where(waves < 0, max_waves, waves)))
+    return patients.iloc[order]
+
+
+def wave_summary(schedule):
+    """
+    Summarises a schedule per wave.
+
+    Returns:
+    - pd.DataFrame: One row per wave with its start date, the number of patients invited and how
+      many of them need a clinician slot, plus a final "Unscheduled" row if any patients didn't fit.
+    """
+    scheduled = schedule[schedule["wave"].notna()]
+    summary = (
+        scheduled.groupby("wave", sort=True)
+        .agg(wave_start=("wave_start", "first"), patients=("wave", "size"), clinician=("needs_clinician", "sum"))
+        .reset_index()
+    )
+    summary["wave_start"] = summary["wave_start"].dt.date.astype(str)
+    summary["wave"] = summary["wave"].astype(str)
+    unscheduled = int(schedule["wave"].isna().sum())
+    if unscheduled:
+        summary.loc[len(summary)] = {
+            "wave": "Unscheduled",
+            "wave_start": "",
+            "patients": unscheduled,
+            "clinician": int(schedule.loc[schedule["wave"].isna(), "needs_clinician"].sum()),
+        }
+    return summary
+
+
+def wave_cohorts(schedule, sms_df, filename):
+    """
+    Splits the SMS register rows of a schedule into one cohort per wave.
+
+    Parameters:
+    - schedule (pd.DataFrame): The output of schedule_recall.
+    - sms_df (pd.DataFrame): The Accurx SMS register.
+    - filename (str): Base CSV name, e.g. "hca_selfbook_sms.csv".
+
+    Returns:
+    - dict: Maps each wave's CSV name (e.g. "hca_selfbook_sms_wave01_2026-10-19.csv") to its SMS rows.
+    """
+    scheduled = schedule[schedule["wave"].notna()]
+    keys = patient_key_index(scheduled).row_keys
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    waves = scheduled["wave"].to_numpy(dtype="int64")[order]
+    starts = scheduled["wave_start"].to_numpy()[order]
+
+    sms_index = patient_key_index(sms_df)
+    in_schedule = sms_index.rows_in(keys)
+    sms_rows = sms_df[in_schedule].copy()
+    positions = np.searchsorted(keys, sms_index.row_keys[in_schedule])
+    sms_rows["nhs_number"] = pd.array(sms_index.row_keys[in_schedule], dtype="Int64")
+    row_waves = waves[positions]
+
+    stem = filename[:-4] if filename.endswith(".csv") else filename
+    width = max(2, len(str(row_waves.max(initial=0))))
+    wave_ids, first = np.unique(waves, return_index=True)
+    wave_starts = dict(zip(wave_ids.tolist(), starts[first]))
+    cohorts = {}
+    for wave in np.unique(row_waves).tolist():
+        name = f"{stem}_wave{wave:0{width}d}_{pd.Timestamp(wave_starts[wave]):%Y-%m-%d}.csv"
+        cohorts[name] = sms_rows[row_waves == wave]
+    return cohorts
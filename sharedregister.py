@@ -0,0 +1,151 @@
+"""
+This module contains the shared, memory-mapped copy of the preprocessed Diabetes Dashboard.
+
+st.cache_data gives every session its own unpickled copy of the preprocessed register, so memory
+grew with the number of staff using the app. Instead, each upload is preprocessed once and
+published as an immutable, uncompressed Arrow IPC (Feather v2) file named by a hash of the
+upload. Every session and every server process memory-maps that file read-only:
+- numeric, date and category columns are views of the mapped pages, which the operating system
+  shares between processes, so another session opening the register costs almost no RAM;
+- dates are stored without Arrow nulls (NaT keeps its int64 value) and floats keep NaN as a
+  value, because pyarrow has to copy a column to fill in nulls;
+- a second server process that receives the same upload finds the file and skips preprocessing.
+
+Published files are never changed. Sessions are handed a shallow copy of the mapped frame, and
+under pandas' copy-on-write a session that modifies a column gets its own copy of that column
+only. Copy-on-write is the default from pandas 3 and is switched on here for earlier versions,
+where an in-place write would otherwise hit the read-only mapped buffer. Registers are
+positional: the index is not stored (preprocessing keeps a RangeIndex).
+
+The files hold the whole patient register, so they live in REGISTER_DIR, in the app's private
+data directory by default (see appdata.py); the newest KEEP_REGISTERS are kept.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from appdata import DATA_DIR, private_dir
+
+# Sessions share the mapped columns, which are read-only: writes must copy them first
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+REGISTER_DIR = os.environ.get("REGISTER_DIR", os.path.join(DATA_DIR, "registers"))
+
+# Published registers kept on disk; older ones are deleted (open mappings stay valid)
+KEEP_REGISTERS = 8
+
+# Part of every register's name; bump it when preprocessing changes the register's layout
+REGISTER_VERSION = 2
+
+_ATTRS_KEY = b"a1sense_attrs"
+
+
+def register_key(data, col_list):
+    """
+    Returns the name of the register for an upload.
+
+    Parameters:
+    - data (bytes): The raw dashboard CSV.
+    - col_list (list): The date columns it is preprocessed with.
+
+    Returns:
+    - str: A hex digest of the register version, the date columns and the upload.
+    """
+    digest = hashlib.sha256(f"{REGISTER_VERSION}|{'|'.join(col_list)}|".encode())
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def register_path(key, directory=None):
+    """Returns the file a register is published to."""
+    return os.path.join(directory or REGISTER_DIR, f"register-{key}.arrow")
+
+
+def _to_arrow_column(series):
+    values = series.to_numpy() if series.dtype.kind in "fM" else None
+    if series.dtype.kind == "M":
+        # NaT is kept as its int64 value rather than a null, so reading it back needs no copy
+        unit = np.datetime_data(values.dtype)[0]
+        return pa.Array.from_buffers(pa.timestamp(unit), len(values), [None, pa.py_buffer(values.view(np.int64))])
+    if series.dtype.kind == "f":
+        return pa.array(values, from_pandas=False)
+    return pa.Array.from_pandas(series)
+
+
+def to_arrow_table(df):
+    """
+    Converts a preprocessed dashboard to the register layout.
+
+    Parameters:
+    - df (pd.DataFrame): The preprocessed dashboard.
+
+    Returns:
+    - pa.Table: The table, with pandas' dtype metadata (categories, nullable integers) and
+      df.attrs in its schema metadata.
+    """
+    table = pa.Table.from_arrays([_to_arrow_column(df[col]) for col in df.columns], names=list(map(str, df.columns)))
+    metadata = dict(pa.Table.from_pandas(df.iloc[0:0], preserve_index=False).schema.metadata or {})
+    metadata[_ATTRS_KEY] = json.dumps(df.attrs, default=str).encode()
+    return table.replace_schema_metadata(metadata)
+
+
+def publish(df, path):
+    """
+    Writes a register, atomically: readers see either no file or the complete one.
+
+    Parameters:
+    - df (pd.DataFrame): The preprocessed dashboard.
+    - path (str): The register file (see register_path).
+
+    Returns:
+    - str: The path.
+    """
+    import pyarrow.feather as feather
+
+    private_dir(os.path.dirname(path))
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    table = to_arrow_table(df)
+    # Uncompressed and in one record batch, so each column maps to one contiguous buffer
+    # (a column split across batches would be concatenated, i.e. copied, when read)
+    feather.write_feather(table, tmp_path, compression="uncompressed", chunksize=max(1, table.num_rows))
+    os.replace(tmp_path, path)
+    print(f"📤 Published shared register {os.path.basename(path)} ({os.path.getsize(path) / 1e6:.1f} MB)")
+    prune(os.path.dirname(path))
+    return path
+
+
+def open_register(path):
+    """
+    Memory-maps a published register.
+
+    Parameters:
+    - path (str): The register file.
+
+    Returns:
+    - pd.DataFrame: The register. Treat it as read-only: its columns are views of the file.
+    """
+    source = pa.memory_map(path, "r")
+    table = pa.ipc.open_file(source).read_all()
+    # split_blocks keeps each column a view of its own buffer instead of consolidating (copying) them
+    df = table.to_pandas(split_blocks=True, self_destruct=False)
+    df.attrs.update(json.loads((table.schema.metadata or {}).get(_ATTRS_KEY, b"{}")))
+    return df
+
+
+def prune(directory=None, keep=KEEP_REGISTERS):
+    """Deletes all but the `keep` most recently published registers."""
+    paths = sorted(glob.glob(os.path.join(directory or REGISTER_DIR, "register-*.arrow")), key=os.path.getmtime)
+    for path in paths[:-keep] if keep > 0 else paths:
+        try:
+            os.remove(path)
+        except OSError:
+            # Still being replaced, or removed by another process
+            pass
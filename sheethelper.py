@@ -1,6 +1,6 @@
 import pandas as pd
-import gspread
-from google.oauth2 import service_account
+
+from httptransport import sheets_client_from_file
 
 
 class SheetHelper:
@@ -31,15 +31,8 @@ class SheetHelper:
         Returns:
         - gspread.models.Worksheet: The authenticated worksheet instance.
         """
-        credentials = service_account.Credentials.from_service_account_file(
-            secret_file_path
-        )
-        scope = [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/drive",
-        ]
-        creds = credentials.with_scopes(scope)
-        client = gspread.authorize(creds)
+        # The client (and its access token and connections) is shared by all SheetHelpers
+        client = sheets_client_from_file(secret_file_path)
         sheet = client.open_by_url(sheet_url)
         return sheet.get_worksheet(sheet_id)
 
@@ -0,0 +1,116 @@
+"""
+This module contains the SMS export used by the download buttons.
+Cohorts are written to CSV in row chunks rather than as one in-memory string, split into
+Accurx-sized batch files and, when there is more than one file, bundled into a single ZIP.
+"""
+
+import hashlib
+import io
+import os
+import zipfile
+
+import pandas as pd
+
+# Maximum number of patients per Accurx batch file
+ACCURX_BATCH_SIZE = 1000
+
+# Number of rows rendered to CSV at a time
+CSV_CHUNK_ROWS = 500
+
+
+def cohort_fingerprint(df):
+    """
+    Returns a stable fingerprint of a cohort's contents, used as the export cache key.
+
+    Parameters:
+    - df (pd.DataFrame): The cohort to export.
+
+    Returns:
+    - str: A hex digest of the column names and row values.
+    """
+    digest = hashlib.sha1()
+    digest.update("|".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def iter_csv_chunks(df, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Yields a frame as CSV text, `chunk_rows` rows at a time. The header is in the first chunk.
+
+    Parameters:
+    - df (pd.DataFrame): The frame to render.
+    - chunk_rows (int): Number of rows per chunk.
+    """
+    if df.empty:
+        yield df.to_csv(index=False)
+        return
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0)
+
+
+def split_batches(df, batch_size=ACCURX_BATCH_SIZE):
+    """
+    Splits a cohort into Accurx-sized batches.
+
+    Parameters:
+    - df (pd.DataFrame): The cohort to split.
+    - batch_size (int): Maximum number of rows per batch.
+
+    Returns:
+    - list of pd.DataFrame: The batches (a single empty frame if the cohort is empty).
+    """
+    if df.empty:
+        return [df]
+    return [df.iloc[start:start + batch_size] for start in range(0, len(df), batch_size)]
+
+
+def batch_filenames(filename, n_batches):
+    """Returns the file name of each batch, e.g. 'rewind_sms_part01.csv' when there is more than one."""
+    if n_batches == 1:
+        return [filename]
+    stem, ext = os.path.splitext(filename)
+    width = max(2, len(str(n_batches)))
+    return [f"{stem}_part{i:0{width}d}{ext}" for i in range(1, n_batches + 1)]
+
+
+def write_csv(df, stream):
+    """Writes a frame to a binary stream as UTF-8 CSV, chunk by chunk."""
+    for chunk in iter_csv_chunks(df):
+        stream.write(chunk.encode("utf-8"))
+
+
+def build_sms_export(cohorts, batch_size=ACCURX_BATCH_SIZE, as_zip=False):
+    """
+    Builds the export file for one or more SMS cohorts.
+
+    A single cohort that fits in one batch is returned as a plain CSV unless `as_zip` is set.
+    Otherwise every batch file of every cohort is written into one ZIP archive.
+
+    Parameters:
+    - cohorts (dict): Maps each CSV file name to the cohort DataFrame to export.
+    - batch_size (int): Maximum number of patients per batch file.
+    - as_zip (bool): Always bundle the files into a ZIP archive.
+
+    Returns:
+    - tuple: (data as bytes, download file name, mime type)
+    """
+    files = []
+    for filename, df in cohorts.items():
+        batches = split_batches(df, batch_size)
+        files.extend(zip(batch_filenames(filename, len(batches)), batches))
+
+    if len(files) == 1 and not as_zip:
+        filename, df = files[0]
+        buffer = io.BytesIO()
+        write_csv(df, buffer)
+        return buffer.getvalue(), filename, "text/csv"
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, df in files:
+            with archive.open(filename, "w") as entry:
+                write_csv(df, entry)
+
+    zip_name = os.path.splitext(next(iter(cohorts)))[0] + ".zip"
+    return buffer.getvalue(), zip_name, "application/zip"
@@ -0,0 +1,272 @@
+"""
+This module contains an append-only store of preprocessed dashboard snapshots for trend queries.
+
+Every uploaded Diabetes Dashboard is written, after preprocessing, as one Parquet file in a
+month partition (SNAPSHOT_DIR/month=YYYY-MM/snapshot-<date>-<hash>.parquet). Files are never
+rewritten: the name includes a hash of the exported contents, and a snapshot with the same hash
+in any partition is reused, so uploading the same dashboard twice - on any day - is a no-op. Rows are sorted by patient key, so the Parquet row-group statistics let a per-patient
+query skip most of each file.
+
+Queries only read the partitions in the requested month range and the requested columns.
+Cohort trends are aggregated one snapshot file at a time, and since files never change, each
+file's aggregate is memoized: after years of monthly snapshots a trend view only reads the new
+months.
+
+Old exports can be backfilled from the command line:
+    python snapshotstore.py add old_exports/dashboard_2024-05.csv --date 2024-05-01
+    python snapshotstore.py list
+"""
+
+import argparse
+import functools
+import glob
+import hashlib
+import os
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from appdata import DATA_DIR, private_dir
+from patientindex import canonical_nhs_keys
+
+# Snapshots hold NHS numbers and clinical values, so they are kept in the app's private data directory
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join(DATA_DIR, "snapshots"))
+
+# Clinical values the trend views offer
+TREND_COLUMNS = ["hba1c_value", "latest_egfr", "sbp", "dbp", "total_chol", "latest_ldl", "latest_bmi"]
+
+# Snapshot columns that depend on the day the dashboard was uploaded rather than on the export,
+# left out of the content hash
+UPLOAD_DAY_COLUMNS = ["snapshot_date", "age", "lenght_of_diagnosis_years"]
+
+# Rows per Parquet row group; smaller groups let per-patient queries skip more data
+ROW_GROUP_SIZE = 10_000
+
+
+def prepare_snapshot(df, snapshot_date):
+    """
+    Converts a preprocessed dashboard to the snapshot layout.
+
+    Dtypes chosen by compaction can differ between uploads (e.g. float32 one month, float64 the
+    next), so numbers are stored as float64 and categories as strings, keeping the schema the
+    same across snapshots. Parquet's own encodings keep the files small.
+
+    Parameters:
+    - df (pd.DataFrame): The preprocessed dashboard.
+    - snapshot_date (date): The date the dashboard was exported.
+
+    Returns:
+    - pd.DataFrame: The snapshot rows, sorted by patient_key.
+    """
+    snapshot = pd.DataFrame(index=df.index)
+    snapshot["patient_key"] = canonical_nhs_keys(df["nhs_number"])
+    snapshot["snapshot_date"] = pd.Timestamp(snapshot_date).as_unit("ms")
+    for col in df.columns:
+        series = df[col]
+        if col.endswith("_days") and col[: -len("_days")] in df.columns:
+            # Days since a date only mean something on the day they were counted; the date is kept
+            continue
+        if pd.api.types.is_datetime64_any_dtype(series):
+            snapshot[col] = series.astype("datetime64[ms]")
+        elif pd.api.types.is_bool_dtype(series):
+            snapshot[col] = series.astype("boolean")
+        elif pd.api.types.is_numeric_dtype(series):
+            snapshot[col] = series.astype("float64")
+        else:
+            snapshot[col] = series.astype("string")
+    return snapshot.sort_values("patient_key", kind="stable").reset_index(drop=True)
+
+
+@functools.lru_cache(maxsize=4096)
+def _snapshot_aggregate(path, columns, stat):
+    """Aggregates the given columns of one (immutable) snapshot file."""
+    import pyarrow.parquet as pq
+
+    available = set(pq.read_schema(path).names)
+    table = pq.read_table(path, columns=[c for c in columns if c in available])
+    values = table.to_pandas()
+    row = {col: getattr(values[col], stat)() if col in values else np.nan for col in columns}
+    row["patients"] = table.num_rows
+    return row
+
+
+class SnapshotStore:
+    """
+    Class SnapshotStore
+    -------------------
+    Month-partitioned Parquet snapshots of the preprocessed dashboard.
+
+    Methods:
+    - write: Appends a snapshot (a no-op if the same export is already stored).
+    - snapshots: Lists the stored snapshots.
+    - patient_series: Returns one patient's values across snapshots.
+    - cohort_trend: Returns a per-snapshot aggregate of values, for everyone or a cohort.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR):
+        self.root = root
+
+    def write(self, df, snapshot_date=None):
+        """
+        Appends a preprocessed dashboard to the store.
+
+        Parameters:
+        - df (pd.DataFrame): The preprocessed dashboard.
+        - snapshot_date (date, optional): The export date; defaults to today.
+
+        Returns:
+        - str: Path of the snapshot file, or of the stored snapshot of the same export.
+        """
+        snapshot_date = snapshot_date or date.today()
+        snapshot = prepare_snapshot(df, snapshot_date)
+        exported = snapshot.drop(columns=[c for c in UPLOAD_DAY_COLUMNS if c in snapshot.columns])
+        digest = hashlib.sha1(pd.util.hash_pandas_object(exported, index=False).to_numpy().tobytes()).hexdigest()[:10]
+        # The same export re-uploaded on a later day (or month) is not a new snapshot
+        existing = glob.glob(os.path.join(self.root, "month=*", f"snapshot-*-{digest}.parquet"))
+        if existing:
+            return existing[0]
+
+        partition = os.path.join(self.root, f"month={snapshot_date:%Y-%m}")
+        path = os.path.join(partition, f"snapshot-{snapshot_date:%Y-%m-%d}-{digest}.parquet")
+
+        private_dir(self.root)
+        private_dir(partition)
+        tmp_path = path + ".tmp"
+        snapshot.to_parquet(tmp_path, index=False, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+        print(f"📸 Saved dashboard snapshot {os.path.relpath(path, self.root)} - ✅")
+        return path
+
+    def _files(self, start=None, end=None):
+        """Returns the snapshot files in months start..end ("YYYY-MM", inclusive), oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        files = []
+        for partition in sorted(os.listdir(self.root)):
+            if not partition.startswith("month="):
+                continue
+            month = partition.split("=", 1)[1]
+            if (start and month < start) or (end and month > end):
+                continue
+            folder = os.path.join(self.root, partition)
+            files.extend(
+                os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith(".parquet")
+            )
+        return files
+
+    def snapshots(self):
+        """Returns a DataFrame with the month, date, path and row count of every snapshot."""
+        import pyarrow.parquet as pq
+
+        rows = []
+        for path in self._files():
+            name = os.path.basename(path)
+            rows.append({
+                "month": os.path.basename(os.path.dirname(path)).split("=", 1)[1],
+                "snapshot_date": pd.Timestamp(name[len("snapshot-"):len("snapshot-") + 10]),
+                "patients": pq.ParquetFile(path).metadata.num_rows,
+                "path": path,
+            })
+        return pd.DataFrame(rows, columns=["month", "snapshot_date", "patients", "path"])
+
+    def patient_series(self, nhs_number, columns=TREND_COLUMNS, start=None, end=None):
+        """
+        Returns one patient's values across snapshots.
+
+        Parameters:
+        - nhs_number (str or int): The patient's NHS number.
+        - columns (list): Columns to return.
+        - start, end (str, optional): First and last month to include ("YYYY-MM").
+
+        Returns:
+        - pd.DataFrame: One row per snapshot the patient appears in, indexed by snapshot_date.
+        """
+        import pyarrow.dataset as ds
+
+        files = self._files(start, end)
+        key = int(canonical_nhs_keys(pd.Series([nhs_number]))[0])
+        if not files:
+            return pd.DataFrame(columns=list(columns), index=pd.DatetimeIndex([], name="snapshot_date"))
+
+        dataset = ds.dataset(files, format="parquet", schema=self._schema(tuple(files)))
+        table = dataset.to_table(
+            columns=["snapshot_date"] + [c for c in columns if c in dataset.schema.names],
+            filter=ds.field("patient_key") == key,
+        )
+        return table.to_pandas().set_index("snapshot_date").sort_index().reindex(columns=list(columns))
+
+    def cohort_trend(self, columns=TREND_COLUMNS, stat="mean", start=None, end=None, nhs_numbers=None):
+        """
+        Returns a per-snapshot aggregate of clinical values.
+
+        Parameters:
+        - columns (list): Columns to aggregate.
+        - stat (str): "mean" or "median".
+        - start, end (str, optional): First and last month to include ("YYYY-MM").
+        - nhs_numbers (iterable, optional): Restrict the trend to these patients.
+
+        Returns:
+        - pd.DataFrame: One row per snapshot, indexed by snapshot_date, with the aggregated
+          columns and the number of patients.
+        """
+        files = self._files(start, end)
+        columns = tuple(columns)
+        if nhs_numbers is None:
+            rows = [_snapshot_aggregate(path, columns, stat) for path in files]
+        else:
+            rows = [self._cohort_aggregate(path, columns, stat, nhs_numbers) for path in files]
+
+        trend = pd.DataFrame(rows, columns=list(columns) + ["patients"])
+        trend.index = pd.DatetimeIndex(
+            [pd.Timestamp(os.path.basename(path)[len("snapshot-"):len("snapshot-") + 10]) for path in files],
+            name="snapshot_date",
+        )
+        return trend
+
+    def _cohort_aggregate(self, path, columns, stat, nhs_numbers):
+        import pyarrow.dataset as ds
+
+        keys = np.unique(canonical_nhs_keys(pd.Series(list(nhs_numbers))))
+        dataset = ds.dataset(path, format="parquet")
+        table = dataset.to_table(
+            columns=[c for c in columns if c in dataset.schema.names],
+            filter=ds.field("patient_key").isin(keys),
+        )
+        values = table.to_pandas()
+        row = {col: getattr(values[col], stat)() if col in values else np.nan for col in columns}
+        row["patients"] = table.num_rows
+        return row
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _schema(files):
+        """Unified schema of the given snapshot files (columns may be added over time)."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        return pa.unify_schemas([pq.read_schema(path) for path in files])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the dashboard snapshot store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add = subparsers.add_parser("add", help="Preprocess a Diabetes Dashboard CSV and store it as a snapshot.")
+    add.add_argument("csv", help="Path of the exported dashboard CSV.")
+    add.add_argument("--date", default=None, help="Export date (YYYY-MM-DD); defaults to today.")
+    subparsers.add_parser("list", help="List the stored snapshots.")
+    args = parser.parse_args()
+
+    store = SnapshotStore()
+    if args.command == "add":
+        from main import preprocess_dashboard, date_cols
+
+        snapshot_date = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else None
+        df = preprocess_dashboard(args.csv, date_cols)
+        store.write(df, snapshot_date)
+    elif args.command == "list":
+        print(store.snapshots().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+This module generates synthetic Diabetes Dashboard, Accurx SMS and actioned-patient files.
+The dashboard follows the raw export layout used by load_and_preprocess_dashboard (the date
+columns in date_cols, the columns in columns_to_drop and the prediction feature columns), so
+the generated files can be pushed through the real pipeline. All values are random - no real
+patient data is involved. Generation is vectorized and scales from 1k to 1M patients.
+
+Usage:
+    python synthetic.py --patients 10000 --out synthetic_data
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Raw dashboard date columns, lower-cased by update_column_names to the names in main.date_cols
+DATE_COLUMNS = [
+    "DOB", "First DM Diagnosis", "Annual Review Done", "HbA1c", "BP", "Cholesterol", "BMI",
+    "eGFR", "Urine ACR", "Smoking", "Foot Risk", "MH Screen - DDS or PHQ", "Patient Goals",
+    "Care Plan", "Education", "Hypo Monitoring", "Next Appt Date", "9 KCP Complete",
+    "3 Levels to Target", "Retinal Screening", "Care Planning Consultation", "Statin Date",
+    "Review Due",
+]
+
+MEDICATION_COLUMNS = [
+    "Metformin", "Sulphonylurea", "DPP4", "SGLT2", "Pioglitazone", "GLP-1",
+    "Basal / Mix Insulin", "Rapid Acting Insulin", "ACEi/ARB", "Calcium Channel Blocker",
+    "Diuretic", "Beta Blocker", "Spironolactone", "Doxazosin",
+]
+
+# Earlier HbA1c results; Column1-Column8 are prediction model inputs, Column9 is dropped
+HBA1C_HISTORY_COLUMNS = [f"Column{i}" for i in range(1, 10)]
+
+# Other raw columns dropped during preprocessing (main.columns_to_drop)
+DROPPED_COLUMNS = (
+    [
+        "Group consultations", "Hypo Mon Denom", "Month of Birth", "EFi Score", "Frailty",
+        "QoF Invites Done", "QoF DM006D", "QoF DM006 Achieved", "QoF DM012D", "QoF DM012 Achieved",
+        "QoF DM014D", "QoF DM014 Achieved", "QoF BP Done", "QoF DM019D", "QoF DM019 Achieved",
+        "QoF HbA1c Done", "QoF DM020D", "QoF DM020 Achieved", "QoF DM021D", "QoF DM021 Achieved",
+        "QoF DM022D", "QoF DM022 Achieved", "QoF DM023D", "QoF DM023 Achieved", "HbA1c Trend",
+        "Diag L6y HbA1c <=53", "Type 1", "Type 2", "Both Types Recorded", "No Type Recorded",
+        "Outstanding ES Count", "Outstanding QoF Count", "Total Outstanding", "Next Appt with",
+        "Number Future Appts", "COVID-19 High Risk", "GLP-1 or Insulin",
+    ]
+    + [f"Unnamed: {i}" for i in range(110, 118)]
+)
+
+STATINS = [
+    "Atorvastatin 20mg tablets", "Atorvastatin 40mg tablets", "Atorvastatin 80mg tablets",
+    "Simvastatin 40mg tablets", "Rosuvastatin 10mg tablets", "Pravastatin 20mg tablets", "",
+]
+
+ETHNICITIES = ["White British", "Asian or Asian British", "Black or Black British", "Mixed", "Other", "Not Stated"]
+
+DIABETES_TYPES = [
+    "Type 2", "Type 1", "Both Types - Latest Type 2", "Both Types - Latest Type 1",
+    "No Type Recorded", "Both Types - Check",
+]
+
+FIRST_NAMES = ["Alex", "Sam", "Jo", "Chris", "Pat", "Jamie", "Robin", "Charlie", "Taylor", "Morgan"]
+
+# Placeholder the dashboard uses for "never recorded"
+MISSING_DATE = "01/01/1900"
+
+
+def generate_nhs_numbers(n, rng):
+    """
+    Generates `n` unique, Modulus-11 valid NHS numbers.
+
+    Parameters:
+    - n (int): Number of NHS numbers.
+    - rng (np.random.Generator): Random generator.
+
+    Returns:
+    - np.ndarray: int64 NHS numbers.
+    """
+    weights = np.arange(10, 1, -1)
+    numbers = np.empty(0, dtype=np.int64)
+    while len(numbers) < n:
+        stems = rng.integers(100_000_000, 999_999_999, size=2 * (n - len(numbers)) + 16, dtype=np.int64)
+        digits = (stems[:, None] // 10 ** np.arange(8, -1, -1)) % 10
+        check = 11 - (digits @ weights) % 11
+        check[check == 11] = 0
+        valid = check != 10
+        candidates = stems[valid] * 10 + check[valid]
+        numbers = np.unique(np.concatenate([numbers, candidates]))
+    return rng.permutation(numbers)[:n]
+
+
+def _random_dates(rng, n, start, end, missing_rate=0.05):
+    """Returns ISO date strings uniformly between `start` and `end`, with some missing placeholders."""
+    start_day = np.datetime64(start, "D").astype(np.int64)
+    end_day = np.datetime64(end, "D").astype(np.int64)
+    days = rng.integers(start_day, end_day, size=n).astype("datetime64[D]")
+    dates = np.datetime_as_string(days).astype(object)
+    dates[rng.random(n) < missing_rate] = MISSING_DATE
+    return dates
+
+
+def generate_dashboard(n_patients, seed=0, today=None):
+    """
+    Generates a synthetic raw Diabetes Dashboard export.
+
+    Parameters:
+    - n_patients (int): Number of patients on the register.
+    - seed (int): Random seed.
+    - today (str, optional): Reference date for the generated dates (defaults to today).
+
+    Returns:
+    - pd.DataFrame: A DataFrame with the raw dashboard column names.
+    """
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(today or pd.Timestamp.today()).normalize()
+    recent = (today - pd.DateOffset(months=30)).date()
+    n = n_patients
+
+    data = {"NHS Number": generate_nhs_numbers(n, rng)}
+
+    for col in DATE_COLUMNS:
+        if col == "DOB":
+            data[col] = _random_dates(rng, n, "1935-01-01", "2005-01-01", missing_rate=0)
+        elif col == "First DM Diagnosis":
+            data[col] = _random_dates(rng, n, "1985-01-01", str(today.date()), missing_rate=0)
+        elif col in ("Next Appt Date", "Review Due"):
+            data[col] = _random_dates(rng, n, str(today.date()), str((today + pd.DateOffset(months=6)).date()), missing_rate=0.5)
+        else:
+            data[col] = _random_dates(rng, n, str(recent), str(today.date()))
+
+    hba1c = rng.gamma(9.0, 6.5, size=n).clip(30, 150).round()
+    data.update({
+        "IMD Decile": rng.integers(1, 11, size=n),
+        "BAME": rng.choice(["No", "Yes", "NK"], size=n, p=[0.6, 0.35, 0.05]),
+        "Ethnicity": rng.choice(ETHNICITIES, size=n),
+        "Diabetes Diagnosis": rng.choice(DIABETES_TYPES, size=n, p=[0.85, 0.08, 0.02, 0.01, 0.03, 0.01]),
+        "HbA1c Value": hba1c,
+        "SBP": rng.normal(135, 15, size=n).round(),
+        "DBP": rng.normal(80, 10, size=n).round(),
+        "Total Chol": rng.normal(4.5, 1.0, size=n).round(1),
+        "Non-HDL Chol": rng.normal(3.2, 0.9, size=n).round(1),
+        "Latest HDL": rng.normal(1.2, 0.3, size=n).round(1),
+        "Latest LDL": rng.normal(2.4, 0.8, size=n).round(1),
+        "Latest eGFR": rng.normal(75, 20, size=n).clip(5, 120).round(),
+        "Latest BMI": rng.normal(30, 6, size=n).clip(15, 60).round(1),
+        "Latest QRISK2": np.char.add(rng.uniform(1, 45, size=n).round(1).astype(str), "%"),
+        "Statin": rng.choice(STATINS, size=n),
+        "Eligible for Rewind": rng.choice(["Yes", "No"], size=n, p=[0.3, 0.7]),
+        "Rewind - Started": rng.choice([0, 1], size=n, p=[0.85, 0.15]),
+        "Struc Educ in L5y": rng.choice([0, 1], size=n),
+        "Struc Educ in 12m Diag": rng.choice([0, 1], size=n),
+    })
+    for col in MEDICATION_COLUMNS:
+        data[col] = rng.choice(["Yes", "No"], size=n, p=[0.3, 0.7])
+
+    for col in HBA1C_HISTORY_COLUMNS:
+        data[col] = (hba1c + rng.normal(0, 8, size=n)).clip(30, 150).round()
+    for col in DROPPED_COLUMNS:
+        data[col] = rng.integers(0, 2, size=n)
+
+    return pd.DataFrame(data)
+
+
+def generate_sms_register(dashboard_df, coverage=0.95, seed=0):
+    """
+    Generates an Accurx SMS register for the patients on a synthetic dashboard.
+
+    Parameters:
+    - dashboard_df (pd.DataFrame): A dashboard from generate_dashboard.
+    - coverage (float): Fraction of dashboard patients with a mobile number on the register.
+    - seed (int): Random seed.
+
+    Returns:
+    - pd.DataFrame: The SMS register with an 'nhs_number' column, as expected by extract_sms_df.
+    """
+    rng = np.random.default_rng(seed + 1)
+    keep = rng.random(len(dashboard_df)) < coverage
+    nhs_numbers = dashboard_df["NHS Number"].to_numpy()[keep]
+    n = len(nhs_numbers)
+    phone = np.char.add("07", rng.integers(100_000_000, 999_999_999, size=n).astype(str))
+    first_names = rng.choice(FIRST_NAMES, size=n)
+    return pd.DataFrame({
+        "nhs_number": nhs_numbers,
+        "Preferred Telephone number": phone,
+        "Date of birth": dashboard_df["DOB"].to_numpy()[keep],
+        "First name": first_names,
+        "Email": np.char.add(np.char.lower(first_names.astype(str)), np.char.add(nhs_numbers.astype(str), "@example.com")),
+    })
+
+
+def generate_actioned(dashboard_df, fraction=0.1, seed=0):
+    """
+    Generates a list of already actioned patients, as loaded from Notion or Google Sheets.
+
+    Parameters:
+    - dashboard_df (pd.DataFrame): A dashboard from generate_dashboard.
+    - fraction (float): Fraction of dashboard patients already actioned.
+    - seed (int): Random seed.
+
+    Returns:
+    - pd.DataFrame: A DataFrame with 'nhs_number' and 'Name' columns.
+    """
+    rng = np.random.default_rng(seed + 2)
+    keep = rng.random(len(dashboard_df)) < fraction
+    nhs_numbers = dashboard_df["NHS Number"].to_numpy()[keep]
+    return pd.DataFrame({"nhs_number": nhs_numbers, "Name": rng.choice(FIRST_NAMES, size=len(nhs_numbers))})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic Diabetes Dashboard and Accurx SMS csv files.")
+    parser.add_argument("--patients", type=int, default=10_000, help="Number of patients on the register.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("--out", default="synthetic_data", help="Output directory.")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    dashboard = generate_dashboard(args.patients, seed=args.seed)
+    dashboard.to_csv(os.path.join(args.out, "diabetes_dashboard.csv"), index=False)
+    generate_sms_register(dashboard, seed=args.seed).to_csv(os.path.join(args.out, "diabetes_register_sms.csv"), index=False)
+    generate_actioned(dashboard, seed=args.seed).to_csv(os.path.join(args.out, "actioned.csv"), index=False)
+    print(f"Wrote synthetic register of {args.patients} patients to {args.out} - ✅")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+This module contains a lightweight span API for timing the stages of the dashboard pipeline.
+Each span is logged as one JSON line on the "timing" logger and collected per script run, so the
+app can show a timing breakdown of the current rerun in the sidebar.
+
+Usage:
+    with span("csv_read", rows=len(df)):
+        ...
+
+    @timed("plotting")
+    def plot_histograms(...):
+        ...
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+
+logger = logging.getLogger("timing")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(os.environ.get("TIMING_LOG_LEVEL", "INFO"))
+    logger.propagate = False
+
+# Streamlit runs each session's script in its own thread, so spans are collected per thread
+_local = threading.local()
+
+
+def _state():
+    if not hasattr(_local, "spans"):
+        _local.spans = []
+        _local.stack = []
+        _local.run_id = uuid.uuid4().hex[:8]
+    return _local
+
+
+def start_run():
+    """Clears the spans collected so far and starts a new run. Call at the top of each script run."""
+    state = _state()
+    state.spans = []
+    state.stack = []
+    state.run_id = uuid.uuid4().hex[:8]
+    return state.run_id
+
+
+def current_run():
+    """Returns a handle to the current run, which worker threads pass to join_run."""
+    state = _state()
+    return state.run_id, state.spans
+
+
+def join_run(run):
+    """Makes the calling (worker) thread record its spans into a run returned by current_run."""
+    state = _state()
+    state.run_id, state.spans = run
+    state.stack = []
+
+
+def set_span_listener(listener):
+    """
+    Calls listener(record) with every span the calling thread finishes, e.g. to report the progress
+    of a background job. Pass None to stop.
+    """
+    _state().listener = listener
+
+
+def get_spans():
+    """
+    Returns the spans recorded in the current run.
+
+    Returns:
+    - list of dict: One record per finished span with run_id, stage, parent, depth, duration_ms, ok
+      and any extra fields.
+    """
+    return list(_state().spans)
+
+
+class span:
+    """
+    Context manager that times a pipeline stage.
+
+    Parameters:
+    - name (str): The stage name, e.g. "csv_read" or "inference".
+    - **fields: Extra values included in the log record (e.g. rows=1000).
+    """
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        state = _state()
+        self.parent = state.stack[-1] if state.stack else None
+        self.depth = len(state.stack)
+        state.stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self.start) * 1000
+        state = _state()
+        if state.stack and state.stack[-1] == self.name:
+            state.stack.pop()
+
+        record = {
+            "run_id": state.run_id,
+            "stage": self.name,
+            "parent": self.parent,
+            "depth": self.depth,
+            "duration_ms": round(duration_ms, 3),
+            "ok": exc_type is None,
+            **self.fields,
+        }
+        state.spans.append(record)
+        logger.info(json.dumps(record, default=str))
+        listener = getattr(state, "listener", None)
+        if listener is not None:
+            listener(record)
+        return False
+
+
+def timed(name):
+    """Decorator that wraps every call of the function in a span called `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,276 @@
+"""
+This module contains a vectorized evaluator for the fitted GradientBoostingRegressor.
+
+The fitted ensemble is compiled into flat NumPy arrays (feature, threshold, left, right and value
+per node, for all trees concatenated). Prediction evaluates every tree for a batch of patients at
+once: each split is compared once, then the leaves' path conditions are combined one tree level
+at a time, so no Python code runs per patient or per tree. The compiled
+model (optionally with the StandardScaler's parameters) is saved as a small .npz file that loads
+without importing scikit-learn.
+
+Usage:
+    python treeeval.py compile models/gradient_boosting_model_13nov24.joblib \
+        models/gradient_boosting_model_13nov24.npz \
+        --scaler models/scaler_StandardScaler_2024-11-13_17-59-35.pkl
+"""
+
+import argparse
+import pickle
+
+import numpy as np
+
+# Number of patients evaluated per batch, sized so the working arrays stay in the CPU cache
+BATCH_SIZE = 4096
+
+
+class CompiledEnsemble:
+    """
+    Class CompiledEnsemble
+    ----------------------
+    A gradient boosting regressor compiled to flat node arrays.
+
+    Nodes of all trees are concatenated; leaves point to themselves and have their values
+    pre-multiplied by the learning rate. For evaluation, every split is compared once per patient
+    (grouped by feature, so each feature column is read once), then each leaf's path conditions
+    are combined level by level. The leaf reached in each tree is then the one whose conditions
+    all hold, and the prediction is a single matrix-vector product with the leaf values.
+
+    Methods:
+    - from_sklearn: Compiles a fitted GradientBoostingRegressor (and optional StandardScaler).
+    - predict: Predicts for a feature matrix (scaled first if scaler parameters are present).
+    - predict_scaled: Predicts for an already scaled feature matrix.
+    - save / load: Writes or reads the compiled model as a .npz file.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, init_value,
+                 feature_names=None, scaler_mean=None, scaler_scale=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.init_value = float(init_value)
+        self.feature_names = None if feature_names is None else list(feature_names)
+        self.scaler_mean = scaler_mean
+        self.scaler_scale = scaler_scale
+        self._build_plan()
+
+    def _build_plan(self):
+        """Derives the per-split comparison rows and per-leaf path tables used by predict_scaled."""
+        n_nodes = len(self.feature)
+        node_ids = np.arange(n_nodes)
+        is_leaf = self.left == node_ids
+        internal = np.flatnonzero(~is_leaf)
+        leaves = np.flatnonzero(is_leaf)
+
+        # Comparison rows are ordered by feature; the extra last row is always True
+        order = np.argsort(self.feature[internal], kind="stable")
+        self._split_thresholds = self.threshold[internal][order][:, None]
+        split_features = self.feature[internal][order]
+        features, starts, counts = np.unique(split_features, return_index=True, return_counts=True)
+        self._feature_rows = [(int(f), int(s), int(s + c)) for f, s, c in zip(features, starts, counts)]
+        self._always_row = len(internal)
+        row_of_node = np.full(n_nodes, self._always_row)
+        row_of_node[internal[order]] = np.arange(len(internal))
+
+        parent = np.full(n_nodes, -1)
+        parent[self.left[internal]] = internal
+        parent[self.right[internal]] = internal
+        went_left = np.zeros(n_nodes, dtype=bool)
+        went_left[self.left[internal]] = True
+
+        # Path conditions of every leaf, one row per level (leaves above max_depth are padded)
+        depth = max(self.max_depth, 1)
+        path_rows = np.empty((depth, len(leaves)), dtype=np.intp)
+        path_left = np.empty((depth, len(leaves)), dtype=bool)
+        child = leaves.copy()
+        for level in range(depth):
+            up = np.where(child >= 0, parent[np.maximum(child, 0)], -1)
+            has_parent = up >= 0
+            path_rows[level] = np.where(has_parent, row_of_node[np.maximum(up, 0)], self._always_row)
+            path_left[level] = np.where(has_parent, went_left[np.maximum(child, 0)], True)
+            child = up
+
+        # Exactly one leaf per tree is reached, so each tree's last leaf is folded into the base
+        # value and only the others need an indicator row
+        tree_of_leaf = np.searchsorted(self.roots, leaves, side="right") - 1
+        last = np.r_[tree_of_leaf[1:] != tree_of_leaf[:-1], True]
+        leaf_values = self.value[leaves]
+        last_value = np.zeros(len(self.roots))
+        last_value[tree_of_leaf[last]] = leaf_values[last]
+        self._base_value = self.init_value + last_value.sum()
+        self._leaf_values = leaf_values[~last] - last_value[tree_of_leaf[~last]]
+        self._path_rows = path_rows[:, ~last]
+        self._path_left = path_left[:, ~last][:, :, None]
+
+    @classmethod
+    def from_sklearn(cls, model, scaler=None):
+        """
+        Compiles a fitted GradientBoostingRegressor.
+
+        Parameters:
+        - model (GradientBoostingRegressor): The fitted model.
+        - scaler (StandardScaler, optional): Scaler applied to the features before the model.
+
+        Returns:
+        - CompiledEnsemble: The compiled model.
+        """
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_[:, 0]:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append((np.where(is_leaf, node_ids, tree.children_left) + offset).astype(np.int32))
+            rights.append((np.where(is_leaf, node_ids, tree.children_right) + offset).astype(np.int32))
+            values.append(tree.value[:, 0, 0] * model.learning_rate)
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n_nodes
+
+        if model.init_ == "zero":
+            init_value = 0.0
+        else:
+            init_value = float(np.ravel(model.init_.constant_)[0])
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            init_value=init_value,
+            feature_names=getattr(model, "feature_names_in_", None),
+            scaler_mean=None if scaler is None else np.asarray(scaler.mean_, dtype=np.float64),
+            scaler_scale=None if scaler is None else np.asarray(scaler.scale_, dtype=np.float64),
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def scale(self, X):
+        """Applies the stored StandardScaler parameters (a no-op if there are none)."""
+        X = np.asarray(X, dtype=np.float64)
+        if self.scaler_mean is None:
+            return X
+        return (X - self.scaler_mean) / self.scaler_scale
+
+    def predict_scaled(self, X, batch_size=BATCH_SIZE):
+        """
+        Predicts for an already scaled feature matrix.
+
+        Parameters:
+        - X (array-like): Feature matrix of shape (n_patients, n_features).
+        - batch_size (int): Number of patients evaluated at a time.
+
+        Returns:
+        - np.ndarray: The predictions.
+        """
+        # Trees compare float32 features against their thresholds, like scikit-learn does.
+        # Features are laid out one row per feature so each batch reads contiguous memory.
+        X_by_feature = np.asarray(X, dtype=np.float32).T.astype(np.float64, order="C")
+        n_patients = X_by_feature.shape[1]
+        predictions = np.empty(n_patients, dtype=np.float64)
+        comparisons = np.empty((self._always_row + 1, min(batch_size, n_patients)), dtype=bool)
+        comparisons[self._always_row] = True
+
+        for start in range(0, n_patients, batch_size):
+            batch = X_by_feature[:, start:start + batch_size]
+            goes_left = comparisons[:, :batch.shape[1]]
+            for feature, first, end in self._feature_rows:
+                np.less_equal(batch[feature], self._split_thresholds[first:end], out=goes_left[first:end])
+
+            reached = goes_left[self._path_rows[0]] == self._path_left[0]
+            for level in range(1, len(self._path_rows)):
+                reached &= goes_left[self._path_rows[level]] == self._path_left[level]
+            predictions[start:start + batch.shape[1]] = (
+                self._base_value + self._leaf_values @ reached.astype(np.float64)
+            )
+        return predictions
+
+    def predict(self, X, batch_size=BATCH_SIZE):
+        """Scales the features with the stored scaler parameters (if any) and predicts."""
+        return self.predict_scaled(self.scale(X), batch_size=batch_size)
+
+    def save(self, path):
+        """Saves the compiled model as an uncompressed .npz file."""
+        arrays = {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "left": self.left,
+            "right": self.right,
+            "value": self.value,
+            "roots": self.roots,
+            "max_depth": np.int32(self.max_depth),
+            "init_value": np.float64(self.init_value),
+        }
+        if self.feature_names is not None:
+            arrays["feature_names"] = np.asarray(self.feature_names, dtype=str)
+        if self.scaler_mean is not None:
+            arrays["scaler_mean"] = self.scaler_mean
+            arrays["scaler_scale"] = self.scaler_scale
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a compiled model saved with `save`."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                feature=data["feature"],
+                threshold=data["threshold"],
+                left=data["left"],
+                right=data["right"],
+                value=data["value"],
+                roots=data["roots"],
+                max_depth=data["max_depth"],
+                init_value=data["init_value"],
+                feature_names=data["feature_names"].tolist() if "feature_names" in data else None,
+                scaler_mean=data["scaler_mean"] if "scaler_mean" in data else None,
+                scaler_scale=data["scaler_scale"] if "scaler_scale" in data else None,
+            )
+
+
+def compile_model(model_path, output_path, scaler_path=None):
+    """
+    Compiles a joblib-saved GradientBoostingRegressor (and optional pickled scaler) to .npz.
+
+    Returns:
+    - CompiledEnsemble: The compiled model.
+    """
+    import joblib
+
+    model = joblib.load(model_path)
+    scaler = None
+    if scaler_path is not None:
+        with open(scaler_path, "rb") as f:
+            scaler = pickle.load(f)
+    compiled = CompiledEnsemble.from_sklearn(model, scaler=scaler)
+    compiled.save(output_path)
+    return compiled
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a gradient boosting model to flat NumPy arrays.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compile_parser = subparsers.add_parser("compile", help="Compile a joblib model to .npz.")
+    compile_parser.add_argument("model", help="Path of the joblib model.")
+    compile_parser.add_argument("output", help="Path of the .npz file to write.")
+    compile_parser.add_argument("--scaler", default=None, help="Path of the pickled StandardScaler.")
+    args = parser.parse_args()
+
+    compiled = compile_model(args.model, args.output, args.scaler)
+    print(f"Compiled {compiled.n_trees} trees ({len(compiled.feature)} nodes) to {args.output} - ✅")
+
+
+if __name__ == "__main__":
+    main()
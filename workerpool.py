@@ -0,0 +1,146 @@
+"""
+This module contains the worker process used for CPU-heavy loading work.
+
+Dashboard preprocessing is mostly Python-level pandas work that holds the GIL, so running it in
+a thread would stall the network loads running next to it. `run_in_process` runs a function in a
+long-lived worker process instead. The worker is started with "spawn" (forking a multi-threaded
+Streamlit server is unsafe) and warmed up in the background at app start, so its start-up and
+import cost is not paid by the first upload.
+
+`submit_in_process` does the same without waiting, returning a future (used by jobrunner.py).
+
+Set WORKER_PROCESSES=0 to run everything in the calling thread (submitted jobs run in a
+background thread instead).
+"""
+
+import contextlib
+import importlib
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "1"))
+
+# Modules the worker imports while warming up
+WARM_UP_MODULES = ("main",)
+
+_executor = None
+_thread_executor = None
+_warm_up = None
+_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+@contextlib.contextmanager
+def _without_main_module():
+    """
+    Streamlit runs the app script as __main__, and "spawn" re-imports __main__ in the new
+    process, which would run the whole app there. Hide it while the worker is being started.
+    """
+    main_module = sys.modules.get("__main__")
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+
+def _submit(func, *args, **kwargs):
+    # Worker processes are started on submit
+    executor = _pool()
+    with _lock, _without_main_module():
+        return executor.submit(func, *args, **kwargs)
+
+
+def _reset_pool():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _import_modules(names):
+    for name in names:
+        importlib.import_module(name)
+    return os.getpid()
+
+
+def warm_up(modules=WARM_UP_MODULES):
+    """
+    Starts the worker process and imports `modules` in it, without waiting for it.
+    Only the first call does anything, so it can be called on every script run.
+    """
+    global _warm_up
+    if WORKER_PROCESSES <= 0:
+        return None
+    if _warm_up is None:
+        _warm_up = _submit(_import_modules, tuple(modules))
+    return _warm_up
+
+
+def _threads():
+    global _thread_executor
+    with _lock:
+        if _thread_executor is None:
+            _thread_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="job")
+        return _thread_executor
+
+
+def submit_in_process(func, *args, **kwargs):
+    """
+    Starts a function in the worker process and returns without waiting.
+
+    Parameters:
+    - func (callable): A module-level (importable) function.
+    - *args, **kwargs: Its arguments (pickled to the worker).
+
+    Returns:
+    - concurrent.futures.Future: The call's future. With WORKER_PROCESSES=0, or if the worker
+      cannot be started, the function runs in a background thread of this process instead.
+    """
+    if WORKER_PROCESSES > 0:
+        try:
+            return _submit(func, *args, **kwargs)
+        except BrokenProcessPool as e:
+            print(f"⚠️ Worker process unavailable ({type(e).__name__}), running {func.__name__} in a thread")
+            _reset_pool()
+    return _threads().submit(func, *args, **kwargs)
+
+
+def run_in_process(func, *args, **kwargs):
+    """
+    Runs a function in the worker process and returns its result.
+
+    Parameters:
+    - func (callable): A module-level (importable) function.
+    - *args, **kwargs: Its arguments; they and the result are pickled between processes.
+
+    Returns:
+    - The function's return value. Exceptions raised by the function are re-raised here.
+      If the worker cannot be used (it crashed, or the arguments can't be pickled), the function
+      runs in the calling thread instead.
+    """
+    if WORKER_PROCESSES <= 0:
+        return func(*args, **kwargs)
+    try:
+        return _submit(func, *args, **kwargs).result()
+    except (BrokenProcessPool, pickle.PicklingError) as e:
+        print(f"⚠️ Worker process unavailable ({type(e).__name__}), running {func.__name__} in-process")
+        if isinstance(e, BrokenProcessPool):
+            _reset_pool()
+        return func(*args, **kwargs)